@@ -0,0 +1,356 @@
+# Delaunay三角网边长约束过滤的公共函数，供triangle_net_single.py、triangle_net_iteration.py等脚本调用
+# 计算部分不依赖matplotlib，可在无图形界面的环境中运行和计时
+import time
+
+import pandas as pd
+import numpy as np
+import shapely
+from scipy import sparse
+from scipy.sparse import csgraph
+from scipy.spatial import Delaunay, QhullError, cKDTree
+
+
+def load_points(filename):
+    """
+    读取poi文件中的poi_id和centroid列，返回poi_id数组和(n, 2)的坐标数组。
+    """
+    df = pd.read_csv(filename, usecols=['poi_id', 'centroid'])
+    centroids = df['centroid'].str.extract(r'POINT \((.*) (.*)\)')
+    points = np.array(centroids.values.tolist(), dtype=float).reshape(-1, 2)
+    return df['poi_id'].to_numpy(), points
+
+
+def normalize_points(points):
+    # 归一化处理，使得x和y坐标都在[0, 1]区间内
+    x_range = points[:, 0].max() - points[:, 0].min()
+    y_range = points[:, 1].max() - points[:, 1].min()
+    return (points - points.min(axis=0)) / np.array([x_range, y_range])
+
+
+def get_edge_lengths(points, simplices):
+    """
+    一次性计算所有三角形三条边的长度，返回(m, 3)数组，第i列为顶点i到顶点(i + 1) % 3的边。
+    """
+    vertices = points[simplices]
+    return np.linalg.norm(vertices - np.roll(vertices, -1, axis=1), axis=2)
+
+
+def get_local_scale(points, k=6):
+    """
+    自适应模式下每个点的局部尺度：到第k个最近邻点的距离。只建立一次cKDTree并批量查询所有点，O(n log n)。
+    """
+    k = min(k, len(points) - 1)
+    if k < 1:
+        return np.zeros(len(points))
+    distances, _ = cKDTree(points).query(points, k=k + 1)
+    return distances[:, k]
+
+
+def get_edge_thresholds(simplices, local_scale, scale_factor=1.0, constraint_distance=None):
+    """
+    自适应模式下每条边的约束距离：两端点局部尺度的平均值乘以scale_factor，返回与get_edge_lengths对应的(m, 3)数组。
+    constraint_distance不为None时作为所有边的上限。
+    """
+    scales = local_scale[simplices]
+    thresholds = (scales + np.roll(scales, -1, axis=1)) / 2 * scale_factor
+    if constraint_distance is not None:
+        thresholds = np.minimum(thresholds, constraint_distance)
+    return thresholds
+
+
+def get_valid_simplex_mask(points, simplices, constraint_distance, local_scale=None, scale_factor=1.0):
+    """
+    三条边都不超过constraint_distance的三角形为有效三角形，返回长度为m的布尔数组。
+    给定local_scale（见get_local_scale）时为自适应模式，每条边的约束距离由get_edge_thresholds计算，
+    constraint_distance为上限（None时不设上限）。
+    """
+    if local_scale is not None:
+        constraint_distance = get_edge_thresholds(simplices, local_scale, scale_factor, constraint_distance)
+    return (get_edge_lengths(points, simplices) <= constraint_distance).all(axis=1)
+
+
+class TriangleRound:
+    """
+    一轮过滤的结果，simplices和point_index中的序号均为原始点集中的序号，可直接对应poi_id。
+    """
+    def __init__(self, round_no, simplices, point_index, cluster_labels, number_of_points, elapsed):
+        self.round_no = round_no
+        self.simplices = simplices  # 本轮满足约束条件的三角形
+        self.point_index = point_index  # 本轮被有效三角形覆盖的点
+        # 本轮有效三角形的连通分量，长度为原始点数，不是本轮覆盖的点为-1，编号规则同get_cluster_labels
+        self.cluster_labels = cluster_labels
+        self.number_of_clusters = int(cluster_labels.max()) + 1 if len(cluster_labels) else 0
+        self.number_of_points = number_of_points  # 本轮参与三角剖分的点数
+        self.elapsed = elapsed  # 本轮耗时（秒）
+
+
+def _get_edge_keys(points_count, simplices):
+    # 第j条边为顶点j的对边，键为两端点序号（小的在前）组成的整数
+    a, b = simplices[:, [1, 2, 0]], simplices[:, [2, 0, 1]]
+    return np.minimum(a, b) * points_count + np.maximum(a, b)
+
+
+def _get_side(points, a, b, c):
+    # 点c在有向边(min(a, b), max(a, b))的哪一侧
+    lo, hi = np.minimum(a, b), np.maximum(a, b)
+    d1, d2 = points[hi] - points[lo], points[c] - points[lo]
+    return np.sign(d1[:, 0] * d2[:, 1] - d1[:, 1] * d2[:, 0])
+
+
+def _triangulate(points, point_index, hidden_vertex):
+    """
+    返回point_index中的点的Delaunay三角形（原始序号），点数不足或共线时为空。
+    与其他点重合而未参与三角剖分的点记录在hidden_vertex中（值为与之重合的顶点序号）。
+    """
+    if len(point_index) < 3:
+        return np.zeros((0, 3), dtype=np.int64), None
+    try:
+        tri = Delaunay(points[point_index])
+    except QhullError:
+        return np.zeros((0, 3), dtype=np.int64), None
+    hidden_vertex[point_index[tri.coplanar[:, 0]]] = point_index[tri.coplanar[:, 2]]
+    return point_index[tri.simplices], tri
+
+
+def _retriangulate_cavity(points, simplices, removed_mask, accepted_mask, hidden_vertex):
+    """
+    删除accepted_mask中的点后，只对被删除三角形构成的空洞重新三角剖分，返回填充空洞的新三角形。
+    删除点不会破坏其余三角形的空外接圆性质，这些三角形保持不变；空洞的新三角形取空洞边界点的Delaunay三角网中
+    位于空洞内的部分：以空洞边界边为界划分连通分量，与边界边内侧三角形连通的即为空洞内的三角形。
+    与被删除顶点重合的点此时重新参与三角剖分。
+    """
+    removed = simplices[removed_mask]
+    hidden_index = np.flatnonzero(hidden_vertex >= 0)
+    released_index = hidden_index[accepted_mask[hidden_vertex[hidden_index]] & ~accepted_mask[hidden_index]]
+    hidden_vertex[released_index] = -1
+    affected_index = np.unique(np.concatenate([removed.ravel(), released_index]))
+    affected_index = affected_index[~accepted_mask[affected_index]]
+    new_simplices, tri = _triangulate(points, affected_index, hidden_vertex)
+    if len(new_simplices) == 0 or removed_mask.all():
+        return new_simplices
+
+    # 空洞边界边：只属于一个被删除三角形且两端点都保留的边，记录被删除三角形的第三个顶点所在的一侧
+    points_count = len(points)
+    edge_keys = _get_edge_keys(points_count, removed).ravel()
+    edge_a, edge_b = removed[:, [1, 2, 0]].ravel(), removed[:, [2, 0, 1]].ravel()
+    _, inverse, counts = np.unique(edge_keys, return_inverse=True, return_counts=True)
+    is_boundary = (counts[inverse] == 1) & ~accepted_mask[edge_a] & ~accepted_mask[edge_b]
+    boundary_order = np.argsort(edge_keys[is_boundary])
+    boundary_keys = edge_keys[is_boundary][boundary_order]
+    boundary_sides = _get_side(points, edge_a[is_boundary], edge_b[is_boundary],
+                               removed.ravel()[is_boundary])[boundary_order]
+
+    # 新三角网中不跨越边界边的相邻三角形连通
+    new_keys = _get_edge_keys(points_count, new_simplices).ravel()
+    pos = np.minimum(np.searchsorted(boundary_keys, new_keys), max(len(boundary_keys) - 1, 0))
+    on_boundary = (boundary_keys[pos] == new_keys) if len(boundary_keys) else np.zeros(len(new_keys), dtype=bool)
+    triangle_no = np.repeat(np.arange(len(new_simplices)), 3)
+    neighbor_no = tri.neighbors.ravel()
+    connected = (neighbor_no >= 0) & ~on_boundary
+    graph = sparse.coo_matrix((np.ones(connected.sum()), (triangle_no[connected], neighbor_no[connected])),
+                              shape=(len(new_simplices), len(new_simplices)))
+    _, labels = csgraph.connected_components(graph, directed=False)
+
+    # 与被删除三角形位于边界边同一侧的新三角形在空洞内
+    new_a, new_b = new_simplices[:, [1, 2, 0]].ravel(), new_simplices[:, [2, 0, 1]].ravel()
+    inside = on_boundary & (_get_side(points, new_a, new_b, new_simplices.ravel()) == boundary_sides[pos])
+    return new_simplices[np.isin(labels, labels[triangle_no[inside]])]
+
+
+def iterate_triangle_filter(points, constraint_distance, num_iterations, local_scale=None, scale_factor=1.0):
+    """
+    多轮过滤：每轮在上一轮未被有效三角形覆盖的点的Delaunay三角网中保留满足约束条件的三角形。
+    第一轮之后不再重新建立整个三角网，只对删除本轮覆盖的点后留下的空洞重新三角剖分，
+    未变化的三角形在上一轮已判断为无效，每轮只需检查空洞中的新三角形。
+    三角形以原始点集中的序号表示，可直接对应poi_id。
+    返回(每轮的TriangleRound列表, 每个点被覆盖的轮次数组)，轮次从1开始，始终未被覆盖的点为0。
+    与三角网顶点重合而未参与三角剖分的点与该顶点在同一轮被覆盖。每轮的聚类标签见TriangleRound.cluster_labels。
+    某轮没有有效三角形时提前结束。
+    local_scale和scale_factor为自适应模式的参数，含义同get_valid_simplex_mask，局部尺度由原始点集计算一次，各轮不变。
+    第一轮的耗时包括对全部点建立Delaunay三角网。
+    """
+    round_labels = np.zeros(len(points), dtype=np.int64)
+    round_list = []
+    hidden_vertex = np.full(len(points), -1, dtype=np.int64)
+    start_time = time.time()
+    simplices, _ = _triangulate(points, np.arange(len(points)), hidden_vertex)
+    new_simplices = simplices
+    for round_no in range(1, num_iterations + 1):
+        number_of_points = int((round_labels == 0).sum())
+        valid_simplices = new_simplices[get_valid_simplex_mask(points, new_simplices, constraint_distance,
+                                                               local_scale, scale_factor)]
+        if len(valid_simplices) == 0:
+            break
+        point_index = np.unique(valid_simplices)
+        round_labels[point_index] = round_no
+        # 与本轮覆盖的顶点重合而未参与三角剖分的点随该顶点一起被覆盖，与sweep_thresholds的处理一致
+        hidden_index = np.flatnonzero((hidden_vertex >= 0) & (round_labels == 0))
+        hidden_index = hidden_index[round_labels[hidden_vertex[hidden_index]] == round_no]
+        round_labels[hidden_index] = round_no
+        point_index = np.union1d(point_index, hidden_index)
+        cluster_labels = get_cluster_labels(len(points), valid_simplices)
+        cluster_labels[hidden_index] = cluster_labels[hidden_vertex[hidden_index]]
+        cluster_labels = _rank_labels(cluster_labels)
+
+        accepted_mask = round_labels > 0
+        removed_mask = accepted_mask[simplices].any(axis=1)
+        new_simplices = _retriangulate_cavity(points, simplices, removed_mask, accepted_mask, hidden_vertex)
+        simplices = np.concatenate([simplices[~removed_mask], new_simplices])
+        round_list.append(TriangleRound(round_no, valid_simplices, point_index, cluster_labels, number_of_points,
+                                        time.time() - start_time))
+        start_time = time.time()
+    return round_list, round_labels
+
+
+def _rank_labels(labels):
+    # 聚类按首个点的序号依次编号，未被覆盖的点保持-1
+    covered = labels >= 0
+    _, first_index, inverse = np.unique(labels[covered], return_index=True, return_inverse=True)
+    rank = np.empty(len(first_index), dtype=np.int64)
+    rank[np.argsort(first_index)] = np.arange(len(first_index))
+    ranked_labels = np.full(len(labels), -1, dtype=np.int64)
+    ranked_labels[covered] = rank[inverse]
+    return ranked_labels
+
+
+def get_cluster_labels(points_count, valid_simplices, coplanar=None):
+    """
+    由有效三角形的边建立稀疏图，用连通分量得到每个点的聚类标签。
+    未被有效三角形覆盖的点为-1（与DBSCAN的噪声标签一致），聚类按首个点的序号依次编号，与sweep_thresholds一致。
+    coplanar为Delaunay.coplanar，与三角网顶点重合而未参与三角剖分的点取最近顶点的标签。
+    """
+    labels = np.full(points_count, -1, dtype=np.int64)
+    if len(valid_simplices) == 0:
+        return labels
+    edges = np.concatenate([valid_simplices[:, [0, 1]], valid_simplices[:, [1, 2]]])
+    graph = sparse.coo_matrix((np.ones(len(edges)), (edges[:, 0], edges[:, 1])), shape=(points_count, points_count))
+    _, component_labels = csgraph.connected_components(graph, directed=False)
+    covered = np.zeros(points_count, dtype=bool)
+    covered[valid_simplices.ravel()] = True
+    labels[covered] = component_labels[covered]
+    if coplanar is not None and len(coplanar):
+        labels[coplanar[:, 0]] = labels[coplanar[:, 2]]
+    return _rank_labels(labels)
+
+
+def get_cluster_stats(points, labels):
+    """
+    按聚类统计点数、凸包面积和质心，points为经纬度坐标。
+    坐标以各聚类质心为原点换算为米（等距圆柱投影），shapely.multipoints按聚类一次生成点集后批量求凸包，
+    hull_area单位为平方米，共线的聚类为0。
+    返回以cluster_id为行的DataFrame，不包括未被覆盖的点。
+    """
+    covered = labels >= 0
+    number_of_clusters = int(labels.max()) + 1 if covered.any() else 0
+    size = np.bincount(labels[covered], minlength=number_of_clusters)
+    centroid_x = np.bincount(labels[covered], weights=points[covered, 0], minlength=number_of_clusters) / size
+    centroid_y = np.bincount(labels[covered], weights=points[covered, 1], minlength=number_of_clusters) / size
+
+    order = np.flatnonzero(covered)[np.argsort(labels[covered], kind='stable')]
+    cluster_no = labels[order]
+    meters_per_degree = 111319.49
+    points_xy = np.column_stack([
+        (points[order, 0] - centroid_x[cluster_no]) * np.cos(np.radians(centroid_y[cluster_no])) * meters_per_degree,
+        (points[order, 1] - centroid_y[cluster_no]) * meters_per_degree])
+    hulls = shapely.convex_hull(shapely.multipoints(points_xy, indices=cluster_no))
+    hull_area = shapely.area(hulls) if number_of_clusters else np.zeros(0)
+    return pd.DataFrame({'cluster_id': np.arange(number_of_clusters), 'size': size, 'hull_area': np.round(hull_area, 1),
+                         'centroid_x': np.round(centroid_x, 7), 'centroid_y': np.round(centroid_y, 7)})
+
+
+def _compress_labels(parent):
+    # 指针跳跃得到每个点所在集合的根
+    parent = np.asarray(parent, dtype=np.int64)
+    while True:
+        root = parent[parent]
+        if np.array_equal(root, parent):
+            return root
+        parent = root
+
+
+def sweep_thresholds(points, simplices, thresholds, return_labels=True, coplanar=None):
+    """
+    一次计算多个constraint_distance下的过滤结果。三角形按最长边排序后依次加入并查集，
+    阈值从小到大依次截取，整体为O(m log m)，不必对每个阈值重新过滤。
+    同一阈值下由有效三角形相连的点为一个聚类，与get_valid_simplex_mask的结果一致。
+    返回(统计表, 标签数组)：统计表每行对应一个阈值，包括有效三角形数、聚类数、被覆盖的点数及比例、最大聚类的点数；
+    标签数组形状为(阈值数, 点数)，未被有效三角形覆盖的点为-1，聚类按首个点的序号依次编号。
+    只需要统计表时return_labels设为False，不再为每个阈值生成标签，标签数组为None。
+    coplanar为Delaunay.coplanar，与三角网顶点重合而未参与三角剖分的点随最近的顶点一起被覆盖、计入同一聚类。
+    """
+    thresholds = np.asarray(thresholds, dtype=float)
+    max_lengths = get_edge_lengths(points, simplices).max(axis=1)
+    order = np.argsort(max_lengths, kind='stable')
+    threshold_order = np.argsort(thresholds, kind='stable')
+    bounds = np.searchsorted(max_lengths[order], thresholds[threshold_order], side='right')
+
+    # 重合的点计入最近顶点的权重
+    weight = np.ones(len(points), dtype=np.int64)
+    if coplanar is not None and len(coplanar):
+        np.add.at(weight, coplanar[:, 2], 1)
+    parent = list(range(len(points)))
+    size = weight.tolist()
+    covered = np.zeros(len(points), dtype=bool)
+    sorted_simplices = simplices[order].tolist()
+    labels = np.full((len(thresholds), len(points)), -1, dtype=np.int64) if return_labels else None
+    stat_list = [None] * len(thresholds)
+    number_of_clusters = 0
+    number_of_covered = 0
+    largest_cluster = 0
+    triangle_no = 0
+    for threshold_no, bound in zip(threshold_order.tolist(), bounds.tolist()):
+        for simplex in sorted_simplices[triangle_no:bound]:
+            for vertex in simplex:
+                if not covered[vertex]:
+                    covered[vertex] = True
+                    number_of_covered += size[vertex]
+                    number_of_clusters += 1
+                    largest_cluster = max(largest_cluster, size[vertex])
+            root_a = simplex[0]
+            while parent[root_a] != root_a:
+                parent[root_a] = parent[parent[root_a]]
+                root_a = parent[root_a]
+            for vertex in simplex[1:]:
+                root_b = vertex
+                while parent[root_b] != root_b:
+                    parent[root_b] = parent[parent[root_b]]
+                    root_b = parent[root_b]
+                if root_a != root_b:
+                    # 按大小合并，较小的集合挂到较大的集合下
+                    if size[root_a] < size[root_b]:
+                        root_a, root_b = root_b, root_a
+                    parent[root_b] = root_a
+                    size[root_a] += size[root_b]
+                    largest_cluster = max(largest_cluster, size[root_a])
+                    number_of_clusters -= 1
+        triangle_no = max(triangle_no, bound)
+
+        if return_labels:
+            roots = np.where(covered, _compress_labels(parent), -1)
+            if coplanar is not None and len(coplanar):
+                roots[coplanar[:, 0]] = roots[coplanar[:, 2]]
+            labels[threshold_no] = _rank_labels(roots)
+        stat_list[threshold_no] = {
+            'constraint_distance': thresholds[threshold_no],
+            'valid_simplices': bound,
+            'clusters': number_of_clusters,
+            'covered_points': number_of_covered,
+            'coverage': number_of_covered / len(points) if len(points) else 0.0,
+            'largest_cluster': largest_cluster,
+        }
+    return pd.DataFrame(stat_list), labels
+
+
+def plot_triangles(points, simplices, title, color='b-', linewidth=0.1, point_size=0.05, point_mask=None):
+    # 只在需要绘图时导入matplotlib
+    import matplotlib.pyplot as plt
+
+    scatter_points = points if point_mask is None else points[point_mask]
+    plt.figure(figsize=(8, 8))
+    if len(simplices) > 0:
+        plt.triplot(points[:, 0], points[:, 1], simplices, color, linewidth=linewidth)
+    plt.scatter(scatter_points[:, 0], scatter_points[:, 1], c='k', s=point_size, edgecolors='none')
+    plt.title(title)
+    plt.xlabel('Normalized X coordinate')
+    plt.ylabel('Normalized Y coordinate')
+    plt.show()
@@ -1,89 +1,60 @@
-import pandas as pd
-import numpy as np
-from scipy.spatial import Delaunay
-import matplotlib.pyplot as plt
+import argparse
+import time
 
-# 读取CSV文件，并选择需要的列
-df = pd.read_csv('poi.csv', usecols=['poi_id', 'centroid'])
+import numpy as np
+import pandas as pd
 
-# 提取poi_id列
-poi_ids = df['poi_id']
+from triangle_filter import load_points, normalize_points, iterate_triangle_filter, plot_triangles, \
+    get_local_scale
 
-# 提取centroid列并解析坐标
-centroids = df['centroid'].str.extract(r'POINT \((.*) (.*)\)')
-points = np.array(centroids.values.tolist(), dtype=float).reshape(-1, 2)
+parser = argparse.ArgumentParser(description='多次迭代的Delaunay三角网边长约束过滤')
+parser.add_argument('--input', default='poi.csv', help='poi文件')
+parser.add_argument('--constraint-distance', type=float, help='归一化坐标下的最大边长，默认0.0015；自适应模式下为上限，默认不设上限')
+parser.add_argument('--knn', type=int, help='自适应模式：每条边的约束距离取两端点到第k个最近邻点的平均距离乘以--scale-factor')
+parser.add_argument('--scale-factor', type=float, default=1.0, help='自适应模式下局部尺度的倍数')
+parser.add_argument('--iterations', type=int, default=3, help='迭代次数')
+parser.add_argument('--output', help='输出每个poi被覆盖的轮次和该轮的聚类标签（poi_id,round,cluster_id，0轮和-1为未被覆盖）')
+parser.add_argument('--plot', action='store_true', help='绘制每轮的三角网')
+args = parser.parse_args()
 
-# 计算x和y坐标的范围
-x_range = points[:, 0].max() - points[:, 0].min()
-y_range = points[:, 1].max() - points[:, 1].min()
+# 读取poi_id和质心坐标
+poi_ids, points = load_points(args.input)
 
 # 归一化处理，使得x和y坐标都在[0, 1]区间内
-points_normalized = (points - points.min(axis=0)) / np.array([x_range, y_range])
-
-
-# 设置基本约束条件和循环次数
-# base_constraint_distance = 0.0015
-constraint_distance = 0.0015
-num_iterations = 3
-
-# 初始化无效三角形的顶点
-current_points = points_normalized
-
-for iteration in range(num_iterations):
-
-    # 根据迭代次数更新约束距离
-    # constraint_distance = base_constraint_distance * (iteration / 5 + 1)
-
-    # 使用当前的点建立无约束的Delaunay三角网
-    current_tri = Delaunay(current_points)
-
-    # 初始化invalid_point_mask为True
-    invalid_point_mask = np.ones(current_points.shape[0], dtype=bool)
-    valid_point_mask = np.zeros(current_points.shape[0], dtype=bool)
-
-    # 计算每个三角形的边长，并检查是否满足约束条件
-    valid_simplices = []
-    for simplex in current_tri.simplices:
-        valid_triangle = True
-        for j in range(3):
-            p1 = current_points[simplex[j]]
-            p2 = current_points[simplex[(j + 1) % 3]]
-            if np.linalg.norm(p1 - p2) > constraint_distance:
-                valid_triangle = False
-                break
-        if valid_triangle:
-            valid_simplices.append(simplex)
-            print(simplex)
-            # 将有效三角形的顶点在invalid_point_mask中标记为False
-            invalid_point_mask[simplex] = False
-            valid_point_mask[simplex] = True
-
-    # 当前迭代没有有效的三角形时，退出循环
-    if len(valid_simplices) == 0:
-        print(f"No valid simplices in iteration {iteration+1}")
-        break
-
-    # 提取当前迭代的满足约束条件的顶点到valid_points
-    valid_points_indices = np.where(valid_point_mask)[0]
-    valid_points = current_points[valid_points_indices]
-    print(len(valid_points))
-
-    # 绘制当前迭代的满足约束条件的三角网
-    plt.figure(figsize=(8, 8))
-    plt.triplot(current_points[:, 0], current_points[:, 1], valid_simplices, 'r-', linewidth=0.05)
-    scatter = plt.scatter(valid_points[:, 0], valid_points[:, 1], c='k', s=0.02, edgecolors='none')  # 修改点的大小
-    plt.title(f'Constrained Delaunay Triangulation - Iteration {iteration+1}')
-    plt.xlabel('Normalized X coordinate')
-    plt.ylabel('Normalized Y coordinate')
-    plt.show()
-
-    # 更新当前的点集为无效三角形的顶点
-    invalid_points_indices = np.where(invalid_point_mask)[0]
-    print(f"Invalid points indices: {invalid_points_indices}")
-    # 此时currnet_points中的点为本轮迭代的散点集
-    current_points = current_points[invalid_points_indices]
-    print(len(current_points))
-
-    # 如果无效点集为空，则退出循环
-    if len(current_points) == 0:
-        break
\ No newline at end of file
+points_normalized = normalize_points(points)
+
+# 自适应模式下由局部点密度计算每个点的尺度，否则所有边使用同一约束距离
+local_scale = None
+if args.knn:
+    start_time = time.time()
+    local_scale = get_local_scale(points_normalized, args.knn)
+    print(f'第{args.knn}近邻距离：中位数{np.median(local_scale):.6f}，耗时{time.time() - start_time:.3f} s')
+elif args.constraint_distance is None:
+    args.constraint_distance = 0.0015
+
+# 每轮只对上一轮剩余的点所在的空洞重新三角剖分，三角形中的序号始终对应原始poi
+start_time = time.time()
+round_list, round_labels = iterate_triangle_filter(points_normalized, args.constraint_distance, args.iterations,
+                                                    local_scale, args.scale_factor)
+for triangle_round in round_list:
+    print(f'Iteration {triangle_round.round_no}: {triangle_round.number_of_points} points, '
+          f'{len(triangle_round.simplices)} valid simplices, {len(triangle_round.point_index)} valid points, '
+          f'{triangle_round.number_of_clusters} clusters, '
+          f'{triangle_round.elapsed:.3f} s')
+if len(round_list) < args.iterations:
+    print(f'No valid simplices in iteration {len(round_list) + 1}')
+print(f'总耗时{time.time() - start_time:.3f} s，未被覆盖的点：{(round_labels == 0).sum()}个')
+
+if args.output:
+    # 聚类标签在每轮内编号，(round, cluster_id)确定一个聚类
+    cluster_ids = np.full(len(points), -1, dtype=np.int64)
+    for triangle_round in round_list:
+        cluster_ids[triangle_round.point_index] = triangle_round.cluster_labels[triangle_round.point_index]
+    pd.DataFrame({'poi_id': poi_ids, 'round': round_labels, 'cluster_id': cluster_ids}).to_csv(args.output, index=False)
+
+# 绘制每轮满足约束条件的三角网
+if args.plot:
+    for triangle_round in round_list:
+        plot_triangles(points_normalized, triangle_round.simplices,
+                       f'Constrained Delaunay Triangulation - Iteration {triangle_round.round_no}',
+                       color='r-', linewidth=0.05, point_size=0.02, point_mask=triangle_round.point_index)
@@ -1,58 +1,66 @@
-import pandas as pd
+import argparse
+import time
+
 import numpy as np
+import pandas as pd
 from scipy.spatial import Delaunay
-import matplotlib.pyplot as plt
-
-# 读取CSV文件，并选择需要的列
-df = pd.read_csv('poi.csv', usecols=['poi_id', 'centroid'])
 
-# 提取poi_id列
-poi_ids = df['poi_id']
+from triangle_filter import load_points, normalize_points, get_valid_simplex_mask, plot_triangles, \
+    get_cluster_labels, get_cluster_stats, get_local_scale
 
-# 提取centroid列并解析坐标
-centroids = df['centroid'].str.extract(r'POINT \((.*) (.*)\)')
-points = np.array(centroids.values.tolist(), dtype=float).reshape(-1, 2)
+parser = argparse.ArgumentParser(description='单次Delaunay三角网边长约束过滤')
+parser.add_argument('--input', default='poi.csv', help='poi文件')
+parser.add_argument('--constraint-distance', type=float, help='归一化坐标下的最大边长，默认0.0015；自适应模式下为上限，默认不设上限')
+parser.add_argument('--knn', type=int, help='自适应模式：每条边的约束距离取两端点到第k个最近邻点的平均距离乘以--scale-factor')
+parser.add_argument('--scale-factor', type=float, default=1.0, help='自适应模式下局部尺度的倍数')
+parser.add_argument('--plot', action='store_true', help='绘制三角网（默认只计算并输出耗时）')
+parser.add_argument('--output', help='输出每个poi的聚类标签（poi_id,cluster_id，-1为未被覆盖）')
+parser.add_argument('--cluster-output', help='输出每个聚类的点数、凸包面积（平方米）和质心')
+args = parser.parse_args()
 
-# 计算x和y坐标的范围
-x_range = points[:, 0].max() - points[:, 0].min()
-y_range = points[:, 1].max() - points[:, 1].min()
+# 读取poi_id和质心坐标
+poi_ids, points = load_points(args.input)
 
 # 归一化处理，使得x和y坐标都在[0, 1]区间内
-points_normalized = (points - points.min(axis=0)) / np.array([x_range, y_range])
+points_normalized = normalize_points(points)
+
+# 自适应模式下由局部点密度计算每个点的尺度，否则所有边使用同一约束距离
+local_scale = None
+if args.knn:
+    start_time = time.time()
+    local_scale = get_local_scale(points_normalized, args.knn)
+    print(f'第{args.knn}近邻距离：中位数{np.median(local_scale):.6f}，耗时{time.time() - start_time:.3f} s')
+elif args.constraint_distance is None:
+    args.constraint_distance = 0.0015
 
 # 使用归一化后的坐标建立Delaunay三角网
+start_time = time.time()
 tri = Delaunay(points_normalized)
+print(f'Delaunay三角网：{len(tri.simplices)}个三角形，耗时{time.time() - start_time:.3f} s')
 
 # 绘制归一化后的Delaunay三角网
-plt.figure(figsize=(8, 8))
-plt.triplot(points_normalized[:, 0], points_normalized[:, 1], tri.simplices, 'b-', linewidth=0.1)
-plt.plot(points_normalized[:, 0], points_normalized[:, 1], 'ko', markersize=0.1)  # 修改点的大小
-plt.title('Delaunay Triangulation with Normalized Coordinates')
-plt.xlabel('Normalized X coordinate')
-plt.ylabel('Normalized Y coordinate')
-plt.show()
-
-# # 设置约束条件
-constraint_distance = 0.0015
-
-# 计算每个三角形的边长，并检查是否满足约束条件
-valid_simplices = []
-for simplex in tri.simplices:
-    valid_triangle = True
-    for i in range(3):
-        p1 = points_normalized[simplex[i]]
-        p2 = points_normalized[simplex[(i + 1) % 3]]
-        if np.linalg.norm(p1 - p2) > constraint_distance:
-            valid_triangle = False
-            break
-    if valid_triangle:
-        valid_simplices.append(simplex)
+if args.plot:
+    plot_triangles(points_normalized, tri.simplices, 'Delaunay Triangulation with Normalized Coordinates',
+                   point_size=0.1)
+
+# 一次性计算所有三角形的边长，并检查是否满足约束条件
+start_time = time.time()
+valid_mask = get_valid_simplex_mask(points_normalized, tri.simplices, args.constraint_distance,
+                                    local_scale, args.scale_factor)
+valid_simplices = tri.simplices[valid_mask]
+print(f'满足约束条件的三角形：{len(valid_simplices)}个，耗时{time.time() - start_time:.3f} s')
+
+# 有效三角形的边组成的连通分量即为poi聚类
+if args.output or args.cluster_output:
+    start_time = time.time()
+    labels = get_cluster_labels(len(points), valid_simplices, tri.coplanar)
+    cluster_stats = get_cluster_stats(points, labels)
+    print(f'聚类：{len(cluster_stats)}个，未被覆盖的点：{(labels < 0).sum()}个，耗时{time.time() - start_time:.3f} s')
+    if args.output:
+        pd.DataFrame({'poi_id': poi_ids, 'cluster_id': labels}).to_csv(args.output, index=False)
+    if args.cluster_output:
+        cluster_stats.to_csv(args.cluster_output, index=False)
 
 # 绘制满足约束条件的三角网
-plt.figure(figsize=(8, 8))
-plt.triplot(points_normalized[:, 0], points_normalized[:, 1], valid_simplices, 'b-', linewidth=0.1)
-scatter = plt.scatter(points_normalized[:, 0], points_normalized[:, 1], c='k', s=0.05, edgecolors='none')  # 修改点的大小
-plt.title('Constrained Delaunay Triangulation with Normalized Data')
-plt.xlabel('Normalized X coordinate')
-plt.ylabel('Normalized Y coordinate')
-plt.show()
\ No newline at end of file
+if args.plot:
+    plot_triangles(points_normalized, valid_simplices, 'Constrained Delaunay Triangulation with Normalized Data')
@@ -0,0 +1,43 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import Delaunay
+
+from triangle_filter import load_points, normalize_points, sweep_thresholds
+
+parser = argparse.ArgumentParser(description='一次计算多个约束距离下的三角网聚类结果，用于选择constraint_distance')
+parser.add_argument('--input', default='poi.csv', help='poi文件')
+parser.add_argument('--thresholds', help='以逗号分隔的约束距离，如0.001,0.0015,0.002')
+parser.add_argument('--start', type=float, default=0.0005, help='未指定--thresholds时约束距离的起始值')
+parser.add_argument('--stop', type=float, default=0.005, help='未指定--thresholds时约束距离的终止值')
+parser.add_argument('--num', type=int, default=50, help='未指定--thresholds时约束距离的个数')
+parser.add_argument('--output', default='threshold_sweep.csv', help='各约束距离的统计结果')
+parser.add_argument('--labels-output', help='输出每个poi在各约束距离下的聚类标签（-1为未被覆盖）')
+args = parser.parse_args()
+
+if args.thresholds:
+    thresholds = np.array([float(value) for value in args.thresholds.split(',')])
+else:
+    thresholds = np.linspace(args.start, args.stop, args.num)
+
+# 读取poi_id和质心坐标，归一化后建立Delaunay三角网
+poi_ids, points = load_points(args.input)
+points_normalized = normalize_points(points)
+start_time = time.time()
+tri = Delaunay(points_normalized)
+print(f'Delaunay三角网：{len(tri.simplices)}个三角形，耗时{time.time() - start_time:.3f} s')
+
+# 三角形按最长边排序后一次扫描所有约束距离
+start_time = time.time()
+stats, labels = sweep_thresholds(points_normalized, tri.simplices, thresholds,
+                                 return_labels=args.labels_output is not None, coplanar=tri.coplanar)
+print(f'{len(thresholds)}个约束距离，耗时{time.time() - start_time:.3f} s')
+print(stats.to_string(index=False))
+stats.to_csv(args.output, index=False)
+
+if args.labels_output:
+    label_df = pd.DataFrame(labels.T, columns=[f'{threshold:g}' for threshold in thresholds])
+    label_df.insert(0, 'poi_id', poi_ids)
+    label_df.to_csv(args.labels_output, index=False)
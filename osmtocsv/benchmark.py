@@ -0,0 +1,95 @@
+# 性能测试脚本，用法：python benchmark.py osm_data/Beijing.osm
+import gc
+import sys
+import time
+import tracemalloc
+
+from get_from_osm import get_osm_network
+from osmclasses import NodeInOsm, WayInOsm, RelationInOsm
+from process_geo_information import GeoTransformer
+from shapely import geometry
+import numpy as np
+
+
+def measure(func, *args, **kwargs):
+    # 返回函数结果、耗时(s)和Python内存峰值(MB)
+    gc.collect()
+    tracemalloc.start()
+    start_time = time.time()
+    result = func(*args, **kwargs)
+    elapsed = time.time() - start_time
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+
+def _make_objects(cls, number_of_objects):
+    if cls.__name__.startswith('NodeInOsm'):
+        return [cls('', str(i), None, i, None, None) for i in range(number_of_objects)]
+    return [cls() for _ in range(number_of_objects)]
+
+
+def bench_object_memory(number_of_objects=100000):
+    print('osm数据类单个对象的内存占用（字节）')
+    for cls in (NodeInOsm, WayInOsm, RelationInOsm):
+        # 复用同一个__init__但不带__slots__，即改动前的实现
+        dict_cls = type(cls.__name__ + 'Dict', (), {'__init__': cls.__init__})
+        sizes = []
+        for m_cls in (dict_cls, cls):
+            objects, _, peak = measure(_make_objects, m_cls, number_of_objects)
+            sizes.append(peak * 1024 * 1024 / number_of_objects)
+            del objects
+        print(f'{cls.__name__}: 改动前{sizes[0]:.0f}，改动后{sizes[1]:.0f}')
+
+
+def _transform_per_coord(shape, func):
+    # 改动前GeoTransformer._transform的实现：逐个几何、逐个坐标调用投影函数，作为对比基准
+    construct = shape.__class__
+    if shape.geom_type.startswith('Multi'):
+        return construct([_transform_per_coord(geom, func) for geom in shape.geoms])
+    if shape.geom_type == 'Point':
+        return construct(list(map(func, shape.coords))[0])
+    if shape.geom_type == 'LineString':
+        return construct(map(func, shape.coords))
+    if shape.geom_type == 'Polygon':
+        exterior = map(func, shape.exterior.coords)
+        rings = [map(func, ring.coords) for ring in shape.interiors]
+        return construct(exterior, rings)
+
+
+def bench_geo_transform(number_of_polygons=100000):
+    print('GeoTransformer批量投影耗时')
+    rng = np.random.default_rng(0)
+    lons, lats = 116.3 + rng.random(number_of_polygons) * 0.2, 39.8 + rng.random(number_of_polygons) * 0.2
+    polygons = [geometry.box(lon, lat, lon + 0.001, lat + 0.001) for lon, lat in zip(lons, lats)]
+    GT = GeoTransformer(116.4, 39.9, True)
+    single_result, elapsed_single, _ = measure(
+        lambda: [_transform_per_coord(poly, GT._from_latlon_) for poly in polygons])
+    bulk_result, elapsed_bulk, _ = measure(GT.geos_from_latlon, polygons)
+    assert all(a.equals_exact(b, 0.01) for a, b in zip(single_result, bulk_result))
+    print(f'{number_of_polygons}个多边形：逐个投影{elapsed_single:.2f} s，批量投影{elapsed_bulk:.2f} s')
+
+
+def bench_get_osm_network(filename):
+    print('单遍读取与两遍读取对比')
+    for two_pass in (False, True):
+        osmnet, elapsed, peak = measure(get_osm_network, filename, two_pass=two_pass)
+        print(f'two_pass={two_pass}: 耗时{elapsed:.2f} s，内存峰值{peak:.1f} MB，'
+              f'节点{len(osmnet.osm_node_dict)}个，way{len(osmnet.osm_way_dict)}条')
+        del osmnet
+
+
+def bench_parallel_parse(filename, workers_list=(1, 2, 4, 8)):
+    print('pbf多进程解析耗时')
+    for workers in workers_list:
+        _, elapsed, _ = measure(get_osm_network, filename, workers=workers)
+        print(f'workers={workers}: 耗时{elapsed:.2f} s')
+
+
+if __name__ == '__main__':
+    osm_filename = sys.argv[1] if len(sys.argv) > 1 else 'osm_data/Beijing.osm'
+    bench_object_memory()
+    bench_geo_transform()
+    bench_get_osm_network(osm_filename)
+    if osm_filename.endswith('.pbf'):
+        bench_parallel_parse(osm_filename)
@@ -1,9 +1,13 @@
 from my_network import Network
-from poi_methods import get_all_pois
+from poi_methods import get_all_pois, assign_nearest_node
 from get_from_osm import get_osm_network
 from shapely import geometry
 from osmclasses import NodeInOsm
 from my_network import Node, Link
+from process_geo_information import get_lines_from_rows, concat_rows
+from simplify_net import simplify_network
+from net_components import tag_components, keep_largest_component
+from movement_methods import generate_movements
 
 # osm中的道路类型字典，映射
 osm_highway_type_dict = {
@@ -78,6 +82,47 @@ _filters_ex = {
 }
 
 
+# 将_filter_in和_filters_ex预编译为{标签: {取值: 通行方式位掩码}}的查找表，
+# 每条way只需对每个标签查一次表即可得到所有通行方式的判断结果
+agent_type_list = ['auto', 'bike', 'walk']
+_all_agent_mask = (1 << len(agent_type_list)) - 1
+
+
+def _compile_filters(filters):
+    lookup_table = {}
+    for agent_no, agent_type in enumerate(agent_type_list):
+        for tag, value_set in filters[agent_type].items():
+            value_dict = lookup_table.setdefault(tag, {})
+            for value in value_set:
+                value_dict[value] = value_dict.get(value, 0) | (1 << agent_no)
+    return lookup_table
+
+
+_filter_in_table = _compile_filters(_filter_in)
+_filters_ex_table = _compile_filters(_filters_ex)
+# 位掩码到通行方式列表的映射，列表顺序固定为agent_type_list的顺序
+_agent_mask_list = [[agent_type for agent_no, agent_type in enumerate(agent_type_list) if mask >> agent_no & 1]
+                    for mask in range(_all_agent_mask + 1)]
+
+
+def get_agent_mask(agent_types):
+    mask = 0
+    for agent_type in agent_types:
+        mask |= 1 << agent_type_list.index(agent_type)
+    return mask
+
+
+def get_allowed_agent_mask(way):
+    # 满足任一包含条件，或不满足任何排除条件时允许通行
+    in_mask = 0
+    for tag, value_dict in _filter_in_table.items():
+        in_mask |= value_dict.get(getattr(way, tag), 0)
+    ex_mask = 0
+    for tag, value_dict in _filters_ex_table.items():
+        ex_mask |= value_dict.get(getattr(way, tag), 0)
+    return in_mask | (_all_agent_mask & ~ex_mask)
+
+
 def _checkIn(way, agent_type):
     m_filter_in = _filter_in[agent_type]
     for tag, include_list in m_filter_in.items():
@@ -94,17 +139,32 @@ def _checkEx(way, agent_type):
     return True
 
 
-def create_boundary_node(node_in, node_outside, network):
+def create_boundary_node(node_in, node_outside, network, osm_way_id=None):
     """
     创建一个在边界上的节点。这个函数主要用于处理在区域边界上的节点，这些节点可能部分在区域内部分在区域外。
+    同一way上同一对内外节点的边界节点坐标不变时沿用已有的边界节点，增量更新重新切分时node_id保持不变。
     """
     line = network.bounds.intersection(geometry.LineString([node_in.geometry, node_outside.geometry]))
-    lon, lat = line.coords[1]
-    geometry_lonlat = geometry.Point(
-        (round(lon, 7), round(lat, 7)))
-    boundary_osm_node = NodeInOsm('', '', geometry_lonlat, True, '', '')
-    boundary_osm_node.geometry_xy = network.GT.geo_from_latlon(geometry_lonlat)
+    if hasattr(line, 'geoms'):
+        # 非凸的裁剪区域可能与线段相交多次，取包含区域内节点的那一段
+        line = min(line.geoms, key=lambda part: part.distance(node_in.geometry))
+    lon, lat = line.coords[-1]
+    lon, lat = round(lon, 7), round(lat, 7)
+    table = node_in.table
+    key = (osm_way_id, node_in.osm_node_id, node_outside.osm_node_id)
+    boundary_osm_node = network.boundary_node_dict.get(key)
+    if (boundary_osm_node is not None) and \
+            (table._lon[boundary_osm_node.row], table._lat[boundary_osm_node.row]) == (lon, lat):
+        # 对应的节点已从网络中删除时重新创建
+        node = boundary_osm_node.node
+        if (node is not None) and (network.node_dict.get(node.node_id) is not node): boundary_osm_node.node = None
+        return boundary_osm_node
+    x, y = network.GT._from_latlon_((lon, lat))
+    # 边界节点追加到节点表中，没有对应的osm节点ID
+    row = table.append(-1, lon, lat, x, y)
+    boundary_osm_node = NodeInOsm('', '', table, row, '', '')
     boundary_osm_node.is_crossing = True
+    network.boundary_node_dict[key] = boundary_osm_node
     return boundary_osm_node
 
 
@@ -130,7 +190,7 @@ def get_segment_node_list(way, segment_no, network):
             return m_segment_node_list_group
         else:
             new_node = create_boundary_node(m_segment_node_list[idx_first_outside - 1],
-                                            m_segment_node_list[idx_first_outside], network)
+                                            m_segment_node_list[idx_first_outside], network, way.osm_way_id)
             m_segment_node_list_group.append(m_segment_node_list[:idx_first_outside] + [new_node])
 
     if m_segment_node_list[-1].in_region:
@@ -140,7 +200,7 @@ def get_segment_node_list(way, segment_no, network):
                 idx_last_outside = idx
                 break
         new_node = create_boundary_node(m_segment_node_list[idx_last_outside + 1],
-                                        m_segment_node_list[idx_last_outside], network)
+                                        m_segment_node_list[idx_last_outside], network, way.osm_way_id)
         m_segment_node_list_group.append([new_node] + m_segment_node_list[idx_last_outside + 1:])
 
     return m_segment_node_list_group
@@ -158,6 +218,24 @@ def create_node_from_osm_node(network, osmnode):
         network.max_node_id += 1
 
 
+def get_way_link_node_lists(way, network):
+    """
+    将一条道路按交叉节点切分，返回每条link的(方向, 节点列表)，双向道路的反向link紧跟在正向link之后。
+    """
+    way.segment_node_list = []
+    way.number_of_segments = 0
+    way.getNodeListForSegments()
+    link_node_list_group = []
+    for segment_no in range(way.number_of_segments):
+        m_segment_node_list_group = get_segment_node_list(way, segment_no, network)
+        for m_segment_node_list in m_segment_node_list_group:
+            if len(m_segment_node_list) < 2: continue
+            link_node_list_group.append((1, m_segment_node_list))
+            if not way.oneway:
+                link_node_list_group.append((-1, list(reversed(m_segment_node_list))))
+    return link_node_list_group
+
+
 def create_nodes_and_links(network, link_way_list):
     """
     创建网络中的节点和链接。这个函数主要用于从OSM的way列表中创建网络中的节点和链接。
@@ -166,117 +244,117 @@ def create_nodes_and_links(network, link_way_list):
 
     link_dict = {}
     max_link_id = network.max_link_id
+    # 记录每条link的节点行号，循环结束后批量生成几何
+    link_list = []
+    link_row_list = []
     for way in link_way_list:
         if way.is_pure_cycle: continue
-        way.getNodeListForSegments()
-        for segment_no in range(way.number_of_segments):
-            m_segment_node_list_group = get_segment_node_list(way, segment_no, network)
-            for m_segment_node_list in m_segment_node_list_group:
-                if len(m_segment_node_list) < 2: continue
-                create_node_from_osm_node(network, m_segment_node_list[0])
-                create_node_from_osm_node(network, m_segment_node_list[-1])
-
-                link = Link(max_link_id)
-                link.generate_from_osmway(way, 1, m_segment_node_list, network.default_lanes, network.default_speed,
-                                          network.default_capacity)
-                link_dict[link.link_id] = link
-                max_link_id += 1
-                if not way.oneway:
-                    linkb = Link(max_link_id)
-                    linkb.generate_from_osmway(way, -1, list(reversed(m_segment_node_list)), network.default_lanes,
-                                               network.default_speed, network.default_capacity)
-                    link_dict[linkb.link_id] = linkb
-                    max_link_id += 1
+        for direction, m_link_node_list in get_way_link_node_lists(way, network):
+            create_node_from_osm_node(network, m_link_node_list[0])
+            create_node_from_osm_node(network, m_link_node_list[-1])
+
+            link = Link(max_link_id)
+            link.generate_from_osmway(way, direction, m_link_node_list, network.default_lanes, network.default_speed,
+                                      network.default_capacity, build_geometry=False)
+            link_dict[link.link_id] = link
+            max_link_id += 1
+            link_list.append(link)
+            link_row_list.append([node.row for node in m_link_node_list])
+
+    rows, offsets = concat_rows(link_row_list)
+    lines, lines_xy = get_lines_from_rows(network.node_table, rows, offsets)
+    for link_no, link in enumerate(link_list):
+        link.geometry, link.geometry_xy = lines[link_no], lines_xy[link_no]
+
     network.link_dict = link_dict
     network.max_link_id = max_link_id
 
 
+def classify_way(way, network_types_mask):
+    """
+    判断way是poi（返回'poi'）、道路（返回'link'）还是无用（返回None），并设置道路的类型、通行方式和单行属性。
+    """
+    # 对于building、amenity、leisure，是poi中的属性
+    if way.building or way.amenity or way.leisure:
+        return 'poi'
+
+    if not way.highway:
+        return None
+    if way.highway in {'bus_stop', 'platform'}:
+        way.way_poi = way.highway
+        return 'poi'
+    if way.area and way.area != 'no':
+        return None
+    if way.highway in {'path', 'construction', 'proposed', 'raceway', 'bridleway', 'rest_area', 'su',
+                       'road', 'abandoned', 'planned', 'trailhead', 'stairs', 'dismantled', 'disused', 'razed',
+                       'access',
+                       'corridor', 'stop'}:
+        return None
+    if len(way.ref_node_list) < 2:
+        return None
+
+    try:
+        way.link_type_name, way.is_link = osm_highway_type_dict[way.highway]
+        way.link_type = link_type_no_dict[way.link_type_name]
+    except KeyError:
+        return None
+
+    # 获取一条道路允许的通行方式，一次查表得到所有通行方式的结果
+    way.allowable_agent_type_list = _agent_mask_list[get_allowed_agent_mask(way) & network_types_mask]
+    if len(way.allowable_agent_type_list) == 0:
+        return None
+    way.allowed_uses = way.allowable_agent_type_list
+
+    if way.ref_node_list[0] is way.ref_node_list[-1]:
+        way.is_cycle = True
+    if way.oneway is None:
+        if way.junction in ['circular', 'roundabout']:
+            way.oneway = True
+        else:
+            way.oneway = default_oneway_flag_dict[way.link_type_name]
+    way.link_class = 'highway'
+    return 'link'
+
+
+def mark_pure_cycle(way):
+    # 除首尾外没有交叉节点的环形道路不生成link
+    way.is_pure_cycle = False
+    if way.is_cycle:
+        way.is_pure_cycle = True
+        for node in way.ref_node_list[1:-1]:
+            if node.is_crossing:
+                way.is_pure_cycle = False
+                break
+
+
 def preprocess_way(osmnetwork, network_types):
     """
     预处理OSM的way。这个函数主要用于处理OSM的way，包括识别路段类型、确定路段是否在区域内等。
     """
     link_way_list = []
     POI_way_list = []
-    network_types_set = set(network_types)
+    network_types_mask = get_agent_mask(network_types)
     for _, way in osmnetwork.osm_way_dict.items():
-
-        # 对于building、amenity、leisure，是poi中的属性
-        if way.building or way.amenity or way.leisure:
+        way_class = classify_way(way, network_types_mask)
+        if way_class == 'poi':
             POI_way_list.append(way)
-
-        elif way.highway:
-            if way.highway in {'bus_stop', 'platform'}:
-                way.way_poi = way.highway
-                POI_way_list.append(way)
-                continue
-            if way.area and way.area != 'no':
-                continue
-            if way.highway in {'path', 'construction', 'proposed', 'raceway', 'bridleway', 'rest_area', 'su',
-                               'road', 'abandoned', 'planned', 'trailhead', 'stairs', 'dismantled', 'disused', 'razed',
-                               'access',
-                               'corridor', 'stop'}:
-                continue
-            if len(way.ref_node_list) < 2:
-                continue
-
-            try:
-                way.link_type_name, way.is_link = osm_highway_type_dict[way.highway]
-                way.link_type = link_type_no_dict[way.link_type_name]
-            except KeyError:
-                continue
-
-            # 获取一条道路允许的通行方式:
-            allowable_agent_type_list = []
-
-            for agent_type in ['auto', 'bike', 'walk']:
-
-                allowed_in = None
-                allowed_ex = True
-                m_filter_in = _filter_in[agent_type]
-                for tag, include_list in m_filter_in.items():
-                    if getattr(way, tag) in include_list:
-                        allowed_in = True
-                        break
-                m_filter_ex = _filters_ex[agent_type]
-                for tag, exclude_list in m_filter_ex.items():
-                    if getattr(way, tag) in exclude_list:
-                        allowed_ex = False
-
-                if allowed_in:
-                    allowable_agent_type_list.append(agent_type)
-                    continue
-                if allowed_ex:
-                    allowable_agent_type_list.append(agent_type)
-            way.allowable_agent_type_list = list(set(allowable_agent_type_list).intersection(network_types_set))
-            if len(way.allowable_agent_type_list) == 0:
-                continue
-            way.allowed_uses = way.allowable_agent_type_list
-
+        elif way_class == 'link':
             way.ref_node_list[0].is_crossing = True
             way.ref_node_list[-1].is_crossing = True
             for node in way.ref_node_list:
                 node.usage_count += 1
-
-            if way.ref_node_list[0] is way.ref_node_list[-1]:
-                way.is_cycle = True
-            if way.oneway is None:
-                if way.junction in ['circular', 'roundabout']:
-                    way.oneway = True
-                else:
-                    way.oneway = default_oneway_flag_dict[way.link_type_name]
-            way.link_class = 'highway'
             link_way_list.append(way)
 
-        else:
-            pass
-
     osmnetwork.link_way_list = link_way_list
     osmnetwork.POI_way_list = POI_way_list
+    osmnetwork.node_way_index = None
 
 
-def create_network_data_from_osmnet(osmnetwork, network):
+def create_network_data_from_osmnet(osmnetwork, network, network_types=('auto',), workers=1, simplify=False,
+                                    components=False, keep_largest=None, movements=False):
     # 预处理OSM的way。这个函数主要用于处理OSM的way，包括识别路段类型、确定路段是否在区域内等。
-    preprocess_way(osmnetwork, ['auto'])
+    # 所有通行方式共用一套节点，link的allowed_uses记录其允许的通行方式
+    preprocess_way(osmnetwork, network_types)
 
     # 类型为signal和出现多于一次的点是交叉的OSM节点
     for _, osmnode in osmnetwork.osm_node_dict.items():
@@ -285,35 +363,60 @@ def create_network_data_from_osmnet(osmnetwork, network):
 
     # 标注循环路段
     for way in osmnetwork.link_way_list:
-        if way.is_cycle:
-            way.is_pure_cycle = True
-            for node in way.ref_node_list[1:-1]:
-                if node.is_crossing:
-                    way.is_pure_cycle = False
-                    break
+        mark_pure_cycle(way)
 
     # 创建网络中的节点和链接。这个函数主要用于从OSM的way列表中创建网络中的节点和链接。
     create_nodes_and_links(network, osmnetwork.link_way_list)
 
+    # 合并度为2的节点并归并交叉口
+    if simplify:
+        simplify_network(network)
+
+    # 删除最大连通分量以外的节点和link，标注连通分量编号
+    if keep_largest:
+        keep_largest_component(network, keep_largest)
+    if components:
+        tag_components(network)
+
+    # 生成交叉口转向
+    if movements:
+        generate_movements(network)
+
     # 生成POI数据
-    get_all_pois(osmnetwork.POI_way_list, osmnetwork.osm_relation_list, network)
+    get_all_pois(osmnetwork.POI_way_list, osmnetwork.osm_relation_list, network, workers, osmnetwork.POI_node_list)
+
+    # 为POI分配最近的网络节点
+    assign_nearest_node(network, max_distance=network.poi_max_distance, link_types=network.poi_link_types)
 
 
-def build_network(osmnetwork):
+def build_network(osmnetwork, network_types=('auto',), poi_max_distance=None, poi_link_types=None, workers=1,
+                  simplify=False, components=False, keep_largest=None, movements=False):
     """
     构建网络。这个函数主要用于从OSM数据中构建网络，包括创建节点、链接和兴趣点，以及处理网络中的一些特殊情况，如孤立节点、重叠链接等。
+    network_types可同时包含'auto'、'bike'、'walk'，一次构建得到共用节点的多模式网络，可用Network.get_mode_view取单一模式。
+    workers大于1时POI几何在进程池中生成。simplify为True时合并度为2的节点并填写交叉口的intersection_id。
+    components为True时为节点和link标注弱/强连通分量编号，keep_largest为'weak'或'strong'时只保留最大的该类连通分量。
+    movements为True时为每个交叉口生成转向（network.movement_dict）。
     """
     print('构建从osm解析的自定义网络')
 
     network = Network()
     network.bounds = osmnetwork.bounds
-    create_network_data_from_osmnet(osmnetwork, network)
+    network.GT = osmnetwork.GT
+    network.node_table = osmnetwork.node_table
+    network.network_types = [agent_type for agent_type in agent_type_list if agent_type in network_types]
+    network.poi_max_distance, network.poi_link_types = poi_max_distance, poi_link_types
+    create_network_data_from_osmnet(osmnetwork, network, network_types, workers, simplify, components, keep_largest,
+                                    movements)
 
     return network
 
 
-def get_network(filename):
-    osmnetwork = get_osm_network(filename)
-    network = build_network(osmnetwork)
+def get_network(filename, two_pass=False, workers=1, clip=None, network_types=('auto',), cache_dir=None,
+                poi_max_distance=None, poi_link_types=None, simplify=False, components=False, keep_largest=None,
+                movements=False):
+    osmnetwork = get_osm_network(filename, two_pass=two_pass, workers=workers, clip=clip, cache_dir=cache_dir)
+    network = build_network(osmnetwork, network_types, poi_max_distance, poi_link_types, workers, simplify,
+                            components, keep_largest, movements)
     print(f'生成节点{len(network.node_dict)}个，生成路径{len(network.link_dict)}条，生成poi{len(network.POI_list)}个')
     return network
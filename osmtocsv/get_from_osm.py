@@ -1,44 +1,136 @@
-from osmclasses import NodeInOsm, WayInOsm, RelationInOsm, NetworkInOsm
+from osmclasses import NodeTable, WayInOsm, RelationInOsm, NetworkInOsm, create_osm_node_dict
 from process_geo_information import from_latlon
 from process_geo_information import GeoTransformer
+from pbf_blocks import split_pbf_blocks, read_pbf_chunk
+from osm_cache import get_cache_path, save_osm_network, load_osm_network, remove_stale_cache
 from shapely import geometry
+from array import array
+import shapely
+import multiprocessing
 import numpy as np
+import os
 import osmium
+import time
 import re
 
 
-class MyHandler(osmium.SimpleHandler):
+def is_used_way(tags):
+    # 与preprocess_way保持一致：带building、amenity、leisure的为poi，其余带highway的为道路
+    return bool(tags.get('building') or tags.get('amenity') or tags.get('leisure') or tags.get('highway'))
+
+
+def is_used_relation(tags):
+    # 与MyHandler.relation保持一致：只保留带building或amenity的关系
+    return (tags.get('building') is not None) or (tags.get('amenity') is not None)
+
+
+class RelationMemberCollector(osmium.SimpleHandler):
+    # 两遍读取的第一遍（关系部分）：收集poi关系引用的way和节点
     def __init__(self):
         osmium.SimpleHandler.__init__(self)
+        self.member_way_ids = set()
+        self.member_node_ids = set()
+
+    def relation(self, r):
+        if not is_used_relation(r.tags):
+            return
+        for member in r.members:
+            member_type = member.type.lower()
+            if member_type == 'w':
+                self.member_way_ids.add(member.ref)
+            elif member_type == 'n':
+                self.member_node_ids.add(member.ref)
+
+
+class WayRefCollector(osmium.SimpleHandler):
+    # 两遍读取的第一遍（way部分）：收集道路、poi以及poi关系成员way所引用的节点
+    def __init__(self, member_way_ids, member_node_ids):
+        osmium.SimpleHandler.__init__(self)
+        self.member_way_ids = member_way_ids
+        self.referenced_way_ids = set()
+        self.referenced_node_ids = set(member_node_ids)
+
+    def way(self, w):
+        if w.id not in self.member_way_ids and not is_used_way(w.tags):
+            return
+        self.referenced_way_ids.add(w.id)
+        self.referenced_node_ids.update(node.ref for node in w.nodes)
+
+
+def collect_referenced_ids(filename):
+    """
+    两遍读取的第一遍。只扫描relation和way，返回后续构建网络需要的way ID和节点ID（均为int）。
+    """
+    rc = RelationMemberCollector()
+    rc.apply_file(filename)
+    wc = WayRefCollector(rc.member_way_ids, rc.member_node_ids)
+    wc.apply_file(filename)
+    return wc.referenced_way_ids, wc.referenced_node_ids
+
+
+class MyHandler(osmium.SimpleHandler):
+    def __init__(self, referenced_way_ids=None, referenced_node_ids=None):
+        osmium.SimpleHandler.__init__(self)
 
-        self.osm_node_dict = {}
-        self.osm_node_id_list = []
-        self.osm_node_coord_list = []
+        # 节点按列存储，只有带name或highway标签的节点单独记录标签
+        self.osm_node_id_list = array('q')
+        self.osm_node_lon_list = array('d')
+        self.osm_node_lat_list = array('d')
+        self.osm_node_tag_dict = {}
 
         self.osm_way_dict = {}
         self.relation_list = []
+        # 带poi标签的节点，只记录这些节点的坐标和poi标签
+        self.poi_node_list = []
+
+        # 两遍读取模式：只加载被引用的way和节点，为None时全部加载
+        self.referenced_way_ids = referenced_way_ids
+        self.referenced_node_ids = referenced_node_ids
+        # 是否按区域裁剪，由get_osm_network设置
+        self.clip = False
+        # 被过滤掉的节点仍参与中心经纬度的计算，以保证投影结果与单遍读取一致
+        self.all_lon_list = array('d')
+        self.all_lat_list = array('d')
 
     def node(self, n):
-        osm_node_id = str(n.id)
         lon, lat = n.location.lon, n.location.lat
-        node_geometry = geometry.Point(lon, lat)
-        in_region = True
+        if len(n.tags) > 0:
+            self.add_poi_node(n, lon, lat)
+        if self.referenced_node_ids is not None:
+            self.all_lon_list.append(lon)
+            self.all_lat_list.append(lat)
+            if n.id not in self.referenced_node_ids:
+                return
 
         osm_node_name = n.tags.get('name')
         osm_highway = n.tags.get('highway')
-        ctrl_type = 'signal' if (osm_highway is not None) and 'signal' in osm_highway else None
-
-        node = NodeInOsm(osm_node_name, osm_node_id, node_geometry, in_region, osm_highway, ctrl_type)
-        self.osm_node_dict[node.osm_node_id] = node
+        if (osm_node_name is not None) or (osm_highway is not None):
+            self.osm_node_tag_dict[len(self.osm_node_id_list)] = (osm_node_name, osm_highway)
 
-        self.osm_node_id_list.append(osm_node_id)
-        self.osm_node_coord_list.append((lon, lat))
+        self.osm_node_id_list.append(n.id)
+        self.osm_node_lon_list.append(lon)
+        self.osm_node_lat_list.append(lat)
         del n
 
+    def add_poi_node(self, n, lon, lat):
+        # 与way相同的poi判断：building、amenity、leisure，或highway为bus_stop、platform，另外包括商店shop
+        building = n.tags.get('building')
+        amenity = n.tags.get('amenity')
+        leisure = n.tags.get('leisure')
+        shop = n.tags.get('shop')
+        highway = n.tags.get('highway')
+        way_poi = highway if highway in ('bus_stop', 'platform') else None
+        if building or amenity or leisure or shop or way_poi:
+            self.poi_node_list.append((str(n.id), lon, lat, n.tags.get('name'), building, amenity, leisure, shop,
+                                       way_poi))
+
     def way(self, w):
+        if (self.referenced_way_ids is not None) and (w.id not in self.referenced_way_ids):
+            return
+
         way = WayInOsm()
         way.osm_way_id = str(w.id)
-        way.ref_node_id_list = [str(node.ref) for node in w.nodes]
+        way.ref_node_id_list = array('q', [node.ref for node in w.nodes])
 
         way.highway = w.tags.get('highway')
         way.railway = w.tags.get('railway')
@@ -130,25 +222,96 @@ class MyHandler(osmium.SimpleHandler):
         del r
 
 
+# 多进程解析：每个子进程用MyHandler解析一组pbf块，主进程按文件顺序合并，结果与单进程相同
+_worker_referenced_ids = (None, None)
+
+
+def _init_worker(referenced_way_ids, referenced_node_ids):
+    global _worker_referenced_ids
+    _worker_referenced_ids = (referenced_way_ids, referenced_node_ids)
+
+
+def _parse_pbf_chunk(args):
+    filename, block_range_list = args
+    h = MyHandler(*_worker_referenced_ids)
+    h.apply_buffer(read_pbf_chunk(filename, block_range_list), 'pbf')
+    return (h.osm_node_id_list, h.osm_node_lon_list, h.osm_node_lat_list, h.osm_node_tag_dict,
+            h.osm_way_dict, h.relation_list, h.all_lon_list, h.all_lat_list, h.poi_node_list)
+
+
+def _merge_partial(h, partial):
+    node_ids, lons, lats, node_tag_dict, way_dict, relation_list, all_lons, all_lats, poi_node_list = partial
+    row_offset = len(h.osm_node_id_list)
+    for row, tags in node_tag_dict.items():
+        h.osm_node_tag_dict[row + row_offset] = tags
+    h.osm_node_id_list.extend(node_ids)
+    h.osm_node_lon_list.extend(lons)
+    h.osm_node_lat_list.extend(lats)
+    h.osm_way_dict.update(way_dict)
+    h.relation_list.extend(relation_list)
+    h.all_lon_list.extend(all_lons)
+    h.all_lat_list.extend(all_lats)
+    h.poi_node_list.extend(poi_node_list)
+
+
+def apply_file_parallel(h, filename, workers):
+    """
+    按pbf块切分文件并在进程池中解析，部分结果按文件顺序合并到h中。
+    """
+    # 分组数多于进程数，使node块和way块的解析负载能够均衡
+    chunk_list = split_pbf_blocks(filename, workers * 4)
+    print(f'使用{workers}个进程并行解析{len(chunk_list)}组pbf块')
+    with multiprocessing.Pool(workers, initializer=_init_worker,
+                              initargs=(h.referenced_way_ids, h.referenced_node_ids)) as pool:
+        for partial in pool.imap(_parse_pbf_chunk, [(filename, chunk) for chunk in chunk_list]):
+            _merge_partial(h, partial)
+
+
 def get_nodes(net, h):
-    coord_array = np.array(h.osm_node_coord_list)
+    osm_node_ids = np.array(h.osm_node_id_list, dtype=np.int64)
+    lons = np.array(h.osm_node_lon_list, dtype=np.float64)
+    lats = np.array(h.osm_node_lat_list, dtype=np.float64)
+    if h.referenced_node_ids is None:
+        coord_array = np.column_stack((lons, lats))
+    else:
+        coord_array = np.column_stack((np.frombuffer(h.all_lon_list), np.frombuffer(h.all_lat_list)))
     central_lon, central_lat = np.mean(coord_array, axis=0)
     central_lon, central_lat = float(central_lon), float(central_lat)
     northern = True if central_lat >= 0 else False
 
-    xs, ys = from_latlon(coord_array[:, 0], coord_array[:, 1], central_lon)
-    for node_no, node_id in enumerate(h.osm_node_id_list):
-        node = h.osm_node_dict[node_id]
-        node.geometry_xy = geometry.Point((xs[node_no], ys[node_no]))
+    xs, ys = from_latlon(lons, lats, central_lon)
+    # 一次向量化的点面判断标记所有节点是否位于区域内
+    in_region = shapely.intersects_xy(net.bounds, lons, lats) if h.clip else None
+    net.node_table = NodeTable(osm_node_ids, lons, lats, xs, ys, in_region)
 
-    net.osm_node_dict = h.osm_node_dict
+    # 仅创建NodeInOsm对象，Point在需要时才由NodeTable生成
+    net.osm_node_dict = create_osm_node_dict(net.node_table, h.osm_node_tag_dict)
     net.GT = GeoTransformer(central_lon, central_lat, northern)
 
 
 def get_ways(net, h):
-    for osm_way_id, osm_way in h.osm_way_dict.items():
-        osm_way.ref_node_list = [net.osm_node_dict[ref_node_id] for ref_node_id in osm_way.ref_node_id_list]
-        net.osm_way_dict[osm_way_id] = osm_way
+    # 将所有way引用的osm节点ID一次性映射为NodeTable中的行号
+    way_list = list(h.osm_way_dict.values())
+    if not way_list: return
+    node_ids = net.node_table.osm_node_id
+    order = np.argsort(node_ids, kind='stable')
+    sorted_node_ids = node_ids[order]
+    ref_counts = np.array([len(way.ref_node_id_list) for way in way_list], dtype=np.int64)
+    ref_ids = np.concatenate([np.frombuffer(way.ref_node_id_list, dtype=np.int64) for way in way_list])
+    pos = np.searchsorted(sorted_node_ids, ref_ids)
+    pos[pos == len(sorted_node_ids)] = 0
+    missing = sorted_node_ids[pos] != ref_ids
+    if missing.any():
+        raise KeyError(str(ref_ids[np.argmax(missing)]))
+    ref_rows = order[pos]
+
+    node_list = list(net.osm_node_dict.values())
+    offsets = np.concatenate(([0], np.cumsum(ref_counts)))
+    for way_no, osm_way in enumerate(way_list):
+        rows = ref_rows[offsets[way_no]:offsets[way_no + 1]]
+        osm_way.ref_node_rows = rows
+        osm_way.ref_node_list = [node_list[row] for row in rows.tolist()]
+        net.osm_way_dict[osm_way.osm_way_id] = osm_way
 
 
 def get_relations(net, h):
@@ -167,9 +330,50 @@ def get_relations(net, h):
             net.osm_relation_list.append(relation)
 
 
+def clip_ways(net):
+    """
+    删除所有节点都在区域外的way，使后续的preprocess_way只处理区域内的数据。
+    poi关系已直接引用成员way对象，因此不受影响。
+    """
+    way_list = list(net.osm_way_dict.values())
+    if not way_list: return
+    in_region = net.node_table.in_region
+    # 每条way至少有一个节点在区域内才保留
+    ref_counts = np.array([len(way.ref_node_rows) for way in way_list], dtype=np.int64)
+    inside_counts = np.zeros(len(way_list), dtype=np.int64)
+    nonempty = ref_counts > 0
+    if nonempty.any():
+        ref_rows = np.concatenate([way.ref_node_rows for way in way_list])
+        starts = np.concatenate(([0], np.cumsum(ref_counts)[:-1]))[nonempty]
+        inside_counts[nonempty] = np.add.reduceat(in_region[ref_rows].astype(np.int64), starts)
+    net.osm_way_dict = {way.osm_way_id: way for way_no, way in enumerate(way_list) if inside_counts[way_no] > 0}
+    print(f'区域裁剪：保留way{len(net.osm_way_dict)}条，删除{len(way_list) - len(net.osm_way_dict)}条')
+
+
 # used by getNetFromFile
-def get_osm_network(filename):
+def get_osm_network(filename, two_pass=False, workers=1, clip=None, cache_dir=None):
+    """
+    读取OSM文件。two_pass为True时先扫描way和relation收集被引用的节点ID，第二遍只加载这些节点，
+    得到的网络与单遍读取相同，但内存占用和解析时间更低。
+    workers大于1且输入为.pbf文件时，按pbf块多进程并行解析。
+    clip为裁剪区域，可以是shapely的Polygon/MultiPolygon或(minlon, minlat, maxlon, maxlat)，
+    区域外的节点标记为in_region=False，完全在区域外的way被删除。
+    cache_dir不为None时，解析结果以源文件哈希和解析参数为键缓存在该目录中，再次读取时直接加载。
+    """
     print('读取OSM文件信息')
+    start_time = time.time()
+    if isinstance(clip, (tuple, list)):
+        clip = geometry.box(*clip)
+    if cache_dir is not None:
+        # 多进程解析的结果与单进程相同，不参与缓存键；clip用WKB保留完整精度（WKT默认只保留6位小数）
+        settings = {'two_pass': bool(two_pass), 'clip': None if clip is None else shapely.to_wkb(clip, hex=True)}
+        cache_path = get_cache_path(filename, cache_dir, settings)
+        if os.path.exists(cache_path):
+            osmnet = load_osm_network(cache_path)
+            print(f'从缓存{cache_path}加载，耗时：{time.time() - start_time:.2f} s，'
+                  f'节点{len(osmnet.osm_node_dict)}个，way{len(osmnet.osm_way_dict)}条')
+            return osmnet
+
     osmnet = NetworkInOsm()
     f = osmium.io.Reader(filename)
     header = f.header()
@@ -179,11 +383,31 @@ def get_osm_network(filename):
     minlat, minlon = bottom_left.lat, bottom_left.lon
     maxlat, maxlon = top_right.lat, top_right.lon
     osmnet.bounds = geometry.Polygon([(minlon, maxlat), (maxlon, maxlat), (maxlon, minlat), (minlon, minlat)])
-    h = MyHandler()
+    if clip is not None:
+        osmnet.bounds = clip
+        osmnet.is_clipped = True
+        shapely.prepare(osmnet.bounds)
+    if two_pass:
+        referenced_way_ids, referenced_node_ids = collect_referenced_ids(filename)
+        h = MyHandler(referenced_way_ids, referenced_node_ids)
+    else:
+        h = MyHandler()
     h.bounds = osmnet.bounds
-    h.apply_file(filename)
+    h.clip = clip is not None
+    if workers > 1 and str(filename).endswith('.pbf'):
+        apply_file_parallel(h, filename, workers)
+    else:
+        if workers > 1: print('仅.pbf文件支持并行解析，使用单进程解析')
+        h.apply_file(filename)
 
     get_nodes(osmnet, h)
     get_ways(osmnet, h)
     get_relations(osmnet, h)
+    osmnet.POI_node_list = h.poi_node_list
+    if h.clip:
+        clip_ways(osmnet)
+    print(f'OSM文件解析耗时：{time.time() - start_time:.2f} s，节点{len(osmnet.osm_node_dict)}个，way{len(osmnet.osm_way_dict)}条')
+    if cache_dir is not None:
+        save_osm_network(osmnet, cache_path)
+        remove_stale_cache(cache_path)
     return osmnet
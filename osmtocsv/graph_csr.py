@@ -0,0 +1,122 @@
+# 网络的CSR（压缩稀疏行）邻接表导出与读取
+# 节点按node_dict的顺序编号为0..n-1，第i个节点的出边为offsets[i]:offsets[i+1]，
+# 各数组可保存为.npy并以内存映射方式读取，也可转换为scipy.sparse矩阵直接用于scipy.sparse.csgraph
+import os
+
+import numpy as np
+import shapely
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+
+# 保存的数组，weight可取其中的length、free_speed、capacity
+CSR_ARRAYS = ('node_ids', 'offsets', 'targets', 'link_ids', 'length', 'free_speed', 'capacity')
+
+
+class CSRGraph:
+    """
+    node_ids[i]为第i个节点的node_id；第i个节点的出边e（offsets[i] <= e < offsets[i+1]）
+    指向节点targets[e]，对应link_ids[e]，权重为length[e]（米）、free_speed[e]、capacity[e]，缺失值为nan。
+    """
+    def __init__(self, node_ids, offsets, targets, link_ids, length, free_speed, capacity):
+        self.node_ids = node_ids
+        self.offsets = offsets
+        self.targets = targets
+        self.link_ids = link_ids
+        self.length = length
+        self.free_speed = free_speed
+        self.capacity = capacity
+
+    @property
+    def number_of_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def number_of_links(self):
+        return len(self.targets)
+
+    def get_node_index(self, node_ids):
+        # node_id转换为CSR中的节点序号，不存在的node_id为-1
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        order = np.argsort(self.node_ids, kind='stable')
+        sorted_node_ids = self.node_ids[order]
+        pos = np.searchsorted(sorted_node_ids, node_ids)
+        pos[pos == len(sorted_node_ids)] = 0
+        found = (len(sorted_node_ids) > 0) & (sorted_node_ids[pos] == node_ids)
+        return np.where(found, order[pos], -1)
+
+    def get_sources(self):
+        # 每条边的起点序号
+        return np.repeat(np.arange(self.number_of_nodes), np.diff(self.offsets))
+
+    def to_scipy(self, weight='length'):
+        """
+        转换为scipy.sparse.csr_matrix，可直接传给scipy.sparse.csgraph的算法，如
+        dijkstra(graph.to_scipy(), indices=graph.get_node_index([node_id]))。
+        两点之间有多条link时取权重最小的一条，权重缺失的link不计入。
+        """
+        if sparse is None:
+            raise ImportError('转换为scipy矩阵需要安装scipy：pip install scipy')
+        sources = self.get_sources()
+        weights = np.asarray(getattr(self, weight), dtype=np.float64)
+        valid = np.flatnonzero(~np.isnan(weights))
+        order = valid[np.lexsort((weights[valid], self.targets[valid], sources[valid]))]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (sources[order][1:] != sources[order][:-1]) | (self.targets[order][1:] != self.targets[order][:-1])
+        order = order[first]
+        return sparse.csr_matrix((weights[order], (sources[order], self.targets[order])),
+                                 shape=(self.number_of_nodes, self.number_of_nodes))
+
+
+def _to_float_array(values):
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+
+def get_csr_graph(network):
+    """
+    由网络的node_dict和link_dict生成CSRGraph，同一节点的出边保持link_dict中的顺序。
+    多模式网络可先用Network.get_mode_view取单一模式再导出。
+    """
+    node_ids = np.fromiter(network.node_dict, dtype=np.int64, count=len(network.node_dict))
+    node_index_dict = {node_id: no for no, node_id in enumerate(node_ids.tolist())}
+    link_list = list(network.link_dict.values())
+    sources = np.array([node_index_dict[link.from_node.node_id] for link in link_list], dtype=np.int64)
+    targets = np.array([node_index_dict[link.to_node.node_id] for link in link_list], dtype=np.int64)
+
+    order = np.argsort(sources, kind='stable')
+    offsets = np.zeros(len(node_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=len(node_ids)), out=offsets[1:])
+    length = np.round(shapely.length(np.array([link.geometry_xy for link in link_list], dtype=object)), 2)
+    return CSRGraph(node_ids, offsets, targets[order],
+                    np.array([link.link_id for link in link_list], dtype=np.int64)[order],
+                    length.astype(np.float64)[order],
+                    _to_float_array([link.free_speed for link in link_list])[order],
+                    _to_float_array([link.capacity for link in link_list])[order])
+
+
+def save_csr_graph(graph, path):
+    """
+    path以.npz结尾时保存为单个npz文件，否则保存为path目录下每个数组一个.npy文件（可内存映射读取）。
+    """
+    array_dict = {name: np.ascontiguousarray(getattr(graph, name)) for name in CSR_ARRAYS}
+    if str(path).endswith('.npz'):
+        np.savez(path, **array_dict)
+    else:
+        os.makedirs(path, exist_ok=True)
+        for name, array in array_dict.items():
+            np.save(os.path.join(path, name + '.npy'), array)
+
+
+def load_csr_graph(path, mmap_mode='r'):
+    """
+    读取save_csr_graph保存的图。.npy目录默认以只读内存映射方式打开，只在访问时读取数据；
+    mmap_mode为None时全部读入内存。
+    """
+    if str(path).endswith('.npz'):
+        with np.load(path, allow_pickle=False) as data:
+            return CSRGraph(*[data[name] for name in CSR_ARRAYS])
+    return CSRGraph(*[np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+                      for name in CSR_ARRAYS])
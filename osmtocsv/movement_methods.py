@@ -0,0 +1,195 @@
+# 交叉口转向（movement）生成
+# 对每个交叉口的进入/离开link对，批量计算进入和离开方向的方位角得到转向类型，
+# 再由进入link的turn:lanes标签确定各转向使用的车道
+import numpy as np
+import shapely
+
+from my_network import Movement
+
+# 转向类型编号：0直行、1左转、2右转、3掉头
+TURN_TYPE_LIST = ['thru', 'left', 'right', 'uturn']
+_TURN_TXT_LIST = ['T', 'L', 'R', 'U']
+
+# turn:lanes中每个取值对应的转向类型，slight_*既可用于直行也可用于转弯，未标注（none或空）的车道视为直行
+_TURN_LANE_TYPE_DICT = {
+    '': (0,), 'none': (0,), 'through': (0,), 'merge_to_left': (0,), 'merge_to_right': (0,),
+    'left': (1,), 'sharp_left': (1,), 'slight_left': (0, 1),
+    'right': (2,), 'sharp_right': (2,), 'slight_right': (0, 2),
+    'reverse': (3,),
+}
+
+# 转向示意线在进入、离开link的首尾线段上取点的距离（米），线段较短时取其中点
+_MOVEMENT_GEOMETRY_LENGTH = 10.0
+
+
+def parse_turn_lanes(turn_lanes):
+    """
+    解析turn:lanes标签，返回每种转向的起止车道（4x2数组，车道从左侧开始编号为1，没有对应车道时为0）。
+    如'left|through|through;right'中左转为车道1，直行为车道2-3，右转为车道3。
+    """
+    lane_range = np.zeros((len(TURN_TYPE_LIST), 2), dtype=np.int64)
+    for lane_no, lane in enumerate(turn_lanes.split('|'), start=1):
+        for value in lane.split(';'):
+            for turn_no in _TURN_LANE_TYPE_DICT.get(value.strip(), ()):
+                if lane_range[turn_no, 0] == 0:
+                    lane_range[turn_no, 0] = lane_no
+                lane_range[turn_no, 1] = lane_no
+    return lane_range
+
+
+def _get_turn_lane_ranges(link_list):
+    # 相同的turn:lanes只解析一次，返回每条link的标签编号（无标签为-1）和(标签数, 4, 2)的车道范围表
+    code_dict = {}
+    codes = np.array([-1 if link.turn_lanes is None else code_dict.setdefault(link.turn_lanes, len(code_dict))
+                      for link in link_list], dtype=np.int64)
+    lane_range_table = np.zeros((len(code_dict) + 1, len(TURN_TYPE_LIST), 2), dtype=np.int64)
+    for turn_lanes, code in code_dict.items():
+        lane_range_table[code] = parse_turn_lanes(turn_lanes)
+    return codes, lane_range_table
+
+
+def _get_pairs(node_no_in, node_no_out, is_intersection, number_of_nodes):
+    """
+    返回交叉口处所有(进入link序号, 离开link序号)对，node_no_in、node_no_out分别为每条link的终点和起点序号。
+    """
+    in_links = np.flatnonzero(is_intersection[node_no_in])
+    in_links = in_links[np.argsort(node_no_in[in_links], kind='stable')]
+    out_links = np.argsort(node_no_out, kind='stable')
+    out_count = np.bincount(node_no_out, minlength=number_of_nodes)
+    out_offsets = np.zeros(number_of_nodes + 1, dtype=np.int64)
+    np.cumsum(out_count, out=out_offsets[1:])
+
+    in_node_no = node_no_in[in_links]
+    repeat_count = out_count[in_node_no]
+    ib = np.repeat(in_links, repeat_count)
+    pair_start = np.repeat(np.cumsum(repeat_count) - repeat_count, repeat_count)
+    ob = out_links[np.repeat(out_offsets[in_node_no], repeat_count) + np.arange(len(ib)) - pair_start]
+    return ib, ob
+
+
+def _get_link_ends(geometries, geometries_xy):
+    """
+    返回每条link起点处和终点处的行进方向（度，x轴正向为0，逆时针为正），
+    以及第一条线段上、最后一条线段上距端点_MOVEMENT_GEOMETRY_LENGTH米处的经纬度坐标。
+    """
+    coords_xy, index = shapely.get_coordinates(geometries_xy, return_index=True)
+    coords = shapely.get_coordinates(geometries)
+    offsets = np.searchsorted(index, np.arange(len(geometries_xy) + 1))
+    start_rows, end_rows = offsets[:-1], offsets[1:] - 1
+    start_vector = coords_xy[start_rows + 1] - coords_xy[start_rows]
+    end_vector = coords_xy[end_rows] - coords_xy[end_rows - 1]
+    start_ratio = np.minimum(0.5, _MOVEMENT_GEOMETRY_LENGTH / np.maximum(np.hypot(*start_vector.T), 1e-9))
+    end_ratio = np.minimum(0.5, _MOVEMENT_GEOMETRY_LENGTH / np.maximum(np.hypot(*end_vector.T), 1e-9))
+    start_points = coords[start_rows] + (coords[start_rows + 1] - coords[start_rows]) * start_ratio[:, None]
+    end_points = coords[end_rows] + (coords[end_rows - 1] - coords[end_rows]) * end_ratio[:, None]
+    return (np.degrees(np.arctan2(start_vector[:, 1], start_vector[:, 0])),
+            np.degrees(np.arctan2(end_vector[:, 1], end_vector[:, 0])), start_points, end_points)
+
+
+def _get_heading_txt(bearings):
+    # 进入方向：东向EB、北向NB、西向WB、南向SB
+    heading_no = (np.floor((bearings + 45.0) / 90.0).astype(np.int64)) % 4
+    return np.array(['EB', 'NB', 'WB', 'SB'])[heading_no]
+
+
+def _get_ob_lanes(ib_lanes, ob_lane_count, turn_no):
+    # 左转、掉头驶入离开link的左侧车道，右转驶入右侧车道，直行从左侧依次对应
+    lanes = np.minimum(ib_lanes, ob_lane_count)
+    is_right = turn_no == 2
+    start = np.where(is_right, ob_lane_count - lanes + 1, 1)
+    end = np.where(is_right, ob_lane_count, lanes)
+    return start, end
+
+
+def generate_movements(network, thru_angle=45.0, uturn_angle=160.0):
+    """
+    为所有交叉口（连接三个及以上相邻节点的节点）生成movement，结果保存在network.movement_dict和node.movement_list中。
+    转向角绝对值不超过thru_angle为直行，超过uturn_angle或驶回进入link的起点为掉头，其余按正负分为左转、右转。
+    进入link有turn:lanes标签时，标签中没有对应车道的转向不生成；没有标签时不生成掉头。
+    在网络增量更新或简化后需重新调用，已有的movement会被替换。返回movement数量。
+    """
+    network.movement_dict = {}
+    network.max_movement_id = 0
+    for node in network.node_dict.values():
+        node.movement_list = []
+    node_list = list(network.node_dict.values())
+    link_list = list(network.link_dict.values())
+    if not link_list:
+        return 0
+    node_no_dict = {node.node_id: no for no, node in enumerate(node_list)}
+    from_no = np.array([node_no_dict[link.from_node.node_id] for link in link_list], dtype=np.int64)
+    to_no = np.array([node_no_dict[link.to_node.node_id] for link in link_list], dtype=np.int64)
+
+    # 相邻节点数不少于3的节点为交叉口
+    not_loop = from_no != to_no
+    neighbor_pairs = np.unique(np.concatenate([np.stack([from_no, to_no], axis=1)[not_loop],
+                                               np.stack([to_no, from_no], axis=1)[not_loop]]), axis=0)
+    is_intersection = np.bincount(neighbor_pairs[:, 0], minlength=len(node_list)) >= 3
+    ib, ob = _get_pairs(to_no, from_no, is_intersection, len(node_list))
+
+    # 进入link和离开link共同允许的通行方式
+    agent_mask = np.array([sum(1 << agent_no for agent_no, agent_type in enumerate(network.network_types)
+                               if agent_type in link.allowed_uses) for link in link_list], dtype=np.int64)
+    use_mask = agent_mask[ib] & agent_mask[ob]
+
+    geometries = np.array([link.geometry for link in link_list], dtype=object)
+    geometries_xy = np.array([link.geometry_xy for link in link_list], dtype=object)
+    start_bearings, end_bearings, start_points, end_points = _get_link_ends(geometries, geometries_xy)
+    turn_angles = (start_bearings[ob] - end_bearings[ib] + 180.0) % 360.0 - 180.0
+    turn_no = np.where(turn_angles > 0, 1, 2)
+    turn_no[np.abs(turn_angles) <= thru_angle] = 0
+    turn_no[(np.abs(turn_angles) > uturn_angle) | (to_no[ob] == from_no[ib])] = 3
+
+    # 按turn:lanes或车道数确定进入车道
+    codes, lane_range_table = _get_turn_lane_ranges(link_list)
+    lane_counts = np.array([-1 if link.lanes is None else link.lanes for link in link_list], dtype=np.int64)
+    has_turn_lanes = codes[ib] >= 0
+    start_ib_lane, end_ib_lane = lane_range_table[codes[ib], turn_no].T
+    ib_lane_count = lane_counts[ib]
+    # 没有标签时直行使用全部车道，左转使用最左侧车道，右转使用最右侧车道
+    start_ib_lane = np.where(has_turn_lanes, start_ib_lane, np.where(turn_no == 2, ib_lane_count, 1))
+    end_ib_lane = np.where(has_turn_lanes, end_ib_lane, np.where(turn_no == 1, 1, ib_lane_count))
+    start_ib_lane = np.where((~has_turn_lanes) & (ib_lane_count < 0), -1, start_ib_lane)
+    end_ib_lane = np.where((~has_turn_lanes) & (ib_lane_count < 0), -1, end_ib_lane)
+
+    keep = (use_mask != 0) & np.where(has_turn_lanes, start_ib_lane > 0, turn_no != 3)
+    ib, ob, use_mask, turn_no, turn_angles = ib[keep], ob[keep], use_mask[keep], turn_no[keep], turn_angles[keep]
+    start_ib_lane, end_ib_lane = start_ib_lane[keep], end_ib_lane[keep]
+    ib_lanes = np.where(start_ib_lane > 0, end_ib_lane - start_ib_lane + 1, -1)
+    ob_lane_count = lane_counts[ob]
+    start_ob_lane, end_ob_lane = _get_ob_lanes(ib_lanes, ob_lane_count, turn_no)
+    has_ob_lanes = (ib_lanes > 0) & (ob_lane_count > 0)
+
+    # 转向示意线：进入link上的点 -> 节点 -> 离开link上的点
+    node_coords = shapely.get_coordinates(np.array([node.geometry for node in node_list], dtype=object))
+    movement_geometries = shapely.linestrings(np.round(np.stack([end_points[ib], node_coords[to_no[ib]],
+                                                                 start_points[ob]], axis=1), 7))
+    mvmt_txt_ids = np.char.add(_get_heading_txt(end_bearings[ib]), np.array(_TURN_TXT_LIST)[turn_no]).tolist()
+
+    allowed_uses_list = [[agent_type for agent_no, agent_type in enumerate(network.network_types) if mask >> agent_no & 1]
+                         for mask in range(1 << len(network.network_types))]
+    # 逐个创建Movement对象前统一转换为Python列表，避免逐元素访问numpy数组
+    column_list = [ib.tolist(), ob.tolist(), turn_no.tolist(), mvmt_txt_ids, np.round(turn_angles, 1).tolist(),
+                   use_mask.tolist(), movement_geometries.tolist(), start_ib_lane.tolist(), end_ib_lane.tolist(),
+                   ib_lanes.tolist(), has_ob_lanes.tolist(), start_ob_lane.tolist(), end_ob_lane.tolist()]
+    movement_id = network.max_movement_id
+    for ib_no, ob_no, turn_type_no, mvmt_txt_id, turn_angle, agent_mask_no, geometry, start_ib, end_ib, lanes, \
+            has_ob, start_ob, end_ob in zip(*column_list):
+        movement = Movement(movement_id)
+        movement.ib_link, movement.ob_link = link_list[ib_no], link_list[ob_no]
+        movement.node = movement.ib_link.to_node
+        movement.type = TURN_TYPE_LIST[turn_type_no]
+        movement.mvmt_txt_id = mvmt_txt_id
+        movement.turn_angle = turn_angle
+        movement.allowed_uses = allowed_uses_list[agent_mask_no]
+        movement.geometry = geometry
+        if start_ib > 0:
+            movement.start_ib_lane, movement.end_ib_lane, movement.lanes = start_ib, end_ib, lanes
+        if has_ob:
+            movement.start_ob_lane, movement.end_ob_lane = start_ob, end_ob
+        network.movement_dict[movement_id] = movement
+        movement.node.movement_list.append(movement)
+        movement_id += 1
+    network.max_movement_id = movement_id
+    print(f'生成movement：{len(network.movement_dict)}个')
+    return len(network.movement_dict)
@@ -65,10 +65,13 @@ class Link:
 
         self.from_bidirectional_way = False
         self.ctrl_type = None  # signal node in the middle
+        self.turn_lanes = None  # 该方向的turn:lanes标签，如'left|through|through;right'
 
         self.segment_list = []
 
-    def generate_from_osmway(self, way, direction, ref_node_list, default_lanes, default_speed, default_capacity):
+    def generate_from_osmway(self, way, direction, ref_node_list, default_lanes, default_speed, default_capacity,
+                             build_geometry=True):
+        # build_geometry为False时几何由调用方批量生成（见create_nodes_and_links）
         self.osm_way_id = way.osm_way_id
         self.name = way.name
         self.link_class = way.link_class
@@ -105,6 +108,11 @@ class Link:
                 else:
                     self.lanes = way.lanes
 
+        if way.oneway:
+            self.turn_lanes = way.turn_lanes
+        else:
+            self.turn_lanes = way.turn_lanes_forward if direction == 1 else way.turn_lanes_backward
+
         if (self.lanes is None) and default_lanes:
             self.lanes = default_lanes[self.link_type_name]
 
@@ -114,7 +122,8 @@ class Link:
 
         self.from_node = ref_node_list[0].node
         self.to_node = ref_node_list[-1].node
-        self.geometry, self.geometry_xy = get_line_from_nodes(ref_node_list)
+        if build_geometry:
+            self.geometry, self.geometry_xy = get_line_from_nodes(ref_node_list)
         self.from_node.outgoing_link_list.append(self)
         self.to_node.incoming_link_list.append(self)
 
@@ -123,12 +132,33 @@ class Link:
         return round(self.geometry_xy.length, 2)
 
 
+# 交叉口的转向，由进入link和离开link组成
+class Movement:
+    def __init__(self, movement_id):
+        self.movement_id = movement_id
+        self.node = None
+        self.ib_link = None
+        self.ob_link = None
+        # 车道从最左侧开始编号为1，车道数未知时为None
+        self.start_ib_lane = None
+        self.end_ib_lane = None
+        self.start_ob_lane = None
+        self.end_ob_lane = None
+        self.lanes = None
+        self.type = ''  # thru, left, right, uturn
+        self.mvmt_txt_id = ''  # 进入方向+转向，如NBL为北向左转
+        self.turn_angle = None  # 逆时针为正，单位为度
+        self.allowed_uses = None
+        self.geometry = None
+
+
 # POI类，读取osm中的poi信息（绑定到node?）
 class POI:
     def __init__(self):
         self.poi_id = 0
         self.osm_way_id = None  # str
         self.osm_relation_id = None
+        self.osm_node_id = None  # str，点poi
         self.name = None
         self.geometry = None
         self.geometry_xy = None
@@ -138,6 +168,7 @@ class POI:
         self.building = None
         self.amenity = None
         self.leisure = None
+        self.shop = None  # 目前只有点poi
         self.way = None  # highway,railway,aeroway poi
 
 
@@ -152,6 +183,9 @@ class Network:
 
         self.GT = None
         self.bounds = None
+        self.node_table = None
+        # 边界节点：(osm_way_id, 区域内osm节点ID, 区域外osm节点ID) -> NodeInOsm，重新切分道路时沿用
+        self.boundary_node_dict = {}
 
         self.node_other_attrs = []
         self.link_other_attrs = []
@@ -165,5 +199,50 @@ class Network:
         self.max_segment_id = 0
         self.max_poi_id = 0
         self.max_movement_id = 0
+        self.movement_dict = {}
 
         self.POI_list = []
+        self.network_types = ['auto']
+        # POI最近节点的最大距离（米）和可连接的道路类型，None为不限制
+        self.poi_max_distance = None
+        self.poi_link_types = None
+        # 增量更新时维护POI最近节点的索引（poi_methods.NearestNodeIndex），第一次应用变更文件时建立
+        self.nearest_node_index = None
+        # 增量更新时维护的osm_way_id -> link列表，第一次应用变更文件时建立
+        self.way_link_dict = None
+        # 是否已合并度为2的节点或删除了非最大连通分量（见simplify_net、net_components），此时不能再增量更新
+        self.is_simplified = False
+
+    def get_mode_view(self, agent_type):
+        """
+        返回只包含某一通行方式的子网络。节点、link和POI对象与原网络共用，
+        节点的incoming_link_list和outgoing_link_list仍包含所有通行方式的link。
+        由于交叉点由所有通行方式的道路共同确定，视图中的link可能比单独构建该模式时切分得更细。
+        """
+        view = Network()
+        view.GT, view.bounds, view.node_table = self.GT, self.bounds, self.node_table
+        view.network_types = [agent_type]
+        view.link_dict = {link_id: link for link_id, link in self.link_dict.items() if agent_type in link.allowed_uses}
+        used_node_id_set = set()
+        for link in view.link_dict.values():
+            used_node_id_set.add(link.from_node.node_id)
+            used_node_id_set.add(link.to_node.node_id)
+        view.node_dict = {node_id: node for node_id, node in self.node_dict.items() if node_id in used_node_id_set}
+        view.max_node_id, view.max_link_id = self.max_node_id, self.max_link_id
+        view.max_poi_id = self.max_poi_id
+        view.POI_list = self.POI_list
+        view.poi_max_distance, view.poi_link_types = self.poi_max_distance, self.poi_link_types
+        view.node_other_attrs, view.link_other_attrs = self.node_other_attrs, self.link_other_attrs
+        view.max_intersection_id, view.is_simplified = self.max_intersection_id, self.is_simplified
+        view.movement_dict = {movement_id: movement for movement_id, movement in self.movement_dict.items()
+                              if agent_type in movement.allowed_uses}
+        view.max_movement_id = self.max_movement_id
+        return view
+
+    def get_csr_graph(self):
+        """
+        返回网络的CSR邻接表（graph_csr.CSRGraph），可用graph_csr.save_csr_graph保存为.npy/.npz，
+        或用to_scipy转换后直接调用scipy.sparse.csgraph中的算法。
+        """
+        from graph_csr import get_csr_graph
+        return get_csr_graph(self)
@@ -0,0 +1,87 @@
+# 网络的连通分量分析：基于CSR邻接表用scipy.sparse.csgraph计算弱连通和强连通分量，
+# 为节点和link标注分量编号（按分量大小排序，0为最大分量），并可只保留最大分量
+import numpy as np
+
+from graph_csr import get_csr_graph
+
+try:
+    from scipy.sparse import csgraph
+except ImportError:
+    csgraph = None
+
+
+COMPONENT_ATTRS = ('weak_component_id', 'strong_component_id')
+
+
+def _rank_by_size(labels):
+    # 分量编号按节点数从大到小重新排列，节点数相同时保持原有顺序
+    counts = np.bincount(labels)
+    rank = np.empty(len(counts), dtype=np.int64)
+    rank[np.argsort(-counts, kind='stable')] = np.arange(len(counts))
+    return rank[labels]
+
+
+def get_component_labels(network, connection='weak'):
+    """
+    返回与network.node_dict顺序一致的分量编号数组，connection为'weak'或'strong'。
+    """
+    if connection not in ('weak', 'strong'):
+        raise ValueError(f"connection应为'weak'或'strong'，而不是{connection!r}")
+    if csgraph is None:
+        raise ImportError('连通分量分析需要安装scipy：pip install scipy')
+    graph = get_csr_graph(network)
+    _, labels = csgraph.connected_components(graph.to_scipy(), directed=True, connection=connection)
+    return _rank_by_size(labels)
+
+
+def _register_attrs(attr_list):
+    for attr_name in COMPONENT_ATTRS:
+        if attr_name not in attr_list:
+            attr_list.append(attr_name)
+
+
+def tag_components(network):
+    """
+    在node和link的other_attrs中写入weak_component_id、strong_component_id，并作为输出列。
+    link的弱连通分量即其端点的分量；两端点不在同一强连通分量时link的strong_component_id为None。
+    返回(弱连通分量数, 强连通分量数)。
+    多模式网络按所有通行方式的link计算，单一模式可先用Network.get_mode_view取子网络。
+    """
+    node_list = list(network.node_dict.values())
+    node_no_dict = {node.node_id: no for no, node in enumerate(node_list)}
+    weak_labels = get_component_labels(network, 'weak').tolist()
+    strong_labels = get_component_labels(network, 'strong').tolist()
+    for node, weak_label, strong_label in zip(node_list, weak_labels, strong_labels):
+        node.other_attrs['weak_component_id'] = weak_label
+        node.other_attrs['strong_component_id'] = strong_label
+    for link in network.link_dict.values():
+        from_no, to_no = node_no_dict[link.from_node.node_id], node_no_dict[link.to_node.node_id]
+        link.other_attrs['weak_component_id'] = weak_labels[from_no]
+        link.other_attrs['strong_component_id'] = strong_labels[from_no] \
+            if strong_labels[from_no] == strong_labels[to_no] else None
+    _register_attrs(network.node_other_attrs)
+    _register_attrs(network.link_other_attrs)
+    number_of_weak = max(weak_labels) + 1 if weak_labels else 0
+    number_of_strong = max(strong_labels) + 1 if strong_labels else 0
+    print(f'弱连通分量{number_of_weak}个，强连通分量{number_of_strong}个')
+    return number_of_weak, number_of_strong
+
+
+def keep_largest_component(network, connection='strong'):
+    """
+    只保留最大的弱连通（connection='weak'）或强连通（'strong'）分量中的节点，以及两端都在其中的link，
+    其余节点和link从网络中删除。应在生成POI之前调用，使POI只分配到保留的节点上。
+    """
+    number_of_nodes, number_of_links = len(network.node_dict), len(network.link_dict)
+    labels = get_component_labels(network, connection)
+    keep_node_id_set = {node_id for node_id, label in zip(network.node_dict, labels.tolist()) if label == 0}
+    network.node_dict = {node_id: node for node_id, node in network.node_dict.items() if node_id in keep_node_id_set}
+    network.link_dict = {link_id: link for link_id, link in network.link_dict.items()
+                         if link.from_node.node_id in keep_node_id_set and link.to_node.node_id in keep_node_id_set}
+    link_dict = network.link_dict
+    for node in network.node_dict.values():
+        node.incoming_link_list = [link for link in node.incoming_link_list if link_dict.get(link.link_id) is link]
+        node.outgoing_link_list = [link for link in node.outgoing_link_list if link_dict.get(link.link_id) is link]
+    network.is_simplified = True
+    print(f'保留最大{"强" if connection == "strong" else "弱"}连通分量：节点{number_of_nodes}个 -> '
+          f'{len(network.node_dict)}个，路径{number_of_links}条 -> {len(network.link_dict)}条')
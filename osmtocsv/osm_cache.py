@@ -0,0 +1,210 @@
+# 解析后的NetworkInOsm的磁盘缓存
+# 以源文件内容的哈希和解析参数作为键，按列保存为npz文件（不使用pickle），源文件变化时自动失效
+from osmclasses import NodeTable, WayInOsm, RelationInOsm, NetworkInOsm, create_osm_node_dict
+from process_geo_information import GeoTransformer
+import numpy as np
+import hashlib
+import shapely
+import json
+import glob
+import os
+
+CACHE_VERSION = 3
+
+# handler中解析的way属性
+_WAY_STR_ATTRS = ['osm_way_id', 'highway', 'railway', 'aeroway', 'name', 'turn_lanes', 'turn_lanes_forward',
+                  'turn_lanes_backward', 'junction', 'area', 'motor_vehicle', 'motorcar', 'service', 'foot',
+                  'bicycle', 'building', 'amenity', 'leisure']
+_WAY_INT_ATTRS = ['lanes', 'forward_lanes', 'backward_lanes', 'maxspeed']
+_RELATION_STR_ATTRS = ['osm_relation_id', 'name', 'building', 'amenity', 'leisure']
+# 点poi记录中的字符串字段（经纬度单独保存为float列）
+_POI_NODE_STR_ATTRS = ['osm_node_id', 'name', 'building', 'amenity', 'leisure', 'shop', 'way']
+
+
+def get_cache_path(filename, cache_dir, settings):
+    """
+    缓存文件路径：源文件名.键哈希.内容哈希.npz。
+    键哈希由源文件的绝对路径和解析参数计算，同一文件的不同参数、其他目录中的同名文件各有自己的缓存；
+    内容哈希为文件内容的sha256，源文件变化后同一键下的旧缓存由remove_stale_cache删除。
+    """
+    key = dict(settings, path=os.path.abspath(filename), cache_version=CACHE_VERSION)
+    key_hash = hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return os.path.join(cache_dir, f'{os.path.basename(filename)}.{key_hash}.{sha.hexdigest()[:16]}.npz')
+
+
+# 字符串列保存为utf-8字节 + 偏移 + 空值标记，整数列保存为int64 + 空值标记
+def _pack_str(data, name, values):
+    encoded = [b'' if value is None else value.encode() for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    data[name + '.bytes'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    data[name + '.offsets'] = offsets
+    data[name + '.null'] = np.array([value is None for value in values], dtype=bool)
+
+
+def _unpack_str(data, name):
+    buf = data[name + '.bytes'].tobytes()
+    offsets = data[name + '.offsets'].tolist()
+    null = data[name + '.null'].tolist()
+    return [None if null[i] else buf[offsets[i]:offsets[i + 1]].decode() for i in range(len(null))]
+
+
+def _pack_int(data, name, values):
+    data[name + '.value'] = np.array([0 if value is None else value for value in values], dtype=np.int64)
+    data[name + '.null'] = np.array([value is None for value in values], dtype=bool)
+
+
+def _unpack_int(data, name):
+    null = data[name + '.null'].tolist()
+    return [None if null[i] else value for i, value in enumerate(data[name + '.value'].tolist())]
+
+
+def _get_offsets(list_of_lists):
+    offsets = np.zeros(len(list_of_lists) + 1, dtype=np.int64)
+    np.cumsum([len(values) for values in list_of_lists], out=offsets[1:])
+    return offsets
+
+
+def _pack_list(data, name, list_of_arrays, dtype):
+    offsets = _get_offsets(list_of_arrays)
+    data[name + '.offsets'] = offsets
+    if offsets[-1] == 0:
+        data[name + '.values'] = np.zeros(0, dtype=dtype)
+    else:
+        data[name + '.values'] = np.concatenate([np.asarray(values, dtype=dtype) for values in list_of_arrays])
+
+
+def _unpack_list(data, name):
+    offsets = data[name + '.offsets']
+    values = data[name + '.values']
+    return [values[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+def save_osm_network(osmnet, cache_path):
+    data = {}
+    table = osmnet.node_table
+    for column in ('osm_node_id', 'lon', 'lat', 'x', 'y', 'in_region'):
+        data['node.' + column] = getattr(table, column)
+    tagged_node_list = [node for node in osmnet.osm_node_dict.values()
+                        if (node.name is not None) or (node.osm_highway is not None)]
+    data['node_tag.row'] = np.array([node.row for node in tagged_node_list], dtype=np.int64)
+    _pack_str(data, 'node_tag.name', [node.name for node in tagged_node_list])
+    _pack_str(data, 'node_tag.highway', [node.osm_highway for node in tagged_node_list])
+
+    # 除osm_way_dict中的way外，还需保存被裁剪掉但仍被poi关系引用的way
+    way_list = list(osmnet.osm_way_dict.values())
+    way_id_set = set(osmnet.osm_way_dict)
+    for relation in osmnet.osm_relation_list:
+        for member in relation.member_list:
+            if isinstance(member, WayInOsm) and member.osm_way_id not in way_id_set:
+                way_list.append(member)
+                way_id_set.add(member.osm_way_id)
+    data['way.in_way_dict'] = np.array([way.osm_way_id in osmnet.osm_way_dict for way in way_list], dtype=bool)
+    for attr in _WAY_STR_ATTRS:
+        _pack_str(data, 'way.' + attr, [getattr(way, attr) for way in way_list])
+    for attr in _WAY_INT_ATTRS:
+        _pack_int(data, 'way.' + attr, [getattr(way, attr) for way in way_list])
+    data['way.oneway'] = np.array([-1 if way.oneway is None else int(way.oneway) for way in way_list], dtype=np.int8)
+    data['way.is_reversed'] = np.array([way.is_reversed for way in way_list], dtype=bool)
+    _pack_list(data, 'way.ref_node_id', [way.ref_node_id_list for way in way_list], np.int64)
+    _pack_list(data, 'way.ref_node_row', [way.ref_node_rows for way in way_list], np.int64)
+
+    relation_list = osmnet.osm_relation_list
+    for attr in _RELATION_STR_ATTRS:
+        _pack_str(data, 'relation.' + attr, [getattr(relation, attr) for relation in relation_list])
+    for attr in ('member_id_list', 'member_type_list', 'member_role_list'):
+        list_of_lists = [getattr(relation, attr) for relation in relation_list]
+        _pack_str(data, f'relation.{attr}.item', [value for values in list_of_lists for value in values])
+        data[f'relation.{attr}.offsets'] = _get_offsets(list_of_lists)
+
+    POI_node_list = osmnet.POI_node_list
+    data['poi_node.lon'] = np.array([record[1] for record in POI_node_list], dtype=np.float64)
+    data['poi_node.lat'] = np.array([record[2] for record in POI_node_list], dtype=np.float64)
+    for field_no, attr in zip((0, 3, 4, 5, 6, 7, 8), _POI_NODE_STR_ATTRS):
+        _pack_str(data, 'poi_node.' + attr, [record[field_no] for record in POI_node_list])
+
+    data['bounds'] = np.frombuffer(shapely.to_wkb(osmnet.bounds), dtype=np.uint8)
+    data['GT'] = np.array([osmnet.GT.central_lon, osmnet.GT.central_lat, osmnet.GT.northern], dtype=np.float64)
+    data['is_clipped'] = np.array(osmnet.is_clipped)
+
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    tmp_path = cache_path + '.tmp.npz'
+    np.savez(tmp_path, **data)
+    os.replace(tmp_path, cache_path)
+
+
+def load_osm_network(cache_path):
+    data = np.load(cache_path, allow_pickle=False)
+    osmnet = NetworkInOsm()
+    osmnet.bounds = shapely.from_wkb(data['bounds'].tobytes())
+    shapely.prepare(osmnet.bounds)
+    osmnet.is_clipped = bool(data['is_clipped'])
+    central_lon, central_lat, northern = data['GT'].tolist()
+    osmnet.GT = GeoTransformer(central_lon, central_lat, bool(northern))
+
+    osmnet.node_table = NodeTable(data['node.osm_node_id'], data['node.lon'], data['node.lat'], data['node.x'],
+                                  data['node.y'], data['node.in_region'])
+    node_tag_dict = dict(zip(data['node_tag.row'].tolist(),
+                             zip(_unpack_str(data, 'node_tag.name'), _unpack_str(data, 'node_tag.highway'))))
+    osmnet.osm_node_dict = create_osm_node_dict(osmnet.node_table, node_tag_dict)
+    node_list = list(osmnet.osm_node_dict.values())
+
+    in_way_dict = data['way.in_way_dict'].tolist()
+    way_attr_dict = {attr: _unpack_str(data, 'way.' + attr) for attr in _WAY_STR_ATTRS}
+    way_attr_dict.update({attr: _unpack_int(data, 'way.' + attr) for attr in _WAY_INT_ATTRS})
+    oneway_list = data['way.oneway'].tolist()
+    is_reversed_list = data['way.is_reversed'].tolist()
+    ref_node_id_list = _unpack_list(data, 'way.ref_node_id')
+    ref_node_row_list = _unpack_list(data, 'way.ref_node_row')
+    all_way_dict = {}
+    for way_no in range(len(in_way_dict)):
+        way = WayInOsm()
+        for attr, values in way_attr_dict.items():
+            setattr(way, attr, values[way_no])
+        way.oneway = None if oneway_list[way_no] == -1 else bool(oneway_list[way_no])
+        way.is_reversed = is_reversed_list[way_no]
+        way.ref_node_id_list = ref_node_id_list[way_no]
+        way.ref_node_rows = ref_node_row_list[way_no]
+        way.ref_node_list = [node_list[row] for row in way.ref_node_rows.tolist()]
+        all_way_dict[way.osm_way_id] = way
+        if in_way_dict[way_no]:
+            osmnet.osm_way_dict[way.osm_way_id] = way
+
+    relation_attr_dict = {attr: _unpack_str(data, 'relation.' + attr) for attr in _RELATION_STR_ATTRS}
+    member_attr_dict = {}
+    for attr in ('member_id_list', 'member_type_list', 'member_role_list'):
+        items = _unpack_str(data, f'relation.{attr}.item')
+        offsets = data[f'relation.{attr}.offsets'].tolist()
+        member_attr_dict[attr] = [items[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+    for relation_no in range(len(relation_attr_dict['osm_relation_id'])):
+        relation = RelationInOsm()
+        for attr, values in relation_attr_dict.items():
+            setattr(relation, attr, values[relation_no])
+        for attr, values in member_attr_dict.items():
+            setattr(relation, attr, values[relation_no])
+        # 与get_relations相同的成员解析方式
+        for member_no, member_id in enumerate(relation.member_id_list):
+            member_type = relation.member_type_list[member_no]
+            if member_type == 'n':
+                relation.member_list.append(osmnet.osm_node_dict[member_id])
+            elif member_type == 'w':
+                relation.member_list.append(all_way_dict[member_id])
+        osmnet.osm_relation_list.append(relation)
+
+    poi_node_attr_list = [_unpack_str(data, 'poi_node.' + attr) for attr in _POI_NODE_STR_ATTRS]
+    osm_node_ids, names, buildings, amenities, leisures, shops, way_pois = poi_node_attr_list
+    osmnet.POI_node_list = list(zip(osm_node_ids, data['poi_node.lon'].tolist(), data['poi_node.lat'].tolist(),
+                                    names, buildings, amenities, leisures, shops, way_pois))
+    return osmnet
+
+
+def remove_stale_cache(cache_path):
+    # 键哈希相同（同一源文件、同一解析参数）而内容哈希不同的旧缓存已失效，直接删除
+    prefix = cache_path[:-len('.npz')].rsplit('.', 1)[0]
+    for path in glob.glob(glob.escape(prefix) + '.*.npz'):
+        if os.path.abspath(path) != os.path.abspath(cache_path):
+            os.remove(path)
@@ -0,0 +1,553 @@
+# 根据OSM变更文件（.osc）增量更新已构建的网络
+# 只对变更的way以及经过坐标变化或交叉状态变化的节点的道路重新预处理和切分，
+# 未变更的node_id、link_id、poi_id保持不变，并只输出变化的部分
+import os
+import time
+
+import numpy as np
+import shapely
+
+from get_from_osm import MyHandler
+from osmclasses import NodeInOsm, WayInOsm
+from build_net import (get_agent_mask, classify_way, mark_pure_cycle, get_way_link_node_lists,
+                       create_node_from_osm_node)
+from my_network import Link, Network
+from poi_methods import get_poi_from_way, get_poi_from_relation, get_poi_from_node, NearestNodeIndex
+from process_geo_information import get_lines_from_rows, concat_rows
+from output_columns import get_node_columns, get_link_columns, get_poi_columns
+from run import write_table
+
+
+class ChangeHandler(MyHandler):
+    """
+    读取.osc文件。新建和修改的对象按MyHandler的方式解析，删除的对象只记录ID，
+    所有出现在变更文件中的关系ID都会记录，以便删除不再是poi的关系。
+    """
+    def __init__(self):
+        MyHandler.__init__(self)
+        self.deleted_node_id_set = set()
+        self.deleted_way_id_set = set()
+        self.changed_relation_id_set = set()
+
+    def node(self, n):
+        if n.deleted:
+            self.deleted_node_id_set.add(str(n.id))
+            return
+        MyHandler.node(self, n)
+
+    def way(self, w):
+        if w.deleted:
+            self.deleted_way_id_set.add(str(w.id))
+            self.osm_way_dict.pop(str(w.id), None)
+            return
+        self.deleted_way_id_set.discard(str(w.id))
+        MyHandler.way(self, w)
+
+    def relation(self, r):
+        self.changed_relation_id_set.add(str(r.id))
+        if r.deleted: return
+        MyHandler.relation(self, r)
+
+
+class NetworkDelta:
+    # 一次增量更新中新增、修改和删除的node、link、poi
+    def __init__(self):
+        self.node_dict = {'add': [], 'modify': [], 'delete': []}
+        self.link_dict = {'add': [], 'modify': [], 'delete': []}
+        self.poi_dict = {'add': [], 'modify': [], 'delete': []}
+        # 引用了未加载节点而未能应用的way，这些way保持变更前的状态，网络与变更文件不完全一致
+        self.skipped_way_id_list = []
+
+
+def _build_node_way_index(way_list):
+    # 节点行号 -> way序号的倒排索引，按行号排序，is_end标记该节点是否为way的首尾节点
+    if not way_list:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool)
+    rows, offsets = concat_rows([way.ref_node_rows for way in way_list])
+    way_no_array = np.repeat(np.arange(len(way_list)), np.diff(offsets))
+    is_end = np.zeros(len(rows), dtype=bool)
+    is_end[offsets[:-1][np.diff(offsets) > 0]] = True
+    is_end[offsets[1:][np.diff(offsets) > 0] - 1] = True
+    order = np.argsort(rows, kind='stable')
+    return rows[order], way_no_array[order], is_end[order]
+
+
+class NodeWayIndex:
+    """
+    道路和poi way的节点倒排索引，第一次增量更新时建立，保存在osmnet.node_way_index中并随变更维护。
+    建立时的way按节点行号排序存放在数组中，被替换或删除的way只标记失效，之后新增的way记录在字典中，
+    变化的way数超过已索引way数的1/4时重建。
+    """
+    def __init__(self, link_way_list, POI_way_list):
+        self._build([(way, True) for way in link_way_list] + [(way, False) for way in POI_way_list])
+
+    def _build(self, entry_list):
+        self.way_list = [way for way, _ in entry_list]
+        self.is_link_array = np.array([is_link for _, is_link in entry_list], dtype=bool)
+        self.way_no_dict = {way.osm_way_id: way_no for way_no, way in enumerate(self.way_list)}
+        self.alive = np.ones(len(self.way_list), dtype=bool)
+        self.sorted_rows, self.way_no_array, self.is_end = _build_node_way_index(self.way_list)
+        self.extra_way_dict = {}  # osm_way_id -> (way, is_link)
+        self.extra_row_dict = {}  # 节点行号 -> [(osm_way_id, is_end), ...]
+        self.number_of_changes = 0
+
+    def _rebuild(self):
+        entry_list = [(way, is_link) for way, is_link, alive in
+                      zip(self.way_list, self.is_link_array.tolist(), self.alive.tolist()) if alive]
+        self._build(entry_list + list(self.extra_way_dict.values()))
+
+    def remove(self, osm_way_id):
+        way_no = self.way_no_dict.pop(osm_way_id, None)
+        if way_no is not None:
+            self.alive[way_no] = False
+        elif osm_way_id in self.extra_way_dict:
+            way, _ = self.extra_way_dict.pop(osm_way_id)
+            for row in set(way.ref_node_rows.tolist()):
+                entry_list = [entry for entry in self.extra_row_dict[row] if entry[0] != osm_way_id]
+                if entry_list:
+                    self.extra_row_dict[row] = entry_list
+                else:
+                    del self.extra_row_dict[row]
+        else:
+            return
+        self.number_of_changes += 1
+
+    def add(self, way, is_link):
+        self.remove(way.osm_way_id)
+        self.extra_way_dict[way.osm_way_id] = (way, is_link)
+        rows = way.ref_node_rows.tolist()
+        for no, row in enumerate(rows):
+            self.extra_row_dict.setdefault(row, []).append((way.osm_way_id, no == 0 or no == len(rows) - 1))
+        self.number_of_changes += 1
+        if self.number_of_changes > max(len(self.way_list) // 4, 256):
+            self._rebuild()
+
+    def _lookup(self, rows):
+        # 数组部分中经过这些节点的有效记录：(查询序号, way序号, 是否首尾节点)
+        starts = np.searchsorted(self.sorted_rows, rows, side='left')
+        counts = np.searchsorted(self.sorted_rows, rows, side='right') - starts
+        query_no = np.repeat(np.arange(len(rows)), counts)
+        positions = np.arange(len(query_no)) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        way_nos = self.way_no_array[positions]
+        mask = self.alive[way_nos]
+        return query_no[mask], way_nos[mask], self.is_end[positions][mask]
+
+    def get_ways(self, rows, link_only=False):
+        # 经过这些节点的way，返回{osm_way_id: (way, is_link)}
+        rows = np.array(sorted(rows), dtype=np.int64)
+        _, way_nos, _ = self._lookup(rows)
+        way_dict = {}
+        for way_no in np.unique(way_nos).tolist():
+            is_link = bool(self.is_link_array[way_no])
+            if is_link or not link_only:
+                way_dict[self.way_list[way_no].osm_way_id] = (self.way_list[way_no], is_link)
+        for row in rows.tolist():
+            for osm_way_id, _ in self.extra_row_dict.get(row, ()):
+                way, is_link = self.extra_way_dict[osm_way_id]
+                if is_link or not link_only:
+                    way_dict[osm_way_id] = (way, is_link)
+        return way_dict
+
+    def get_crossing_info(self, rows):
+        # 节点在道路way中出现的次数，以及是否为某条道路的首尾节点
+        query_no, way_nos, is_end = self._lookup(rows)
+        link_mask = self.is_link_array[way_nos]
+        usage_counts = np.bincount(query_no[link_mask], minlength=len(rows))
+        end_counts = np.bincount(query_no[link_mask & is_end], minlength=len(rows))
+        for no, row in enumerate(rows.tolist()):
+            for osm_way_id, is_end_node in self.extra_row_dict.get(row, ()):
+                if self.extra_way_dict[osm_way_id][1]:
+                    usage_counts[no] += 1
+                    end_counts[no] += is_end_node
+        return usage_counts, end_counts > 0
+
+
+def apply_node_changes(osmnet, h):
+    """
+    将变更的节点写入NodeTable和osm_node_dict，返回(变更（含删除）节点的行号集合, 坐标或是否在区域内变化以及删除的
+    节点的行号集合, 修改过的NodeInOsm列表)。
+    """
+    table = osmnet.node_table
+    changed_row_set = set()
+    moved_row_set = set()
+    modified_node_list = []
+    lons = np.array(h.osm_node_lon_list, dtype=np.float64)
+    lats = np.array(h.osm_node_lat_list, dtype=np.float64)
+    if len(lons):
+        xs, ys = osmnet.GT.from_latlon(lons, lats)
+        in_region = shapely.intersects_xy(osmnet.bounds, lons, lats) if osmnet.is_clipped \
+            else np.ones(len(lons), dtype=bool)
+    for no, osm_node_id in enumerate(h.osm_node_id_list):
+        key = str(osm_node_id)
+        name, highway = h.osm_node_tag_dict.get(no, (None, None))
+        ctrl_type = 'signal' if (highway is not None) and 'signal' in highway else None
+        osmnode = osmnet.osm_node_dict.get(key)
+        lon, lat, x, y = float(lons[no]), float(lats[no]), float(xs[no]), float(ys[no])
+        if osmnode is None:
+            row = table.append(osm_node_id, lon, lat, x, y, bool(in_region[no]))
+            osmnet.osm_node_dict[key] = NodeInOsm(name, key, table, row, highway, ctrl_type)
+        else:
+            row = osmnode.row
+            if (table._lon[row], table._lat[row], table._in_region[row]) != (lon, lat, in_region[no]):
+                moved_row_set.add(row)
+            table.update(row, lon, lat, x, y, bool(in_region[no]))
+            osmnode.name, osmnode.osm_highway, osmnode.ctrl_type = name, highway, ctrl_type
+            changed_row_set.add(osmnode.row)
+            modified_node_list.append(osmnode)
+    for key in h.deleted_node_id_set:
+        osmnode = osmnet.osm_node_dict.pop(key, None)
+        if osmnode is not None:
+            changed_row_set.add(osmnode.row)
+            moved_row_set.add(osmnode.row)
+    return changed_row_set, moved_row_set, modified_node_list
+
+
+def apply_way_changes(osmnet, h):
+    """
+    用变更文件中的way替换osm_way_dict中的旧way，返回({osm_way_id: 旧way}, 未能应用的osm_way_id列表)，新建的way旧值为None。
+    变更文件中的节点已由apply_node_changes加入osm_node_dict；仍引用了未加载节点的way（如两遍读取模式下
+    原文件中未加载、变更文件中也没有的节点）无法构建，保留旧way并记入未能应用的列表。
+    """
+    old_way_dict = {}
+    skipped_way_id_list = []
+    for osm_way_id in h.deleted_way_id_set:
+        old_way_dict[osm_way_id] = osmnet.osm_way_dict.pop(osm_way_id, None)
+    for osm_way_id, way in h.osm_way_dict.items():
+        try:
+            way.ref_node_list = [osmnet.osm_node_dict[str(ref)] for ref in way.ref_node_id_list]
+        except KeyError as e:
+            print(f'way{osm_way_id}引用的节点{e.args[0]}未加载，该way的变更未应用')
+            skipped_way_id_list.append(osm_way_id)
+            continue
+        way.ref_node_rows = np.array([node.row for node in way.ref_node_list], dtype=np.int64)
+        old_way_dict[osm_way_id] = osmnet.osm_way_dict.get(osm_way_id)
+        osmnet.osm_way_dict[osm_way_id] = way
+    return old_way_dict, skipped_way_id_list
+
+
+def apply_relation_changes(osmnet, h, affected_way_id_set, changed_row_set):
+    """
+    替换变更的关系，返回需要重新生成poi的关系ID集合（变更的关系和成员发生变化的关系）。
+    """
+    affected_relation_id_set = set(h.changed_relation_id_set)
+    for relation in osmnet.osm_relation_list:
+        for member in relation.member_list:
+            if (member.osm_way_id in affected_way_id_set) if isinstance(member, WayInOsm) \
+                    else (member.row in changed_row_set):
+                affected_relation_id_set.add(relation.osm_relation_id)
+                break
+
+    relation_list = [relation for relation in osmnet.osm_relation_list
+                     if relation.osm_relation_id not in h.changed_relation_id_set]
+    for relation in h.relation_list:
+        try:
+            for member_no, member_id in enumerate(relation.member_id_list):
+                member_type = relation.member_type_list[member_no]
+                if member_type == 'n':
+                    relation.member_list.append(osmnet.osm_node_dict[member_id])
+                elif member_type == 'w':
+                    relation.member_list.append(osmnet.osm_way_dict[member_id])
+        except KeyError as e:
+            print(f'关系{relation.osm_relation_id}的成员{e.args[0]}不存在，忽略该关系')
+            continue
+        relation_list.append(relation)
+    # 成员way被替换时，关系引用新的way对象
+    for relation in relation_list:
+        if relation.osm_relation_id not in affected_relation_id_set: continue
+        for member_no, member in enumerate(relation.member_list):
+            if isinstance(member, WayInOsm):
+                relation.member_list[member_no] = osmnet.osm_way_dict.get(member.osm_way_id, member)
+    osmnet.osm_relation_list = relation_list
+    return affected_relation_id_set
+
+
+def _get_link_key(link):
+    return link.osm_way_id, link.from_node.osm_node_id, link.to_node.osm_node_id
+
+
+def _get_link_signature(link):
+    return (link.name, link.from_node.node_id, link.to_node.node_id, link.lanes, link.free_speed, link.capacity,
+            link.link_type_name, link.link_type, tuple(link.allowed_uses), link.from_bidirectional_way,
+            link.is_link)
+
+
+def _get_node_signature(node):
+    return node.name, node.osm_highway, node.ctrl_type, shapely.to_wkb(node.geometry)
+
+
+def _get_poi_signature(poi):
+    return (poi.name, poi.building, poi.amenity, poi.leisure, poi.shop, poi.way, shapely.to_wkb(poi.geometry))
+
+
+def update_links(osmnet, network, resegment_way_list, removed_way_id_set, delta):
+    """
+    删除受影响way的旧link并重新切分生成，(osm_way_id, 起点, 终点)相同的link沿用原link_id。
+    """
+    old_link_dict = {}
+    endpoint_node_list = []
+    for osm_way_id in removed_way_id_set:
+        for link in network.way_link_dict.pop(osm_way_id, ()):
+            if network.link_dict.get(link.link_id) is not link: continue
+            endpoint_node_list += [link.from_node, link.to_node]
+            old_link_dict.setdefault(_get_link_key(link), []).append(link)
+            link.from_node.outgoing_link_list.remove(link)
+            link.to_node.incoming_link_list.remove(link)
+            del network.link_dict[link.link_id]
+
+    link_list = []
+    link_row_list = []
+    for way in resegment_way_list:
+        if way.is_pure_cycle: continue
+        for direction, m_link_node_list in get_way_link_node_lists(way, network):
+            create_node_from_osm_node(network, m_link_node_list[0])
+            create_node_from_osm_node(network, m_link_node_list[-1])
+            key = (way.osm_way_id, m_link_node_list[0].osm_node_id, m_link_node_list[-1].osm_node_id)
+            old_links = old_link_dict.get(key)
+            if old_links:
+                old_link = old_links.pop(0)
+                link_id = old_link.link_id
+            else:
+                old_link = None
+                link_id = network.max_link_id
+                network.max_link_id += 1
+            link = Link(link_id)
+            link.generate_from_osmway(way, direction, m_link_node_list, network.default_lanes, network.default_speed,
+                                      network.default_capacity, build_geometry=False)
+            network.link_dict[link_id] = link
+            network.way_link_dict.setdefault(way.osm_way_id, []).append(link)
+            link_list.append((link, old_link))
+            link_row_list.append([node.row for node in m_link_node_list])
+
+    rows, offsets = concat_rows(link_row_list)
+    lines, lines_xy = get_lines_from_rows(network.node_table, rows, offsets)
+    for link_no, (link, old_link) in enumerate(link_list):
+        link.geometry, link.geometry_xy = lines[link_no], lines_xy[link_no]
+    # 几何整体向量化比较，两者都为空也视为相同
+    old_geometries = np.array([old_link.geometry if old_link is not None else None for _, old_link in link_list],
+                              dtype=object)
+    same_geometry = (shapely.equals_exact(lines, old_geometries, tolerance=0) |
+                     (shapely.is_missing(lines) & shapely.is_missing(old_geometries))).tolist()
+    for link_no, (link, old_link) in enumerate(link_list):
+        if old_link is None:
+            delta.link_dict['add'].append(link)
+        elif (not same_geometry[link_no]) or _get_link_signature(link) != _get_link_signature(old_link):
+            delta.link_dict['modify'].append(link)
+    for old_links in old_link_dict.values():
+        delta.link_dict['delete'].extend(old_links)
+    return endpoint_node_list
+
+
+def update_nodes(osmnet, network, endpoint_node_list, modified_node_list, old_max_node_id, delta):
+    # 删除不再连接任何link的节点，更新坐标或标签变化的节点
+    for node in endpoint_node_list:
+        if node.incoming_link_list or node.outgoing_link_list: continue
+        if network.node_dict.pop(node.node_id, None) is None: continue
+        osmnode = osmnet.osm_node_dict.get(node.osm_node_id)
+        if (osmnode is not None) and (osmnode.node is node): osmnode.node = None
+        if node.node_id < old_max_node_id: delta.node_dict['delete'].append(node)
+    for node_id in range(old_max_node_id, network.max_node_id):
+        if node_id in network.node_dict:
+            delta.node_dict['add'].append(network.node_dict[node_id])
+
+    for osmnode in modified_node_list:
+        node = osmnode.node
+        if (node is None) or (node.node_id >= old_max_node_id): continue
+        signature = _get_node_signature(node)
+        node.generate_from_osmnode(osmnode)
+        if _get_node_signature(node) != signature:
+            delta.node_dict['modify'].append(node)
+
+
+def _get_poi_key(poi):
+    if poi.osm_way_id is not None: return 'way', poi.osm_way_id
+    if poi.osm_relation_id is not None: return 'relation', poi.osm_relation_id
+    return 'node', poi.osm_node_id
+
+
+def update_pois(osmnet, network, poi_way_list, affected_way_id_set, affected_relation_id_set, h, delta):
+    """
+    重新生成受影响way、关系和节点的poi，osm_way_id、osm_relation_id或osm_node_id相同的poi沿用原poi_id。
+    返回(重新生成的poi列表, 被替换或删除的原poi列表)。
+    """
+    # 变更文件中的节点全部重新判断是否为点poi
+    changed_node_id_set = {str(osm_node_id) for osm_node_id in h.osm_node_id_list} | h.deleted_node_id_set
+    osmnet.POI_node_list = [record for record in osmnet.POI_node_list if record[0] not in changed_node_id_set] + \
+        h.poi_node_list
+
+    old_poi_dict = {}
+    POI_list = []
+    for poi in network.POI_list:
+        if poi.osm_way_id in affected_way_id_set or poi.osm_relation_id in affected_relation_id_set or \
+                poi.osm_node_id in changed_node_id_set:
+            old_poi_dict[_get_poi_key(poi)] = poi
+        else:
+            POI_list.append(poi)
+
+    old_poi_list = list(old_poi_dict.values())
+    relation_list = [relation for relation in osmnet.osm_relation_list
+                     if relation.osm_relation_id in affected_relation_id_set]
+    new_poi_list = get_poi_from_way(poi_way_list, network.bounds) + \
+        get_poi_from_relation(relation_list, network.bounds) + \
+        get_poi_from_node(h.poi_node_list, network.bounds, network.GT)
+    for poi in new_poi_list:
+        key = _get_poi_key(poi)
+        old_poi = old_poi_dict.pop(key, None)
+        if old_poi is None:
+            poi.poi_id = network.max_poi_id
+            network.max_poi_id += 1
+            delta.poi_dict['add'].append(poi)
+        else:
+            poi.poi_id = old_poi.poi_id
+            if _get_poi_signature(poi) != _get_poi_signature(old_poi):
+                delta.poi_dict['modify'].append(poi)
+        POI_list.append(poi)
+    delta.poi_dict['delete'].extend(old_poi_dict.values())
+    network.POI_list = POI_list
+    return new_poi_list, old_poi_list
+
+
+def apply_change_file(osmnet, network, osc_filename):
+    """
+    将.osc变更文件应用到由build_network(osmnet)构建的网络上，osmnet和network被原地更新。
+    返回NetworkDelta，可用output_delta输出变化的node、link、poi。
+    """
+    if network.is_simplified:
+        raise ValueError('已简化或裁剪连通分量的网络不能增量更新，请对未简化的网络应用变更文件后再简化')
+    print(f'读取OSM变更文件{osc_filename}')
+    start_time = time.time()
+    h = ChangeHandler()
+    h.apply_file(osc_filename)
+
+    old_max_node_id = network.max_node_id
+    # 第一次增量更新时建立节点-way索引、way-link索引和POI最近节点索引，之后随变更维护
+    if osmnet.node_way_index is None:
+        osmnet.node_way_index = NodeWayIndex(osmnet.link_way_list, osmnet.POI_way_list)
+    if network.way_link_dict is None:
+        network.way_link_dict = {}
+        for link in network.link_dict.values():
+            network.way_link_dict.setdefault(link.osm_way_id, []).append(link)
+    if network.nearest_node_index is None:
+        network.nearest_node_index = NearestNodeIndex(network, network.poi_max_distance, network.poi_link_types)
+    index = osmnet.node_way_index
+
+    changed_row_set, moved_row_set, modified_node_list = apply_node_changes(osmnet, h)
+    old_way_dict, skipped_way_id_list = apply_way_changes(osmnet, h)
+
+    # 受影响的way：变更的way和包含变更节点的way
+    node_way_dict = index.get_ways(changed_row_set)
+    affected_way_id_set = set(node_way_dict) | set(old_way_dict)
+
+    # 重新分类变更的way并更新索引，新旧way上的节点和标签变化的节点的交叉状态可能变化
+    crossing_node_dict = {osmnode.row: osmnode for osmnode in modified_node_list}
+    network_types_mask = get_agent_mask(network.network_types)
+    new_link_way_list = []
+    new_POI_way_list = []
+    for osm_way_id, old_way in old_way_dict.items():
+        index.remove(osm_way_id)
+        if old_way is not None:
+            for osmnode in old_way.ref_node_list:
+                crossing_node_dict[osmnode.row] = osmnode
+        way = osmnet.osm_way_dict.get(osm_way_id)
+        if way is None: continue
+        way_class = classify_way(way, network_types_mask)
+        if way_class == 'poi':
+            new_POI_way_list.append(way)
+            index.add(way, False)
+        elif way_class == 'link':
+            new_link_way_list.append(way)
+            index.add(way, True)
+            for osmnode in way.ref_node_list:
+                crossing_node_dict[osmnode.row] = osmnode
+    osmnet.link_way_list = [way for way in osmnet.link_way_list if way.osm_way_id not in old_way_dict] + \
+        new_link_way_list
+    osmnet.POI_way_list = [way for way in osmnet.POI_way_list if way.osm_way_id not in old_way_dict] + \
+        new_POI_way_list
+
+    # 重新计算交叉状态，规则与create_network_data_from_osmnet相同，记录交叉状态变化的节点
+    crossing_node_list = [osmnode for osmnode in crossing_node_dict.values()
+                          if osmnet.osm_node_dict.get(osmnode.osm_node_id) is osmnode]
+    rows = np.array([osmnode.row for osmnode in crossing_node_list], dtype=np.int64)
+    usage_counts, end_flags = index.get_crossing_info(rows)
+    flipped_row_set = set()
+    for osmnode, usage_count, is_end_node in zip(crossing_node_list, usage_counts.tolist(), end_flags.tolist()):
+        is_crossing = usage_count >= 2 or osmnode.ctrl_type == 'signal' or is_end_node
+        if is_crossing != osmnode.is_crossing: flipped_row_set.add(osmnode.row)
+        osmnode.usage_count = usage_count
+        osmnode.is_crossing = is_crossing
+
+    # 只重新切分变更的道路，以及经过坐标变化、删除或交叉状态变化的节点的道路
+    resegment_way_dict = {way.osm_way_id: way for way in new_link_way_list}
+    for osm_way_id, (way, _) in index.get_ways(moved_row_set | flipped_row_set, link_only=True).items():
+        resegment_way_dict[osm_way_id] = way
+    resegment_way_list = list(resegment_way_dict.values())
+    for way in resegment_way_list:
+        mark_pure_cycle(way)
+
+    delta = NetworkDelta()
+    delta.skipped_way_id_list = skipped_way_id_list
+    removed_way_id_set = set(old_way_dict) | set(resegment_way_dict)
+    endpoint_node_list = update_links(osmnet, network, resegment_way_list, removed_way_id_set, delta)
+    update_nodes(osmnet, network, endpoint_node_list, modified_node_list, old_max_node_id, delta)
+
+    affected_relation_id_set = apply_relation_changes(osmnet, h, affected_way_id_set, changed_row_set)
+    poi_way_list = [way for osm_way_id, (way, is_link) in node_way_dict.items()
+                    if not is_link and osm_way_id not in old_way_dict] + new_POI_way_list
+    new_poi_list, old_poi_list = update_pois(osmnet, network, poi_way_list, affected_way_id_set,
+                                             affected_relation_id_set, h, delta)
+
+    # 只重新分配受影响的POI的最近节点：新增或变化的节点，以及限制道路类型时连接的link变化的节点
+    changed_node_dict = {id(node): node for node in delta.node_dict['add'] + delta.node_dict['modify']}
+    if network.poi_link_types is not None:
+        for change in ('add', 'modify', 'delete'):
+            for link in delta.link_dict[change]:
+                for node in (link.from_node, link.to_node):
+                    if network.node_dict.get(node.node_id) is node: changed_node_dict[id(node)] = node
+    updated_node_list = network.nearest_node_index.update(old_poi_list, new_poi_list, delta.node_dict['delete'],
+                                                          list(changed_node_dict.values()))
+    # poi_id变化的原有节点记为修改
+    modified_node_id_set = {node.node_id for node in delta.node_dict['modify']}
+    for node in updated_node_list:
+        if (node.node_id < old_max_node_id) and (node.node_id not in modified_node_id_set):
+            delta.node_dict['modify'].append(node)
+            modified_node_id_set.add(node.node_id)
+
+    print(f'增量更新耗时：{time.time() - start_time:.2f} s，重新切分道路{len(resegment_way_list)}条')
+    for name, change_dict in (('节点', delta.node_dict), ('路径', delta.link_dict), ('poi', delta.poi_dict)):
+        print(f'{name}：新增{len(change_dict["add"])}个，修改{len(change_dict["modify"])}个，'
+              f'删除{len(change_dict["delete"])}个')
+    if skipped_way_id_list:
+        print(f'警告：{len(skipped_way_id_list)}条way引用了未加载的节点，变更未应用（见NetworkDelta.skipped_way_id_list），'
+              f'可用two_pass=False读取原文件')
+    return delta
+
+
+def _write_delta(filepath, change_dict, get_columns, network_attr):
+    # 在输出列前加一列change（add/modify/delete）
+    view = Network()
+    change_list = []
+    objs = []
+    for change in ('add', 'modify', 'delete'):
+        change_list += [change] * len(change_dict[change])
+        objs += change_dict[change]
+    if network_attr == 'POI_list':
+        view.POI_list = objs
+    else:
+        setattr(view, network_attr, {no: obj for no, obj in enumerate(objs)})
+    column_dict = {'change': change_list}
+    column_dict.update(get_columns(view))
+    # 几何格式与run.py中的完整输出相同
+    if network_attr == 'node_dict':
+        del column_dict['geometry']
+    elif network_attr == 'link_dict':
+        column_dict['geometry'] = shapely.to_wkt(column_dict['geometry'], rounding_precision=7, trim=False).tolist()
+    else:
+        column_dict['geometry'] = shapely.to_wkt(column_dict['geometry'], rounding_precision=-1).tolist()
+        column_dict['centroid'] = shapely.to_wkt(column_dict['centroid'], rounding_precision=-1).tolist()
+    write_table(filepath, list(column_dict), list(column_dict.values()))
+
+
+def output_delta(delta, output_folder, node_filename='node_delta.csv', link_filename='link_delta.csv',
+                 poi_filename='poi_delta.csv'):
+    _write_delta(os.path.join(output_folder, node_filename), delta.node_dict, get_node_columns, 'node_dict')
+    _write_delta(os.path.join(output_folder, link_filename), delta.link_dict, get_link_columns, 'link_dict')
+    _write_delta(os.path.join(output_folder, poi_filename), delta.poi_dict, get_poi_columns, 'POI_list')
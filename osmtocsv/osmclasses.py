@@ -1,20 +1,131 @@
 # osm数据类的定义
+# 使用__slots__去掉每个实例的__dict__，百万级对象时可显著降低内存占用
+from shapely import geometry
+import numpy as np
+
+
+class NodeTable:
+    """
+    列式存储的节点表。osm节点ID为int64，经纬度和投影坐标为float64，in_region为bool，行号即稠密索引。
+    NodeInOsm只记录行号，Point在访问geometry时才创建。
+    """
+    __slots__ = ('_osm_node_id', '_lon', '_lat', '_x', '_y', '_in_region', 'size')
+
+    def __init__(self, osm_node_id, lon, lat, x, y, in_region=None):
+        self._osm_node_id = np.asarray(osm_node_id, dtype=np.int64)
+        self._lon = np.asarray(lon, dtype=np.float64)
+        self._lat = np.asarray(lat, dtype=np.float64)
+        self._x = np.asarray(x, dtype=np.float64)
+        self._y = np.asarray(y, dtype=np.float64)
+        self.size = len(self._osm_node_id)
+        if in_region is None:
+            self._in_region = np.ones(self.size, dtype=bool)
+        else:
+            self._in_region = np.asarray(in_region, dtype=bool)
+
+    @property
+    def osm_node_id(self):
+        return self._osm_node_id[:self.size]
+
+    @property
+    def lon(self):
+        return self._lon[:self.size]
+
+    @property
+    def lat(self):
+        return self._lat[:self.size]
+
+    @property
+    def x(self):
+        return self._x[:self.size]
+
+    @property
+    def y(self):
+        return self._y[:self.size]
+
+    @property
+    def in_region(self):
+        return self._in_region[:self.size]
+
+    def append(self, osm_node_id, lon, lat, x, y, in_region=True):
+        # 追加一行（如边界节点），容量不足时成倍扩容，返回新行号
+        if self.size == len(self._osm_node_id):
+            capacity = max(2 * self.size, 16)
+            for name in ('_osm_node_id', '_lon', '_lat', '_x', '_y', '_in_region'):
+                old = getattr(self, name)
+                new = np.empty(capacity, dtype=old.dtype)
+                new[:self.size] = old[:self.size]
+                setattr(self, name, new)
+        row = self.size
+        self._osm_node_id[row] = osm_node_id
+        self._lon[row], self._lat[row] = lon, lat
+        self._x[row], self._y[row] = x, y
+        self._in_region[row] = in_region
+        self.size += 1
+        return row
+
+    def update(self, row, lon, lat, x, y, in_region=True):
+        self._lon[row], self._lat[row] = lon, lat
+        self._x[row], self._y[row] = x, y
+        self._in_region[row] = in_region
+
+    def lonlat(self, rows):
+        return np.column_stack((self._lon[rows], self._lat[rows]))
+
+    def xy(self, rows):
+        return np.column_stack((self._x[rows], self._y[rows]))
+
 
 class NodeInOsm:
-    def __init__(self, osm_node_name, osm_node_id, geometry, in_region, osm_highway, ctrl_type):
+    __slots__ = ('name', 'osm_node_id', 'table', 'row', 'osm_highway', 'ctrl_type', 'is_crossing', 'node',
+                 'usage_count')
+
+    def __init__(self, osm_node_name, osm_node_id, table, row, osm_highway, ctrl_type):
         self.name = osm_node_name
         self.osm_node_id = osm_node_id
-        self.geometry = geometry
-        self.geometry_xy = None
+        self.table = table
+        self.row = row
         self.osm_highway = osm_highway
         self.ctrl_type = ctrl_type
-        self.in_region = in_region
         self.is_crossing = False
         self.node = None
         self.usage_count = 0
 
+    @property
+    def geometry(self):
+        return geometry.Point(self.table._lon[self.row], self.table._lat[self.row])
+
+    @property
+    def geometry_xy(self):
+        return geometry.Point(self.table._x[self.row], self.table._y[self.row])
+
+    @property
+    def in_region(self):
+        return bool(self.table._in_region[self.row])
+
+
+def create_osm_node_dict(node_table, node_tag_dict):
+    """
+    为节点表的每一行创建NodeInOsm对象，node_tag_dict为{行号: (name, highway)}，只包含带标签的节点。
+    返回以str形式的osm节点ID为键的字典，字典顺序与行号顺序一致。
+    """
+    osm_node_dict = {}
+    for row, osm_node_id in enumerate(node_table.osm_node_id.tolist()):
+        osm_node_name, osm_highway = node_tag_dict.get(row, (None, None))
+        ctrl_type = 'signal' if (osm_highway is not None) and 'signal' in osm_highway else None
+        osm_node_id = str(osm_node_id)
+        osm_node_dict[osm_node_id] = NodeInOsm(osm_node_name, osm_node_id, node_table, row, osm_highway, ctrl_type)
+    return osm_node_dict
+
 
 class WayInOsm:
+    __slots__ = ('osm_way_id', 'highway', 'railway', 'aeroway', 'link_class', 'link_type_name', 'link_type',
+                 'is_link', 'name', 'lanes', 'forward_lanes', 'backward_lanes', 'turn_lanes', 'turn_lanes_forward',
+                 'turn_lanes_backward', 'maxspeed', 'oneway', 'junction', 'area', 'motor_vehicle', 'motorcar',
+                 'service', 'access', 'foot', 'bicycle', 'building', 'amenity', 'leisure', 'way_poi',
+                 'allowable_agent_type_list', 'allowed_uses', 'is_reversed', 'is_cycle', 'is_pure_cycle',
+                 'ref_node_id_list', 'ref_node_rows', 'ref_node_list', 'number_of_segments', 'segment_node_list')
+
     def __init__(self):
         self.osm_way_id = None
         self.highway = None
@@ -50,7 +161,8 @@ class WayInOsm:
         self.is_reversed = False
         self.is_cycle = False
         self.is_pure_cycle = False
-        self.ref_node_id_list = []
+        self.ref_node_id_list = []  # int64的osm节点ID
+        self.ref_node_rows = None  # 节点在NodeTable中的行号
         self.ref_node_list = []
         self.number_of_segments = 0
         self.segment_node_list = []
@@ -74,6 +186,9 @@ class WayInOsm:
 
 
 class RelationInOsm:
+    __slots__ = ('osm_relation_id', 'member_id_list', 'member_type_list', 'member_list', 'member_role_list', 'name',
+                 'building', 'amenity', 'leisure')
+
     def __init__(self):
         self.osm_relation_id = None
         self.member_id_list = []
@@ -93,6 +208,12 @@ class NetworkInOsm:
         self.osm_relation_list = []
         self.link_way_list = []
         self.POI_way_list = []
+        # 点poi：(osm节点ID, 经度, 纬度, name, building, amenity, leisure, shop, way)
+        self.POI_node_list = []
+        self.node_table = None
         self.bounds = None
+        self.is_clipped = False
         self.GT = None
+        # 增量更新时维护的节点-way索引（osm_change.NodeWayIndex），第一次应用变更文件时建立
+        self.node_way_index = None
 
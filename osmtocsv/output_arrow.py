@@ -0,0 +1,117 @@
+# node、link、poi的GeoParquet / Arrow IPC输出
+# 坐标保存为原生float列，几何保存为WKB，类别列使用字典编码，读取时可内存映射并只选取需要的列
+import json
+import os
+import time
+
+import numpy as np
+import shapely
+
+from output_columns import get_node_columns, get_link_columns, get_poi_columns, get_movement_columns
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+# 需要字典编码的类别列
+CATEGORICAL_COLUMNS = {'osm_highway', 'ctrl_type', 'node_type', 'activity_type', 'link_type_name', 'allowed_uses',
+                       'building', 'amenity', 'leisure', 'shop', 'way', 'type', 'mvmt_txt_id'}
+
+
+# shapely几何类型ID到GeoParquet几何类型名称
+_GEOMETRY_TYPE_NAMES = {0: 'Point', 1: 'LineString', 2: 'LineString', 3: 'Polygon', 4: 'MultiPoint',
+                        5: 'MultiLineString', 6: 'MultiPolygon', 7: 'GeometryCollection'}
+
+
+def _check_pyarrow():
+    if pa is None:
+        raise ImportError('输出parquet/arrow格式需要安装pyarrow：pip install pyarrow')
+
+
+def _geo_metadata(geometry_column_dict):
+    # GeoParquet 1.0元数据，未指定crs时即为OGC:CRS84经纬度
+    columns = {}
+    for name, geometries in geometry_column_dict.items():
+        geometry_types = set(shapely.get_type_id(geometries[~shapely.is_missing(geometries)]).tolist())
+        columns[name] = {'encoding': 'WKB',
+                         'geometry_types': sorted({_GEOMETRY_TYPE_NAMES[type_id] for type_id in geometry_types})}
+    return {'version': '1.0.0', 'primary_column': 'geometry', 'columns': columns}
+
+
+def _build_table(column_dict, geometry_columns):
+    arrays = []
+    for name, values in column_dict.items():
+        if name in geometry_columns:
+            array = pa.array(shapely.to_wkb(values).tolist(), type=pa.binary())
+        else:
+            array = pa.array(values)
+            if name in CATEGORICAL_COLUMNS and pa.types.is_string(array.type):
+                array = array.dictionary_encode()
+        arrays.append(array)
+    table = pa.Table.from_arrays(arrays, names=list(column_dict))
+    geo = _geo_metadata({name: column_dict[name] for name in geometry_columns})
+    return table.replace_schema_metadata({b'geo': json.dumps(geo).encode()})
+
+
+def _write(table, filepath, file_format):
+    if file_format == 'parquet':
+        pq.write_table(table, filepath, compression='zstd')
+    elif file_format == 'arrow':
+        # Arrow IPC文件不压缩，可直接内存映射
+        with pa.OSFile(filepath, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    else:
+        raise ValueError(f'不支持的输出格式：{file_format}')
+
+
+def _output(column_dict, geometry_columns, output_folder, filename, file_format, table_name):
+    _check_pyarrow()
+    start_time = time.time()
+    filepath = os.path.join(output_folder, filename)
+    _write(_build_table(column_dict, geometry_columns), filepath, file_format)
+    file_size = os.path.getsize(filepath)
+    print(f"{table_name}文件大小：{file_size} bytes，耗时{time.time() - start_time:.2f} s")
+
+
+def output_node_arrow(network, output_folder, node_filename, file_format='parquet'):
+    _output(get_node_columns(network), ['geometry'], output_folder, node_filename, file_format, 'node')
+
+
+def output_link_arrow(network, output_folder, link_filename, file_format='parquet'):
+    _output(get_link_columns(network), ['geometry'], output_folder, link_filename, file_format, 'link')
+
+
+def output_poi_arrow(network, output_folder, poi_filename, file_format='parquet'):
+    if network.POI_list:
+        column_dict = get_poi_columns(network)
+        # 质心坐标单独保存为float列，下游无需再解析WKT
+        centroid_coords = shapely.get_coordinates(column_dict['centroid'])
+        column_dict['centroid_x'] = centroid_coords[:, 0]
+        column_dict['centroid_y'] = centroid_coords[:, 1]
+        _output(column_dict, ['geometry', 'centroid'], output_folder, poi_filename, file_format, 'POI')
+
+
+def output_movement_arrow(network, output_folder, movement_filename, file_format='parquet'):
+    _output(get_movement_columns(network), ['geometry'], output_folder, movement_filename, file_format, 'movement')
+
+
+def read_table(filepath, columns=None):
+    """
+    读取output_*_arrow输出的文件，返回pyarrow.Table。.arrow文件以内存映射方式打开，
+    columns指定只读取的列，如read_table('output/poi.parquet', ['poi_id', 'centroid_x', 'centroid_y'])。
+    """
+    _check_pyarrow()
+    if str(filepath).endswith('.parquet'):
+        return pq.read_table(filepath, columns=columns, memory_map=True)
+    table = pa.ipc.open_file(pa.memory_map(str(filepath), 'r')).read_all()
+    return table.select(columns) if columns is not None else table
+
+
+def read_geometry(table, column='geometry'):
+    # 将WKB列转换为shapely几何数组
+    return shapely.from_wkb(np.asarray(table.column(column).to_pylist(), dtype=object))
@@ -0,0 +1,104 @@
+# 按列构建node、link、poi输出表，供csv和parquet/arrow输出共用
+# 几何列为shapely几何数组，由各输出格式自行转换为WKT或WKB
+import numpy as np
+import shapely
+
+
+def round_list(values, ndigits):
+    # 与逐个round(float)的结果一致
+    return [round(value, ndigits) for value in values.tolist()]
+
+
+def add_other_attr_columns(column_dict, object_list, attr_names):
+    # network.node_other_attrs / link_other_attrs中登记的other_attrs属性依次追加在最后
+    for attr_name in attr_names:
+        column_dict[attr_name] = [obj.other_attrs.get(attr_name) for obj in object_list]
+    return column_dict
+
+
+def get_node_columns(network):
+    node_list = list(network.node_dict.values())
+    geometries = np.array([node.geometry for node in node_list], dtype=object)
+    coords = shapely.get_coordinates(geometries)
+    return add_other_attr_columns({
+        'name': [node.name for node in node_list],
+        'node_id': [node.node_id for node in node_list],
+        'osm_node_id': [node.osm_node_id for node in node_list],
+        'osm_highway': [node.osm_highway for node in node_list],
+        'zone_id': [node.zone_id for node in node_list],
+        'ctrl_type': [node.ctrl_type for node in node_list],
+        'node_type': [''] * len(node_list),
+        'activity_type': [node.activity_type for node in node_list],
+        'is_boundary': [node.is_boundary for node in node_list],
+        'x_coord': round_list(coords[:, 0], 7),
+        'y_coord': round_list(coords[:, 1], 7),
+        'intersection_id': [node.intersection_id for node in node_list],
+        'poi_id': [node.poi_id for node in node_list],
+        'geometry': geometries,
+    }, node_list, network.node_other_attrs)
+
+
+def get_link_columns(network):
+    link_list = list(network.link_dict.values())
+    geometries_xy = np.array([link.geometry_xy for link in link_list], dtype=object)
+    return add_other_attr_columns({
+        'name': [link.name for link in link_list],
+        'link_id': [link.link_id for link in link_list],
+        'osm_way_id': [link.osm_way_id for link in link_list],
+        'from_node_id': [link.from_node.node_id for link in link_list],
+        'to_node_id': [link.to_node.node_id for link in link_list],
+        'dir_flag': [link.dir_flag for link in link_list],
+        'length': round_list(shapely.length(geometries_xy), 2),
+        'lanes': [link.lanes for link in link_list],
+        'free_speed': [link.free_speed for link in link_list],
+        'capacity': [link.capacity for link in link_list],
+        'link_type_name': [link.link_type_name for link in link_list],
+        'link_type': [link.link_type for link in link_list],
+        'geometry': np.array([link.geometry for link in link_list], dtype=object),
+        'allowed_uses': [';'.join(link.allowed_uses) for link in link_list],
+        'from_biway': [1 if link.from_bidirectional_way else 0 for link in link_list],
+        'is_link': [1 if link.is_link else 0 for link in link_list],
+    }, link_list, network.link_other_attrs)
+
+
+def get_poi_columns(network):
+    POI_list = network.POI_list
+    geometries_xy = np.array([poi.geometry_xy for poi in POI_list], dtype=object)
+    return {
+        'name': [poi.name for poi in POI_list],
+        'poi_id': [poi.poi_id for poi in POI_list],
+        'osm_way_id': [poi.osm_way_id for poi in POI_list],
+        'osm_relation_id': [poi.osm_relation_id for poi in POI_list],
+        'osm_node_id': [poi.osm_node_id for poi in POI_list],
+        'building': [poi.building for poi in POI_list],
+        'amenity': [poi.amenity for poi in POI_list],
+        'leisure': [poi.leisure for poi in POI_list],
+        'shop': [poi.shop for poi in POI_list],
+        'way': [poi.way for poi in POI_list],
+        'geometry': np.array([poi.geometry for poi in POI_list], dtype=object),
+        'centroid': np.array([poi.centroid for poi in POI_list], dtype=object),
+        'area': round_list(shapely.area(geometries_xy), 1),
+    }
+
+
+def get_movement_columns(network):
+    movement_list = list(network.movement_dict.values())
+    return {
+        'mvmt_id': [movement.movement_id for movement in movement_list],
+        'node_id': [movement.node.node_id for movement in movement_list],
+        'osm_node_id': [movement.node.osm_node_id for movement in movement_list],
+        'name': [movement.node.name for movement in movement_list],
+        'ib_link_id': [movement.ib_link.link_id for movement in movement_list],
+        'start_ib_lane': [movement.start_ib_lane for movement in movement_list],
+        'end_ib_lane': [movement.end_ib_lane for movement in movement_list],
+        'ob_link_id': [movement.ob_link.link_id for movement in movement_list],
+        'start_ob_lane': [movement.start_ob_lane for movement in movement_list],
+        'end_ob_lane': [movement.end_ob_lane for movement in movement_list],
+        'lanes': [movement.lanes for movement in movement_list],
+        'type': [movement.type for movement in movement_list],
+        'mvmt_txt_id': [movement.mvmt_txt_id for movement in movement_list],
+        'turn_angle': [movement.turn_angle for movement in movement_list],
+        'ctrl_type': [movement.node.ctrl_type for movement in movement_list],
+        'allowed_uses': [';'.join(movement.allowed_uses) for movement in movement_list],
+        'geometry': np.array([movement.geometry for movement in movement_list], dtype=object),
+    }
@@ -0,0 +1,95 @@
+# .osm.pbf文件的块级切分，用于多进程并行解析
+# pbf文件由若干个blob组成：4字节大端长度 + BlobHeader + Blob，每个OSMData块可以独立解码
+import os
+
+
+def _read_varint(buf, pos):
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+
+def parse_blob_header(buf):
+    """
+    解析BlobHeader，返回块类型（OSMHeader或OSMData）和Blob的字节数。
+    """
+    pos = 0
+    blob_type, datasize = None, 0
+    while pos < len(buf):
+        key, pos = _read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 0x07
+        if wire_type == 0:
+            value, pos = _read_varint(buf, pos)
+            if field == 3:
+                datasize = value
+        elif wire_type == 2:
+            length, pos = _read_varint(buf, pos)
+            if field == 1:
+                blob_type = bytes(buf[pos:pos + length]).decode()
+            pos += length
+        else:
+            raise ValueError(f'BlobHeader中无法识别的字段类型：{wire_type}')
+    return blob_type, datasize
+
+
+def read_pbf_blocks(filename):
+    """
+    扫描pbf文件，返回每个块的(类型, 起始偏移, 字节数)，字节数包含长度前缀和BlobHeader。
+    """
+    blocks = []
+    file_size = os.path.getsize(filename)
+    with open(filename, 'rb') as f:
+        offset = 0
+        while offset < file_size:
+            header_size = int.from_bytes(f.read(4), 'big')
+            blob_type, datasize = parse_blob_header(f.read(header_size))
+            f.seek(datasize, os.SEEK_CUR)
+            block_size = 4 + header_size + datasize
+            blocks.append((blob_type, offset, block_size))
+            offset += block_size
+    return blocks
+
+
+def split_pbf_blocks(filename, number_of_chunks):
+    """
+    将OSMData块按文件顺序分成若干连续的组，每组附带OSMHeader块，可单独交给osmium解析。
+    返回每组的[(起始偏移, 字节数), ...]列表，顺序与文件顺序一致。
+    """
+    blocks = read_pbf_blocks(filename)
+    header_blocks = [(offset, size) for blob_type, offset, size in blocks if blob_type == 'OSMHeader']
+    data_blocks = [(offset, size) for blob_type, offset, size in blocks if blob_type == 'OSMData']
+    if not data_blocks:
+        return []
+
+    # 按字节数均分
+    total_size = sum(size for _, size in data_blocks)
+    chunk_size = total_size / max(1, min(number_of_chunks, len(data_blocks)))
+    chunk_list = []
+    m_chunk = []
+    m_size = 0
+    for offset, size in data_blocks:
+        m_chunk.append((offset, size))
+        m_size += size
+        if m_size >= chunk_size:
+            chunk_list.append(header_blocks[:1] + m_chunk)
+            m_chunk = []
+            m_size = 0
+    if m_chunk:
+        chunk_list.append(header_blocks[:1] + m_chunk)
+    return chunk_list
+
+
+def read_pbf_chunk(filename, block_range_list):
+    # 读取一组块并拼接为可独立解析的pbf字节串
+    with open(filename, 'rb') as f:
+        buf = bytearray()
+        for offset, size in block_range_list:
+            f.seek(offset)
+            buf += f.read(size)
+    return bytes(buf)
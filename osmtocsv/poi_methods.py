@@ -1,17 +1,139 @@
 from my_network import POI
 from osmclasses import WayInOsm
-from process_geo_information import get_polygon_from_nodes
-from shapely import geometry
+from process_geo_information import get_polygons_from_coords, concat_rows
+from shapely import STRtree
+import multiprocessing
+import numpy as np
+import shapely
 
 
-def get_poi_from_way(POI_way_list, net_bound):
+# POI几何可在进程池中分块生成：主进程只传展平的坐标数组，子进程返回多边形WKB和质心坐标，
+# 分块结果按顺序合并，poi顺序和poi_id与单进程相同
+def _get_ring_arrays(table, row_list):
+    rows, offsets = concat_rows(row_list)
+    counts = np.diff(offsets)
+    nonempty = counts > 0
+    closed = np.zeros(len(counts), dtype=bool)
+    closed[nonempty] = rows[offsets[:-1][nonempty]] == rows[offsets[1:][nonempty] - 1]
+    return table.lonlat(rows), table.xy(rows), offsets, closed
+
+
+def _get_way_geometries(coords, coords_xy, offsets, closed, net_bound):
+    # 返回与区域相交的way序号、多边形和质心
+    polys, polys_xy = get_polygons_from_coords(coords, coords_xy, offsets, closed)
+    valid = ~shapely.is_missing(polys)
+    valid[valid] = ~shapely.disjoint(polys[valid], net_bound)
+    return (np.flatnonzero(valid), polys[valid], polys_xy[valid],
+            shapely.get_coordinates(shapely.centroid(polys[valid])),
+            shapely.get_coordinates(shapely.centroid(polys_xy[valid])))
+
+
+def _get_relation_geometries(coords, coords_xy, offsets, closed, ring_relation_no, ring_is_outer, net_bound):
+    """
+    由关系的外环和内环生成多边形，返回与区域相交的关系序号、几何和质心。
+    内环挂到同一关系中包含它的面积最小的外环上，每个关系只有一个多边形时为Polygon，否则为MultiPolygon。
+    """
+    ring_polys, ring_polys_xy = get_polygons_from_coords(coords, coords_xy, offsets, closed)
+    valid = ~shapely.is_missing(ring_polys)
+    outer_idx = np.flatnonzero(valid & ring_is_outer)
+    inner_idx = np.flatnonzero(valid & ~ring_is_outer)
+    shell_idx = np.full(len(ring_polys), -1, dtype=np.int64)
+    shell_idx[outer_idx] = outer_idx
+    if len(outer_idx) and len(inner_idx):
+        tree = STRtree(ring_polys[outer_idx])
+        input_no, tree_no = tree.query(shapely.point_on_surface(ring_polys[inner_idx]), predicate='within')
+        inner_no, outer_no = inner_idx[input_no], outer_idx[tree_no]
+        same_relation = ring_relation_no[inner_no] == ring_relation_no[outer_no]
+        inner_no, outer_no = inner_no[same_relation], outer_no[same_relation]
+        order = np.lexsort((shapely.area(ring_polys_xy[outer_no]), inner_no))
+        inner_no, outer_no = inner_no[order], outer_no[order]
+        first = np.ones(len(inner_no), dtype=bool)
+        first[1:] = inner_no[1:] != inner_no[:-1]
+        shell_idx[inner_no[first]] = outer_no[first]
+
+    # 按(外环, 内环)排序后用shapely.polygons的indices一次生成带洞多边形
+    ring_no = np.flatnonzero(shell_idx >= 0)
+    ring_no = ring_no[np.lexsort((ring_no, ~ring_is_outer[ring_no], shell_idx[ring_no]))]
+    polygon_no = np.cumsum(ring_is_outer[ring_no]) - 1
+    polygons = shapely.polygons(shapely.get_exterior_ring(ring_polys[ring_no]), indices=polygon_no)
+    polygons_xy = shapely.polygons(shapely.get_exterior_ring(ring_polys_xy[ring_no]), indices=polygon_no)
+
+    polygon_relation_no = ring_relation_no[ring_no[ring_is_outer[ring_no]]]
+    relation_no_array, first_polygon_no, polygon_counts = np.unique(polygon_relation_no, return_index=True,
+                                                                    return_counts=True)
+    geoms = polygons[first_polygon_no]
+    geoms_xy = polygons_xy[first_polygon_no]
+    multi = polygon_counts > 1
+    if multi.any():
+        multi_polygon = np.isin(polygon_relation_no, relation_no_array[multi])
+        multi_relation_no = polygon_relation_no[multi_polygon]
+        multi_indices = np.cumsum(np.r_[True, multi_relation_no[1:] != multi_relation_no[:-1]]) - 1
+        geoms[multi] = shapely.multipolygons(polygons[multi_polygon], indices=multi_indices)
+        geoms_xy[multi] = shapely.multipolygons(polygons_xy[multi_polygon], indices=multi_indices)
+
+    keep = ~shapely.disjoint(geoms, net_bound)
+    return (relation_no_array[keep], geoms[keep], geoms_xy[keep],
+            shapely.get_coordinates(shapely.centroid(geoms[keep])),
+            shapely.get_coordinates(shapely.centroid(geoms_xy[keep])))
+
+
+def _poi_geometry_worker(args):
+    func, arrays, bound_wkb = args
+    net_bound = shapely.from_wkb(bound_wkb)
+    shapely.prepare(net_bound)
+    obj_no_array, geoms, geoms_xy, centroids, centroids_xy = func(*arrays, net_bound)
+    return obj_no_array, shapely.to_wkb(geoms), shapely.to_wkb(geoms_xy), centroids, centroids_xy
+
+
+def _map_chunks(func, chunk_list, net_bound, pool):
+    """
+    对每块(起始序号, 数组参数)调用func，返回合并后的(序号, 几何, 投影几何, 质心, 投影质心)。
+    pool不为None时在进程池中计算，几何以WKB传回。
+    """
+    if pool is None:
+        results = [func(*arrays, net_bound) for _, arrays in chunk_list]
+    else:
+        bound_wkb = shapely.to_wkb(net_bound)
+        results = []
+        for obj_no_array, wkbs, wkbs_xy, centroids, centroids_xy in pool.imap(
+                _poi_geometry_worker, [(func, arrays, bound_wkb) for _, arrays in chunk_list]):
+            results.append((obj_no_array, shapely.from_wkb(wkbs), shapely.from_wkb(wkbs_xy), centroids, centroids_xy))
+    if not results:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=object), np.zeros(0, dtype=object),
+                np.zeros((0, 2)), np.zeros((0, 2)))
+    obj_no_array = np.concatenate([result[0] + start for (start, _), result in zip(chunk_list, results)])
+    return (obj_no_array,) + tuple(np.concatenate([result[i] for result in results]) for i in range(1, 5))
+
+
+def _get_chunk_bounds(number_of_objects, number_of_chunks):
+    bounds = np.linspace(0, number_of_objects, max(1, number_of_chunks) + 1).astype(np.int64)
+    return [(start, end) for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()) if end > start]
+
+
+def _get_centroid_points(centroids, centroids_xy):
+    # 逐个round与原先的结果一致（np.round在恰为中点的值上与round不同），reshape使没有poi时也是(0, 2)数组
+    centroids = shapely.points(np.array([(round(lon, 7), round(lat, 7)) for lon, lat in centroids.tolist()],
+                                        dtype=float).reshape(-1, 2))
+    centroids_xy = shapely.points(np.array([(round(x, 2), round(y, 2)) for x, y in centroids_xy.tolist()],
+                                           dtype=float).reshape(-1, 2))
+    return centroids, centroids_xy
+
+
+def get_poi_from_way(POI_way_list, net_bound, pool=None, number_of_chunks=1):
     print("从道路中获取poi数据...")
     POI_list_from_way = []
-    for way in POI_way_list:
-        poly, poly_xy = get_polygon_from_nodes(way.ref_node_list)
-        if poly is None: continue
-        if poly.disjoint(net_bound): continue
+    if not POI_way_list: return POI_list_from_way
+
+    # 所有way的多边形、相离判断和质心均批量计算，可分块交给进程池
+    table = POI_way_list[0].ref_node_list[0].table
+    chunk_list = [(start, _get_ring_arrays(table, [way.ref_node_rows for way in POI_way_list[start:end]]))
+                  for start, end in _get_chunk_bounds(len(POI_way_list), number_of_chunks)]
+    way_no_array, polys, polys_xy, centroids, centroids_xy = _map_chunks(_get_way_geometries, chunk_list,
+                                                                         net_bound, pool)
+    centroids, centroids_xy = _get_centroid_points(centroids, centroids_xy)
 
+    for no, way_no in enumerate(way_no_array.tolist()):
+        way = POI_way_list[way_no]
         poi = POI()
         poi.osm_way_id = way.osm_way_id
         poi.name = way.name
@@ -19,120 +141,158 @@ def get_poi_from_way(POI_way_list, net_bound):
         poi.amenity = way.amenity
         poi.leisure = way.leisure
         poi.way = way.way_poi
-
-        poi.geometry, poi.geometry_xy = poly, poly_xy
-        lon, lat = poi.geometry.centroid.x, poi.geometry.centroid.y
-        poi.centroid = geometry.Point((round(lon,7),round(lat,7)))
-        x, y = poi.geometry_xy.centroid.x, poi.geometry_xy.centroid.y
-        poi.centroid_xy = geometry.Point((round(x,2),round(y,2)))
+        poi.geometry, poi.geometry_xy = polys[no], polys_xy[no]
+        poi.centroid, poi.centroid_xy = centroids[no], centroids_xy[no]
         POI_list_from_way.append(poi)
     print(f'道路中获取poi数据数量为：{POI_list_from_way.__len__()}')
     return POI_list_from_way
 
 
-def get_poi_from_relation(POI_relation_list, net_bound):
+def _pop_connected_way(endpoint_dict, row, used):
+    way_no_list = endpoint_dict.get(row)
+    while way_no_list:
+        way_no = way_no_list.pop()
+        if not used[way_no]: return way_no
+    return None
+
+
+def assemble_rings(way_list):
+    """
+    将成员way按首尾节点拼接为环，返回每个环的节点行号列表。
+    首尾节点建立哈希索引，每条way只被访问一次，与成员顺序无关，复杂度为O(成员数)。
+    无法闭合的链也会返回，构造多边形时自动闭合。
+    """
+    ring_list = []
+    open_way_list = []
+    endpoint_dict = {}
+    for way in way_list:
+        rows = way.ref_node_rows.tolist()
+        if len(rows) < 2: continue
+        if rows[0] == rows[-1]:
+            ring_list.append(rows)
+            continue
+        endpoint_dict.setdefault(rows[0], []).append(len(open_way_list))
+        endpoint_dict.setdefault(rows[-1], []).append(len(open_way_list))
+        open_way_list.append(rows)
+
+    used = [False] * len(open_way_list)
+    for way_no, rows in enumerate(open_way_list):
+        if used[way_no]: continue
+        used[way_no] = True
+        ring = list(rows)
+        # 先向尾部延伸，无法闭合时反转后从另一端继续延伸
+        for _ in range(2):
+            while ring[0] != ring[-1]:
+                next_way_no = _pop_connected_way(endpoint_dict, ring[-1], used)
+                if next_way_no is None: break
+                used[next_way_no] = True
+                next_rows = open_way_list[next_way_no]
+                ring += next_rows[1:] if next_rows[0] == ring[-1] else next_rows[-2::-1]
+            if ring[0] == ring[-1]: break
+            ring.reverse()
+        ring_list.append(ring)
+    return ring_list
+
+
+def get_poi_from_relation(POI_relation_list, net_bound, pool=None, number_of_chunks=1):
     print("从关系中获取poi数据...")
     poi_list_from_relation = []
-    for relation in POI_relation_list:
+
+    # 拼接所有关系的外环和内环，记录每个环所属的关系
+    ring_list = []
+    ring_relation_no_list = []
+    ring_is_outer_list = []
+    relation_ring_offsets = [0]
+    table = None
+    for relation_no, relation in enumerate(POI_relation_list):
+        # member_list只包含节点和way成员，角色按同样的方式对齐
+        role_list = [role for member_type, role in zip(relation.member_type_list, relation.member_role_list)
+                     if member_type in ('n', 'w')]
+        for role, is_outer in (('outer', True), ('inner', False)):
+            way_list = [member for member, member_role in zip(relation.member_list, role_list)
+                        if isinstance(member, WayInOsm) and member_role == role and member.ref_node_list]
+            if way_list and table is None: table = way_list[0].ref_node_list[0].table
+            for ring in assemble_rings(way_list):
+                ring_list.append(ring)
+                ring_relation_no_list.append(relation_no)
+                ring_is_outer_list.append(is_outer)
+        relation_ring_offsets.append(len(ring_list))
+    if not ring_list:
+        print(f'关系中获取poi数据数量为：0')
+        return poi_list_from_relation
+
+    # 按关系分块，每块的环是连续的一段
+    ring_relation_no = np.array(ring_relation_no_list, dtype=np.int64)
+    ring_is_outer = np.array(ring_is_outer_list, dtype=bool)
+    chunk_list = []
+    for start, end in _get_chunk_bounds(len(POI_relation_list), number_of_chunks):
+        ring_start, ring_end = relation_ring_offsets[start], relation_ring_offsets[end]
+        if ring_end == ring_start: continue
+        arrays = _get_ring_arrays(table, ring_list[ring_start:ring_end]) + \
+            (ring_relation_no[ring_start:ring_end] - start, ring_is_outer[ring_start:ring_end])
+        chunk_list.append((start, arrays))
+    relation_no_array, geoms, geoms_xy, centroids, centroids_xy = _map_chunks(_get_relation_geometries, chunk_list,
+                                                                              net_bound, pool)
+    centroids, centroids_xy = _get_centroid_points(centroids, centroids_xy)
+
+    for no, relation_no in enumerate(relation_no_array.tolist()):
+        relation = POI_relation_list[relation_no]
         poi = POI()
         poi.osm_relation_id = relation.osm_relation_id
         poi.name = relation.name
         poi.building = relation.building
         poi.amenity = relation.amenity
         poi.leisure = relation.leisure
-        polygon_list = []
-        polygon_list_xy = []
-        number_of_members = len(relation.member_list)
-        m_ref_node_list = []
-        for m in range(number_of_members):
-            member = relation.member_list[m]
-            role = relation.member_role_list[m]
-            if isinstance(member, WayInOsm):
-                if role != 'outer': continue
-                if m_ref_node_list:
-                    combined_ref_node_list = []
-                    if m_ref_node_list[-1] is member.ref_node_list[0]:
-                        combined_ref_node_list = m_ref_node_list + member.ref_node_list[1:]
-                    elif m_ref_node_list[-1] is member.ref_node_list[-1]:
-                        combined_ref_node_list = m_ref_node_list + list(reversed(member.ref_node_list[:-1]))
-                    elif m_ref_node_list[0] is member.ref_node_list[0]:
-                        combined_ref_node_list = list(reversed(m_ref_node_list)) + member.ref_node_list[1:]
-                    elif m_ref_node_list[0] is member.ref_node_list[-1]:
-                        combined_ref_node_list = list(reversed(m_ref_node_list)) + list(reversed(member.ref_node_list[:-1]))
-
-                    if combined_ref_node_list:
-                        if combined_ref_node_list[0] is combined_ref_node_list[-1]:
-                            poly, poly_xy = get_polygon_from_nodes(combined_ref_node_list)
-                            if poly is not None:
-                                polygon_list.append(poly)
-                                polygon_list_xy.append(poly_xy)
-                            m_ref_node_list = []
-                        else:
-                            m_ref_node_list = combined_ref_node_list
-                    else:
-                        poly, poly_xy = get_polygon_from_nodes(m_ref_node_list)
-                        if poly is not None:
-                            polygon_list.append(poly)
-                            polygon_list_xy.append(poly_xy)
-                        if member.ref_node_list[0] is member.ref_node_list[-1]:
-                            poly, poly_xy = get_polygon_from_nodes(m_ref_node_list)
-                            if poly is not None:
-                                polygon_list.append(poly)
-                                polygon_list_xy.append(poly_xy)
-                            m_ref_node_list = []
-                        else:
-                            m_ref_node_list = member.ref_node_list
-                else:
-                    if member.ref_node_list[0] is member.ref_node_list[-1]:
-                        poly, poly_xy = get_polygon_from_nodes(member.ref_node_list)
-                        if poly is not None:
-                            polygon_list.append(poly)
-                            polygon_list_xy.append(poly_xy)
-                    else:
-                        m_ref_node_list = member.ref_node_list
-            else:
-                pass
-
-        if m_ref_node_list:
-            poly, poly_xy = get_polygon_from_nodes(m_ref_node_list)
-            if poly is not None:
-                polygon_list.append(poly)
-                polygon_list_xy.append(poly_xy)
-
-        if len(polygon_list) == 0:
-            continue
-        else:
-            if len(polygon_list) == 1:
-                poi.geometry = polygon_list[0]
-                if poi.geometry.disjoint(net_bound): continue
-                poi.geometry_xy = polygon_list_xy[0]
-            else:
-                disjoint = True
-                for poly in polygon_list:
-                    if not poly.disjoint(net_bound):
-                        disjoint = False
-                        break
-                if disjoint: continue
-                poi.geometry = geometry.MultiPolygon(polygon_list)
-                poi.geometry_xy = geometry.MultiPolygon(polygon_list_xy)
-
-            lon, lat = poi.geometry.centroid.x, poi.geometry.centroid.y
-            poi.centroid = geometry.Point((round(lon, 7), round(lat, 7)))
-            x, y = poi.geometry_xy.centroid.x, poi.geometry_xy.centroid.y
-            poi.centroid_xy = geometry.Point((round(x, 2), round(y, 2)))
-
-            poi_list_from_relation.append(poi)
+        poi.geometry, poi.geometry_xy = geoms[no], geoms_xy[no]
+        poi.centroid, poi.centroid_xy = centroids[no], centroids_xy[no]
+        poi_list_from_relation.append(poi)
     print(f'关系中获取poi数据数量为：{poi_list_from_relation.__len__()}')
     return poi_list_from_relation
 
 
-def get_all_pois(POI_way_list, osm_relation_list, network):
+def get_poi_from_node(POI_node_list, net_bound, GT):
+    print("从节点中获取poi数据...")
+    poi_list_from_node = []
+    if not POI_node_list: return poi_list_from_node
+
+    # 区域判断和投影均批量计算，点poi的几何即为其质心
+    coords = np.array([(lon, lat) for _, lon, lat, *_ in POI_node_list], dtype=np.float64)
+    keep = shapely.intersects_xy(net_bound, coords[:, 0], coords[:, 1])
+    points = shapely.points(coords[keep])
+    points_xy = shapely.points(GT._coords_from_latlon(coords[keep]))
+    for no, poi_node_no in enumerate(np.flatnonzero(keep).tolist()):
+        osm_node_id, _, _, name, building, amenity, leisure, shop, way_poi = POI_node_list[poi_node_no]
+        poi = POI()
+        poi.osm_node_id = osm_node_id
+        poi.name = name
+        poi.building = building
+        poi.amenity = amenity
+        poi.leisure = leisure
+        poi.shop = shop
+        poi.way = way_poi
+        poi.geometry = poi.centroid = points[no]
+        poi.geometry_xy = poi.centroid_xy = points_xy[no]
+        poi_list_from_node.append(poi)
+    print(f'节点中获取poi数据数量为：{poi_list_from_node.__len__()}')
+    return poi_list_from_node
+
+
+def get_all_pois(POI_way_list, osm_relation_list, network, workers=1, POI_node_list=None):
+    """
+    生成way、关系和节点的POI并按顺序编号。workers大于1时多边形和质心在进程池中分块计算，结果与单进程相同。
+    """
     print('生成POI数据')
 
-    POI_list1 = get_poi_from_way(POI_way_list, network.bounds)
-    POI_list2 = get_poi_from_relation(osm_relation_list, network.bounds)
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            POI_list1 = get_poi_from_way(POI_way_list, network.bounds, pool, workers * 4)
+            POI_list2 = get_poi_from_relation(osm_relation_list, network.bounds, pool, workers * 4)
+    else:
+        POI_list1 = get_poi_from_way(POI_way_list, network.bounds)
+        POI_list2 = get_poi_from_relation(osm_relation_list, network.bounds)
+    POI_list3 = get_poi_from_node(POI_node_list, network.bounds, network.GT)
 
-    POI_list = POI_list1 + POI_list2
+    POI_list = POI_list1 + POI_list2 + POI_list3
 
     max_poi_id = network.max_poi_id
     for poi in POI_list:
@@ -140,3 +300,247 @@ def get_all_pois(POI_way_list, osm_relation_list, network):
         max_poi_id += 1
     network.max_poi_id = max_poi_id
     network.POI_list = POI_list
+
+
+def assign_nearest_node(network, POI_list=None, max_distance=None, link_types=None):
+    """
+    为POI批量查找最近的网络节点，填充POI.nearest_node和Node.poi_id（多个POI以;分隔）。
+    节点的geometry_xy建立STRtree，所有POI的centroid_xy一次query_nearest完成查询。
+    max_distance为最大距离（米），超过时不分配；link_types为可连接的道路类型（link_type_name），为None时不限制。
+    POI_list为None时处理network.POI_list中的全部POI。
+    """
+    if POI_list is None: POI_list = network.POI_list
+    if link_types is None:
+        node_list = list(network.node_dict.values())
+    else:
+        link_types = set(link_types)
+        node_list = [node for node in network.node_dict.values()
+                     if any(link.link_type_name in link_types
+                            for link in node.incoming_link_list + node.outgoing_link_list)]
+
+    # 原最近节点和新最近节点的poi_id都需要更新
+    updated_node_dict = {id(poi.nearest_node): poi.nearest_node for poi in POI_list if poi.nearest_node is not None}
+    for poi in POI_list:
+        poi.nearest_node = None
+    if POI_list and node_list:
+        tree = STRtree(np.array([node.geometry_xy for node in node_list], dtype=object))
+        centroids_xy = np.array([poi.centroid_xy for poi in POI_list], dtype=object)
+        poi_idx, node_idx = tree.query_nearest(centroids_xy, max_distance=max_distance, all_matches=False)
+        for poi_no, node_no in zip(poi_idx.tolist(), node_idx.tolist()):
+            node = node_list[node_no]
+            POI_list[poi_no].nearest_node = node
+            updated_node_dict[id(node)] = node
+    update_node_poi_id(network, updated_node_dict.values())
+    # 增量更新的索引在下次应用变更文件时按当前结果重新建立
+    network.nearest_node_index = None
+    print(f'POI最近节点分配数量为：{sum(poi.nearest_node is not None for poi in POI_list)}')
+
+
+def update_node_poi_id(network, node_list):
+    # 根据network.POI_list重新生成这些节点的poi_id
+    node_id_set = {id(node) for node in node_list}
+    poi_id_dict = {}
+    for poi in network.POI_list:
+        if id(poi.nearest_node) in node_id_set:
+            poi_id_dict.setdefault(id(poi.nearest_node), []).append(str(poi.poi_id))
+    for node in node_list:
+        poi_id_list = poi_id_dict.get(id(node))
+        node.poi_id = ';'.join(poi_id_list) if poi_id_list else None
+
+
+class _GeometryIndex:
+    """
+    可增删的空间索引：建立时的对象放在STRtree中，之后新增或几何变化的对象暂存在pending_dict中直接计算距离，
+    删除的对象只做标记。变化的对象数超过树中对象数的1/4时重建，摊还后每次变化的开销与索引规模无关。
+    """
+    def __init__(self, obj_list, geometries):
+        self._build(obj_list, geometries)
+
+    def _build(self, obj_list, geometries):
+        self.obj_list = list(obj_list)
+        self.geometries = np.array(geometries, dtype=object).reshape(-1)
+        self.tree = STRtree(self.geometries)
+        self.alive = np.ones(len(self.obj_list), dtype=bool)
+        self.position_dict = {id(obj): no for no, obj in enumerate(self.obj_list)}
+        self.pending_dict = {}
+        self.number_of_changes = 0
+
+    def add(self, obj, geometry):
+        self.remove(obj)
+        self.pending_dict[id(obj)] = (obj, geometry)
+        self.number_of_changes += 1
+
+    def remove(self, obj):
+        no = self.position_dict.pop(id(obj), None)
+        if no is not None:
+            self.alive[no] = False
+            self.number_of_changes += 1
+        self.pending_dict.pop(id(obj), None)
+
+    def rebuild_if_stale(self):
+        if self.number_of_changes <= max(len(self.obj_list) // 4, 256): return
+        obj_list = [obj for obj, alive in zip(self.obj_list, self.alive.tolist()) if alive]
+        geometries = list(self.geometries[self.alive])
+        for obj, geometry in self.pending_dict.values():
+            obj_list.append(obj)
+            geometries.append(geometry)
+        self._build(obj_list, geometries)
+
+    def query(self, geometries, distance):
+        """
+        查找与geometries距离不超过distance的对象，distance可为与geometries等长的数组。
+        返回(geometries中的序号数组, 对象列表, 距离数组)。
+        """
+        geometries = np.array(geometries, dtype=object).reshape(-1)
+        distance = np.broadcast_to(np.asarray(distance, dtype=np.float64), (len(geometries),))
+        input_no, tree_no = self.tree.query(geometries, predicate='dwithin', distance=distance)
+        keep = self.alive[tree_no]
+        input_no, tree_no = input_no[keep], tree_no[keep]
+        obj_list = [self.obj_list[no] for no in tree_no.tolist()]
+        target_geometries = self.geometries[tree_no]
+        if self.pending_dict:
+            pending_list = list(self.pending_dict.values())
+            pending_geometries = np.array([geometry for _, geometry in pending_list], dtype=object)
+            pending_distances = shapely.distance(geometries[:, None], pending_geometries[None, :])
+            pending_input_no, pending_no = np.nonzero(pending_distances <= distance[:, None])
+            input_no = np.concatenate([input_no, pending_input_no])
+            obj_list += [pending_list[no][0] for no in pending_no.tolist()]
+            target_geometries = np.concatenate([target_geometries, pending_geometries[pending_no]])
+        return input_no, obj_list, shapely.distance(geometries[input_no], target_geometries)
+
+
+class NearestNodeIndex:
+    """
+    增量更新（osm_change.apply_change_file）时维护POI的最近节点，规则与assign_nearest_node相同。
+    节点和POI质心各一个_GeometryIndex，并记录每个POI到最近节点的距离和每个节点分配到的POI，
+    只重新查询新增的POI、最近节点被删除或变化的POI，以及新增或变化的节点附近可能变得更近的POI。
+    """
+    def __init__(self, network, max_distance=None, link_types=None):
+        self.max_distance = max_distance
+        self.link_types = None if link_types is None else set(link_types)
+        node_list = list(network.node_dict.values())
+        self.node_index = _GeometryIndex(node_list, [node.geometry_xy for node in node_list])
+        self.poi_index = _GeometryIndex(network.POI_list, [poi.centroid_xy for poi in network.POI_list])
+        self.node_bounds = shapely.total_bounds(self.node_index.geometries)
+
+        self.poi_dict = {}  # id(node) -> {id(poi): poi}
+        self.distance_dict = {}  # id(poi) -> 到最近节点的距离
+        self.unassigned_dict = {}  # id(poi) -> 未分配最近节点的poi
+        assigned_list = [poi for poi in network.POI_list if poi.nearest_node is not None]
+        distances = shapely.distance(np.array([poi.centroid_xy for poi in assigned_list], dtype=object),
+                                     np.array([poi.nearest_node.geometry_xy for poi in assigned_list], dtype=object))
+        for poi, distance in zip(assigned_list, distances.tolist()):
+            self.poi_dict.setdefault(id(poi.nearest_node), {})[id(poi)] = poi
+            self.distance_dict[id(poi)] = distance
+        for poi in network.POI_list:
+            if poi.nearest_node is None: self.unassigned_dict[id(poi)] = poi
+        # 所有已分配POI到最近节点的距离上限，用于查找新增节点附近的POI
+        self.search_distance = max_distance if max_distance is not None \
+            else max(self.distance_dict.values(), default=0.0)
+
+    def _is_eligible(self, node):
+        if self.link_types is None: return True
+        return any(link.link_type_name in self.link_types for link in node.incoming_link_list + node.outgoing_link_list)
+
+    def _detach(self, poi, touched_node_dict):
+        node = poi.nearest_node
+        if node is not None:
+            poi_dict = self.poi_dict.get(id(node))
+            if poi_dict is not None:
+                poi_dict.pop(id(poi), None)
+                if not poi_dict: del self.poi_dict[id(node)]
+            touched_node_dict[id(node)] = node
+        poi.nearest_node = None
+        self.distance_dict.pop(id(poi), None)
+        self.unassigned_dict.pop(id(poi), None)
+
+    def _query_nearest(self, poi_list):
+        # 返回每个POI最近的可连接节点及距离，没有时为None；未设置max_distance时逐步扩大查询半径
+        result_list = [None] * len(poi_list)
+        if not poi_list or np.isnan(self.node_bounds).any(): return result_list
+        geometries = np.array([poi.centroid_xy for poi in poi_list], dtype=object)
+        coords = shapely.get_coordinates(geometries)
+        min_x, min_y, max_x, max_y = self.node_bounds
+        # 超过到节点范围最远角点的距离后仍未找到则不分配
+        far_distances = np.hypot(np.maximum(np.abs(coords[:, 0] - min_x), np.abs(coords[:, 0] - max_x)),
+                                 np.maximum(np.abs(coords[:, 1] - min_y), np.abs(coords[:, 1] - max_y)))
+        remaining = np.arange(len(poi_list))
+        radius = self.max_distance if self.max_distance is not None else 100.0
+        while len(remaining):
+            input_no, node_list, distances = self.node_index.query(geometries[remaining], radius)
+            eligible = np.array([self._is_eligible(node) for node in node_list], dtype=bool)
+            candidate_no = np.flatnonzero(eligible)
+            candidate_no = candidate_no[np.lexsort((distances[candidate_no], input_no[candidate_no]))]
+            _, first = np.unique(input_no[candidate_no], return_index=True)
+            found = np.zeros(len(remaining), dtype=bool)
+            for no in candidate_no[first].tolist():
+                result_list[remaining[input_no[no]]] = (node_list[no], float(distances[no]))
+                found[input_no[no]] = True
+            remaining = remaining[~found]
+            if self.max_distance is not None or not len(remaining) or radius >= far_distances[remaining].max(): break
+            radius *= 2
+        return result_list
+
+    def update(self, removed_poi_list, added_poi_list, removed_node_list, changed_node_list):
+        """
+        removed_poi_list和added_poi_list为删除和新增（含重新生成）的POI，removed_node_list为删除的节点，
+        changed_node_list为新增、坐标变化或连接的link变化的节点。返回poi_id发生变化的节点列表（不含删除的节点）。
+        """
+        touched_node_dict = {}
+        requery_dict = {}
+        for poi in removed_poi_list:
+            self.poi_index.remove(poi)
+            self._detach(poi, touched_node_dict)
+        removed_node_id_set = set()
+        for node in removed_node_list:
+            removed_node_id_set.add(id(node))
+            self.node_index.remove(node)
+            requery_dict.update(self.poi_dict.get(id(node), {}))
+        for node in changed_node_list:
+            self.node_index.add(node, node.geometry_xy)
+            self.node_bounds = np.array([*np.fmin(self.node_bounds[:2], shapely.get_coordinates(node.geometry_xy)[0]),
+                                         *np.fmax(self.node_bounds[2:], shapely.get_coordinates(node.geometry_xy)[0])])
+            requery_dict.update(self.poi_dict.get(id(node), {}))
+        for poi in added_poi_list:
+            self.poi_index.add(poi, poi.centroid_xy)
+            requery_dict[id(poi)] = poi
+
+        # 新增或变化的节点可能比未变化的POI原来的最近节点更近
+        eligible_node_list = [node for node in changed_node_list if self._is_eligible(node)]
+        if eligible_node_list:
+            if self.max_distance is None: requery_dict.update(self.unassigned_dict)
+            _, poi_list, distances = self.poi_index.query([node.geometry_xy for node in eligible_node_list],
+                                                          self.search_distance)
+            for poi, distance in zip(poi_list, distances.tolist()):
+                if distance < self.distance_dict.get(id(poi), np.inf): requery_dict[id(poi)] = poi
+
+        requery_list = list(requery_dict.values())
+        old_poi_id_dict = {}
+        for poi in requery_list:
+            if poi.nearest_node is not None: old_poi_id_dict.setdefault(id(poi.nearest_node), poi.nearest_node.poi_id)
+            self._detach(poi, touched_node_dict)
+        for poi, result in zip(requery_list, self._query_nearest(requery_list)):
+            if result is None:
+                self.unassigned_dict[id(poi)] = poi
+                continue
+            node, distance = result
+            poi.nearest_node = node
+            self.poi_dict.setdefault(id(node), {})[id(poi)] = poi
+            self.distance_dict[id(poi)] = distance
+            self.search_distance = max(self.search_distance, distance)
+            touched_node_dict[id(node)] = node
+
+        # 节点的poi_id按poi_id排序，与重新构建的网络一致
+        updated_node_list = []
+        for key, node in touched_node_dict.items():
+            if key in removed_node_id_set: continue
+            poi_dict = self.poi_dict.get(key)
+            poi_id = ';'.join(str(poi.poi_id) for poi in sorted(poi_dict.values(), key=lambda poi: poi.poi_id)) \
+                if poi_dict else None
+            if poi_id != old_poi_id_dict.get(key, node.poi_id):
+                updated_node_list.append(node)
+            node.poi_id = poi_id
+        self.node_index.rebuild_if_stale()
+        self.poi_index.rebuild_if_stale()
+        print(f'重新分配最近节点的POI数量为：{len(requery_list)}')
+        return updated_node_list
@@ -1,6 +1,7 @@
 from shapely import geometry
 import functools
 import numpy as np
+import shapely
 
 
 K0 = 0.9996
@@ -140,22 +141,80 @@ def to_latlon(easting, northing, central_longitude, northern):
 
 def get_line_from_nodes(node_list):
     if len(node_list) < 2: return None, None
-    point_list = [node.geometry for node in node_list]
-    line = geometry.LineString(point_list)
-    point_list_xy = [node.geometry_xy for node in node_list]
-    line_xy = geometry.LineString(point_list_xy)
+    # 所有节点共用同一个NodeTable，直接按行号取坐标，不再逐点创建Point
+    table = node_list[0].table
+    rows = [node.row for node in node_list]
+    line = geometry.LineString(table.lonlat(rows))
+    line_xy = geometry.LineString(table.xy(rows))
     return line, line_xy
 
 
 def get_polygon_from_nodes(node_list):
     if len(node_list) < 3: return None, None
-    point_list = [(node.geometry.x, node.geometry.y) for node in node_list]
-    poly = geometry.Polygon(point_list)
-    point_list_xy = [(node.geometry_xy.x, node.geometry_xy.y) for node in node_list]
-    poly_xy = geometry.Polygon(point_list_xy)
+    table = node_list[0].table
+    rows = [node.row for node in node_list]
+    poly = geometry.Polygon(table.lonlat(rows))
+    poly_xy = geometry.Polygon(table.xy(rows))
     return poly, poly_xy
 
 
+def concat_rows(row_list):
+    # 将多组节点行号拼接为展平数组和偏移数组，第i组为rows[offsets[i]:offsets[i+1]]
+    counts = np.fromiter((len(rows) for rows in row_list), dtype=np.int64, count=len(row_list))
+    offsets = np.zeros(len(row_list) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    if offsets[-1] == 0:
+        return np.zeros(0, dtype=np.int64), offsets
+    rows = np.concatenate([np.asarray(rows, dtype=np.int64) for rows in row_list])
+    return rows, offsets
+
+
+def get_lines_from_rows(table, rows, offsets):
+    """
+    批量生成线。rows为展平的节点行号，offsets为每条线的起止偏移。
+    用shapely的向量化构造函数一次生成所有经纬度线和投影线，节点数少于2的位置为None。
+    """
+    counts = np.diff(offsets)
+    lines = np.full(len(counts), None, dtype=object)
+    lines_xy = np.full(len(counts), None, dtype=object)
+    valid = counts >= 2
+    if valid.any():
+        rows = rows[np.repeat(valid, counts)]
+        indices = np.repeat(np.arange(valid.sum()), counts[valid])
+        lines[valid] = shapely.linestrings(table.lonlat(rows), indices=indices)
+        lines_xy[valid] = shapely.linestrings(table.xy(rows), indices=indices)
+    return lines, lines_xy
+
+
+def get_polygons_from_rows(table, rows, offsets):
+    """
+    批量生成多边形，参数同get_lines_from_rows。未闭合的环自动闭合，无法构成环的位置为None。
+    """
+    counts = np.diff(offsets)
+    nonempty = counts > 0
+    closed = np.zeros(len(counts), dtype=bool)
+    closed[nonempty] = rows[offsets[:-1][nonempty]] == rows[offsets[1:][nonempty] - 1]
+    return get_polygons_from_coords(table.lonlat(rows), table.xy(rows), offsets, closed)
+
+
+def get_polygons_from_coords(coords, coords_xy, offsets, closed):
+    """
+    批量生成多边形。coords、coords_xy为展平的经纬度和投影坐标，offsets为每个环的起止偏移，
+    closed标记每个环的首尾是否为同一节点。不依赖NodeTable，可在子进程中使用。
+    """
+    counts = np.diff(offsets)
+    polygons = np.full(len(counts), None, dtype=object)
+    polygons_xy = np.full(len(counts), None, dtype=object)
+    # 闭合后至少需要4个坐标
+    valid = (counts >= 3) & (np.where(closed, counts, counts + 1) >= 4)
+    if valid.any():
+        mask = np.repeat(valid, counts)
+        indices = np.repeat(np.arange(valid.sum()), counts[valid])
+        polygons[valid] = shapely.polygons(shapely.linearrings(coords[mask], indices=indices))
+        polygons_xy[valid] = shapely.polygons(shapely.linearrings(coords_xy[mask], indices=indices))
+    return polygons, polygons_xy
+
+
 class GeoTransformer:
     def __init__(self, central_lon, central_lat, northern):
         self.central_lon = central_lon
@@ -171,26 +230,29 @@ class GeoTransformer:
     def _to_latlon_(self, p):
         return np.round(self.to_latlon(*p), 7)
 
-    def _transform(self, shape, func):
-        construct = shape.__class__
-
-        if shape.geom_type.startswith('Multi'):
-            parts = [self._transform(geom, func) for geom in shape.geoms]
-            return construct(parts)
+    def _coords_from_latlon(self, coords):
+        # coords为(N, 2)的经纬度数组，一次完成全部坐标的投影
+        if len(coords) == 0: return coords
+        xs, ys = self.from_latlon(coords[:, 0], coords[:, 1])
+        return np.round(np.column_stack((xs, ys)), 2)
 
-        if shape.geom_type == 'Point':
-            return construct(list(map(func, shape.coords))[0])
+    def _coords_to_latlon(self, coords):
+        if len(coords) == 0: return coords
+        lons, lats = self.to_latlon(coords[:, 0], coords[:, 1])
+        return np.round(np.column_stack((lons, lats)), 7)
 
-        if shape.geom_type in ('Point', 'LineString'):
-            return construct(map(func, shape.coords))
+    def geos_from_latlon(self, shapes):
+        """
+        批量投影。shapely.transform将所有几何的坐标展平为一个数组（保留环和部件的偏移），
+        只调用一次from_latlon，再整体重建几何对象。
+        """
+        return shapely.transform(np.asarray(shapes, dtype=object), self._coords_from_latlon)
 
-        if shape.geom_type == 'Polygon':
-            exterior = map(func, shape.exterior.coords)
-            rings = [map(func, ring.coords) for ring in shape.interiors]
-            return construct(exterior, rings)
+    def geos_to_latlon(self, shapes):
+        return shapely.transform(np.asarray(shapes, dtype=object), self._coords_to_latlon)
 
     def geo_from_latlon(self, shape):
-        return self._transform(shape, self._from_latlon_)
+        return self.geos_from_latlon([shape])[0]
 
     def geo_to_latlon(self, shape):
-        return self._transform(shape, self._to_latlon_)
+        return self.geos_to_latlon([shape])[0]
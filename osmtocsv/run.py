@@ -1,92 +1,112 @@
 from build_net import build_network
-from shapely import wkt
+from output_columns import get_node_columns, get_link_columns, get_poi_columns, get_movement_columns
+import itertools
+import argparse
+import shapely
+import time
 import csv
 import os
 
 from get_from_osm import get_osm_network
 
 
-def output_node(network, output_folder, node_filename):
-    node_filepath = os.path.join(output_folder, node_filename)
-    outfile = open(node_filepath, 'w', newline='', errors='ignore')
+# 按列构建整张表，几何用shapely.to_wkt批量转换，再分块写出
+CHUNK_SIZE = 100000
+
+
+def write_table(filepath, header, columns):
+    outfile = open(filepath, 'w', newline='', errors='ignore', buffering=1 << 22)
     writer = csv.writer(outfile)
-    writer.writerow(
-        ['name', 'node_id', 'osm_node_id', 'osm_highway', 'zone_id', 'ctrl_type', 'node_type', 'activity_type',
-         'is_boundary', 'x_coord', 'y_coord', 'intersection_id', 'poi_id'])
-
-    for _, node in network.node_dict.items():
-        x_coord = round(node.geometry.x, 7)
-        y_coord = round(node.geometry.y, 7)
-        line = [node.name, node.node_id, node.osm_node_id, node.osm_highway, node.zone_id, node.ctrl_type, '',
-                node.activity_type,
-                node.is_boundary, x_coord, y_coord, node.intersection_id, node.poi_id]
-        writer.writerow(line)
+    writer.writerow(header)
+    rows = zip(*columns)
+    while True:
+        chunk = list(itertools.islice(rows, CHUNK_SIZE))
+        if not chunk: break
+        writer.writerows(chunk)
     outfile.close()
 
+
+def output_node(network, output_folder, node_filename):
+    start_time = time.time()
+    node_filepath = os.path.join(output_folder, node_filename)
+    column_dict = get_node_columns(network)
+    del column_dict['geometry']
+    write_table(node_filepath, list(column_dict), list(column_dict.values()))
+
     # 获取文件大小（仅用于检查数据是否正常输出）
     file_size = os.path.getsize(node_filepath)
-    print(f"node文件大小：{file_size} bytes")
+    print(f"node文件大小：{file_size} bytes，耗时{time.time() - start_time:.2f} s")
 
 
 def output_link(network, output_folder, link_filename):
+    start_time = time.time()
     link_filepath = os.path.join(output_folder, link_filename)
-    outfile = open(link_filepath, 'w', newline='', errors='ignore')
-    writer = csv.writer(outfile)
-    writer.writerow(['name', 'link_id', 'osm_way_id', 'from_node_id', 'to_node_id', 'dir_flag', 'length', 'lanes',
-                     'free_speed', 'capacity', 'link_type_name', 'link_type', 'geometry', 'allowed_uses', 'from_biway',
-                     'is_link'])
-    for link_id, link in network.link_dict.items():
-        from_biway = 1 if link.from_bidirectional_way else 0
-        is_link = 1 if link.is_link else 0
-        geometry_ = wkt.dumps(link.geometry, rounding_precision=7)
-        line = [link.name, link.link_id, link.osm_way_id, link.from_node.node_id, link.to_node.node_id, link.dir_flag,
-                link.length,
-                link.lanes, link.free_speed, link.capacity, link.link_type_name, link.link_type, geometry_,
-                ';'.join(link.allowed_uses),
-                from_biway, is_link]
-        writer.writerow(line)
-    outfile.close()
+    column_dict = get_link_columns(network)
+    column_dict['geometry'] = shapely.to_wkt(column_dict['geometry'], rounding_precision=7, trim=False).tolist()
+    write_table(link_filepath, list(column_dict), list(column_dict.values()))
 
     # 获取文件大小的代码
     file_size = os.path.getsize(link_filepath)
-    print(f"link文件大小：{file_size} bytes")
+    print(f"link文件大小：{file_size} bytes，耗时{time.time() - start_time:.2f} s")
 
 
 def output_poi(network, output_folder, poi_filename):
+    start_time = time.time()
     poi_filepath = os.path.join(output_folder, poi_filename)
     if network.POI_list:
-        outfile = open(poi_filepath, 'w', newline='', errors='ignore')
-        writer = csv.writer(outfile)
-        writer.writerow(
-            ['name', 'poi_id', 'osm_way_id', 'osm_relation_id', 'building', 'amenity', 'leisure', 'way', 'geometry',
-             'centroid',
-             'area'])
-        for poi in network.POI_list:
-            geometry_ = poi.geometry
-            centroid = poi.centroid
-            area = poi.geometry_xy.area
-            line = [poi.name, poi.poi_id, poi.osm_way_id, poi.osm_relation_id, poi.building, poi.amenity, poi.leisure,
-                    poi.way, geometry_,
-                    centroid, round(area, 1)]
-            writer.writerow(line)
-
-        outfile.close()
+        column_dict = get_poi_columns(network)
+        # 与str(geometry)的输出一致
+        column_dict['geometry'] = shapely.to_wkt(column_dict['geometry'], rounding_precision=-1).tolist()
+        column_dict['centroid'] = shapely.to_wkt(column_dict['centroid'], rounding_precision=-1).tolist()
+        write_table(poi_filepath, list(column_dict), list(column_dict.values()))
+
         # 获取poi文件大小
         file_size = os.path.getsize(poi_filepath)
-        print(f"POI文件大小：{file_size} bytes")
+        print(f"POI文件大小：{file_size} bytes，耗时{time.time() - start_time:.2f} s")
+
+
+def output_movement(network, output_folder, movement_filename):
+    start_time = time.time()
+    movement_filepath = os.path.join(output_folder, movement_filename)
+    column_dict = get_movement_columns(network)
+    column_dict['geometry'] = shapely.to_wkt(column_dict['geometry'], rounding_precision=7, trim=False).tolist()
+    write_table(movement_filepath, list(column_dict), list(column_dict.values()))
+
+    file_size = os.path.getsize(movement_filepath)
+    print(f"movement文件大小：{file_size} bytes，耗时{time.time() - start_time:.2f} s")
 
 
 if __name__ == '__main__':
-    osmnetwork = get_osm_network("osm_data/Beijing.osm")
-    net = build_network(osmnetwork)
+    parser = argparse.ArgumentParser(description='将osm文件转化为node、link、poi数据集')
+    parser.add_argument('--format', choices=['csv', 'parquet', 'arrow'], default='csv',
+                        help='输出格式，parquet为GeoParquet，arrow为Arrow IPC文件')
+    parser.add_argument('--csr', action='store_true', help='同时输出CSR邻接表（output/csr目录下的.npy文件）')
+    parser.add_argument('--movement', action='store_true', help='生成交叉口转向并输出movement文件')
+    args = parser.parse_args()
+
+    osmnetwork = get_osm_network("osm_data/Beijing.osm", two_pass=True)
+    net = build_network(osmnetwork, movements=args.movement)
     print(f'生成节点：{len(net.node_dict)}个，生成路径：{len(net.link_dict)}条，生成poi：{len(net.POI_list)}个')
 
-    print('输出数据集的csv文件')
+    print(f'输出数据集的{args.format}文件')
 
     if not os.path.isdir('output'): os.mkdir('output')
-    output_node(net, 'output', 'node.csv')
-    output_link(net, 'output', 'link.csv')
-    output_poi(net, 'output', 'poi.csv')
+    if args.format == 'csv':
+        output_node(net, 'output', 'node.csv')
+        output_link(net, 'output', 'link.csv')
+        output_poi(net, 'output', 'poi.csv')
+        if args.movement:
+            output_movement(net, 'output', 'movement.csv')
+    else:
+        from output_arrow import output_node_arrow, output_link_arrow, output_poi_arrow, output_movement_arrow
+        output_node_arrow(net, 'output', f'node.{args.format}', args.format)
+        output_link_arrow(net, 'output', f'link.{args.format}', args.format)
+        output_poi_arrow(net, 'output', f'poi.{args.format}', args.format)
+        if args.movement:
+            output_movement_arrow(net, 'output', f'movement.{args.format}', args.format)
+    if args.csr:
+        from graph_csr import save_csr_graph
+        save_csr_graph(net.get_csr_graph(), os.path.join('output', 'csr'))
 
     print("数据集已输出到output文件夹中")
 
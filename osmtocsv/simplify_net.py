@@ -0,0 +1,173 @@
+# 网络简化：合并度为2的节点所连接的路段，并将相近的交叉节点归并为交叉口（填写intersection_id）
+# 在create_nodes_and_links之后、生成POI之前调用，被合并掉的OSM节点ID记录在link的other_attrs中
+import numpy as np
+import shapely
+from shapely import STRtree
+
+
+def _get_link_key(link):
+    # 属性完全相同的link才能合并
+    return (link.name, link.link_class, link.link_type_name, link.link_type, link.is_link, link.lanes,
+            link.free_speed, link.capacity, tuple(link.allowed_uses), link.from_bidirectional_way, link.dir_flag)
+
+
+def _get_node_links(node, link_dict):
+    in_list = [link for link in node.incoming_link_list if link_dict.get(link.link_id) is link]
+    out_list = [link for link in node.outgoing_link_list if link_dict.get(link.link_id) is link]
+    return in_list, out_list
+
+
+def _get_through_pairs(node, link_dict):
+    """
+    节点只连接两个相邻节点，且经过该节点的link两两属性相同时，返回{进入link的link_id: 离开的link}，否则返回None。
+    单向道路为1进1出，双向道路为2进2出。
+    """
+    in_list, out_list = _get_node_links(node, link_dict)
+    if len(in_list) != len(out_list) or len(in_list) not in (1, 2):
+        return None
+    from_node_list = [link.from_node for link in in_list]
+    to_node_list = [link.to_node for link in out_list]
+    if any(other is node for other in from_node_list + to_node_list):
+        return None
+    if len(in_list) == 1:
+        if from_node_list[0] is to_node_list[0]:
+            return None
+        pair_list = [(in_list[0], out_list[0])]
+    else:
+        if (from_node_list[0] is from_node_list[1]) or {id(other) for other in from_node_list} != \
+                {id(other) for other in to_node_list}:
+            return None
+        pair_list = [(in_link, out_link) for in_link in in_list for out_link in out_list
+                     if out_link.to_node is not in_link.from_node]
+    for in_link, out_link in pair_list:
+        if _get_link_key(in_link) != _get_link_key(out_link):
+            return None
+    return {in_link.link_id: out_link for in_link, out_link in pair_list}
+
+
+def _join_unique(values):
+    return ';'.join(dict.fromkeys(str(value) for value in values))
+
+
+def _merge_chain_geometries(chain_list):
+    # 将每条链上各link的坐标首尾相接，去掉重复的连接点后批量生成折线
+    link_list = [link for chain in chain_list for link in chain]
+    chain_no = np.repeat(np.arange(len(chain_list)), [len(chain) for chain in chain_list])
+    is_first = np.ones(len(link_list), dtype=bool)
+    is_first[1:] = chain_no[1:] != chain_no[:-1]
+    merged_list = []
+    for attr in ('geometry', 'geometry_xy'):
+        coords, index = shapely.get_coordinates(np.array([getattr(link, attr) for link in link_list], dtype=object),
+                                                return_index=True)
+        # 除每条链的第一条link外，各link的第一个坐标与上一条link的最后一个坐标重复
+        is_start = np.ones(len(index), dtype=bool)
+        is_start[1:] = index[1:] != index[:-1]
+        keep = ~is_start | is_first[index]
+        merged_list.append(shapely.linestrings(coords[keep], indices=chain_no[index[keep]]))
+    return merged_list
+
+
+def contract_degree2_nodes(network):
+    """
+    合并度为2的节点两侧的link。合并后的link沿用链上第一条link的link_id，osm_way_id为链上各way的ID（以';'连接），
+    other_attrs['merged_osm_node_id']为被合并掉的节点的osm_node_id；被合并掉的节点中有信号灯时link的ctrl_type为'signal'。
+    首尾相接、全部由度为2的节点组成的环不做合并。
+    """
+    link_dict = network.link_dict
+    pair_dict = {}
+    for node_id, node in network.node_dict.items():
+        through_pairs = _get_through_pairs(node, link_dict)
+        if through_pairs is not None:
+            pair_dict[node_id] = through_pairs
+
+    chain_list = []
+    for link in link_dict.values():
+        if link.from_node.node_id in pair_dict: continue
+        chain = [link]
+        while chain[-1].to_node.node_id in pair_dict:
+            chain.append(pair_dict[chain[-1].to_node.node_id][chain[-1].link_id])
+        if len(chain) > 1:
+            chain_list.append(chain)
+    if not chain_list:
+        return
+
+    lines, lines_xy = _merge_chain_geometries(chain_list)
+    removed_node_id_set = set()
+    for chain_no, chain in enumerate(chain_list):
+        first_link, last_link = chain[0], chain[-1]
+        via_node_list = [link.to_node for link in chain[:-1]]
+        first_link.osm_way_id = _join_unique(link.osm_way_id for link in chain)
+        first_link.other_attrs['merged_osm_node_id'] = _join_unique(node.osm_node_id for node in via_node_list)
+        if any(link.ctrl_type == 'signal' for link in chain) or \
+                any(node.ctrl_type == 'signal' for node in via_node_list):
+            first_link.ctrl_type = 'signal'
+        first_link.geometry, first_link.geometry_xy = lines[chain_no], lines_xy[chain_no]
+        first_link.turn_lanes = last_link.turn_lanes
+
+        to_node = last_link.to_node
+        to_node.incoming_link_list = [first_link if link is last_link else link for link in to_node.incoming_link_list]
+        first_link.to_node = to_node
+        for link in chain[1:]:
+            del link_dict[link.link_id]
+        for node in via_node_list:
+            removed_node_id_set.add(node.node_id)
+
+    for node_id in removed_node_id_set:
+        del network.node_dict[node_id]
+    if 'merged_osm_node_id' not in network.link_other_attrs:
+        network.link_other_attrs.append('merged_osm_node_id')
+
+
+def _get_cluster_labels(number_of_points, pair_i, pair_j):
+    # 沿点对传播最小标签并做指针跳跃，得到每个点所在连通分量中最小的点序号
+    labels = np.arange(number_of_points)
+    while True:
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, pair_i, labels[pair_j])
+        np.minimum.at(new_labels, pair_j, labels[pair_i])
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            return labels
+        labels = new_labels
+
+
+def consolidate_intersections(network, tolerance=20.0):
+    """
+    将相距不超过tolerance米的交叉节点（连接三个及以上相邻节点）归为同一交叉口，填写intersection_id，
+    如双幅道路相交形成的多个节点共用一个intersection_id。返回交叉口数量。
+    """
+    link_dict = network.link_dict
+    node_list = []
+    for node in network.node_dict.values():
+        in_list, out_list = _get_node_links(node, link_dict)
+        neighbor_id_set = {link.from_node.node_id for link in in_list} | {link.to_node.node_id for link in out_list}
+        neighbor_id_set.discard(node.node_id)
+        if len(neighbor_id_set) >= 3:
+            node_list.append(node)
+    if not node_list:
+        return 0
+
+    points = np.array([node.geometry_xy for node in node_list], dtype=object)
+    pair_i, pair_j = STRtree(points).query(points, predicate='dwithin', distance=tolerance)
+    labels = _get_cluster_labels(len(node_list), pair_i, pair_j)
+    _, cluster_no = np.unique(labels, return_inverse=True)
+    for node, intersection_no in zip(node_list, cluster_no.tolist()):
+        node.intersection_id = network.max_intersection_id + intersection_no
+    number_of_intersections = int(cluster_no.max()) + 1
+    network.max_intersection_id += number_of_intersections
+    return number_of_intersections
+
+
+def simplify_network(network, intersection_tolerance=20.0):
+    """
+    合并度为2的节点并归并交叉口，输出节点和link数量的变化。简化后的网络不能再用osm_change增量更新。
+    """
+    print('简化网络')
+    number_of_nodes, number_of_links = len(network.node_dict), len(network.link_dict)
+    contract_degree2_nodes(network)
+    print(f'合并度为2的节点：节点{number_of_nodes}个 -> {len(network.node_dict)}个，'
+          f'路径{number_of_links}条 -> {len(network.link_dict)}条')
+    number_of_intersections = consolidate_intersections(network, intersection_tolerance)
+    number_of_crossings = sum(1 for node in network.node_dict.values() if node.intersection_id is not None)
+    print(f'归并交叉口：交叉节点{number_of_crossings}个 -> 交叉口{number_of_intersections}个')
+    network.is_simplified = True